@@ -1,10 +1,17 @@
 """
 Benchmark / load testing module.
 Replays recorded QA pairs against target service with configurable concurrency.
+
+A benchmark runs in the worker that started it. With AICP_WORKERS > 1 that
+worker writes its progress (``.progress.json``) and live window into the
+task directory once per sync interval, so any worker can answer the
+progress and live metrics requests.
 """
 
 import asyncio
+import itertools
 import json
+import os
 import time
 import uuid
 from datetime import datetime, timezone
@@ -21,11 +28,18 @@ from ..config import settings
 from ..models.database import get_db
 from ..models.schemas import Task
 from ..collect.data_writer import PerformanceDataWriter
+from ..collect.qa_capture import canonical_qa_mode, iter_qa_records
+from ..collect.shards import shard_id
+from ..metrics.live import live_metrics
+from ..utils.segments import compression_ext
+from ..utils.sse import SSEFramer
+from ..utils.stream_metrics import StreamMetrics
 
 router = APIRouter(prefix="/api/benchmark", tags=["benchmark"])
 
-# In-memory tracking of running benchmarks
+# In-memory tracking of the benchmarks run by this worker
 _running: dict = {}
+PROGRESS_FILE = ".progress.json"
 
 
 class BenchmarkStartRequest(BaseModel):
@@ -54,19 +68,26 @@ async def start_benchmark(req: BenchmarkStartRequest, db: Session = Depends(get_
     if not source or not source.data_dir:
         raise HTTPException(status_code=404, detail="Source task not found")
 
+    source_qa_mode = json.loads(source.config or "{}").get("qa_mode", "full")
+    if canonical_qa_mode(source_qa_mode) not in ("full", "jsonl"):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Source task captured QA in '{source_qa_mode}' mode; full content is required for replay",
+        )
+
+    # QA rows are read lazily while the benchmark runs
     source_dir = Path(source.data_dir)
-    qa_json = source_dir / "qa_pairs.json"
-    if not qa_json.exists():
-        # Try reading CSV
-        qa_csvs = sorted(source_dir.glob("qa_pairs_*.csv"))
-        if not qa_csvs:
-            raise HTTPException(status_code=404, detail="No QA data in source task")
-        dfs = [pd.read_csv(f) for f in qa_csvs]
-        qa_df = pd.concat(dfs, ignore_index=True)
-        qa_records = qa_df.to_dict("records")
-    else:
-        with open(qa_json, "r", encoding="utf-8") as f:
-            qa_records = json.load(f)
+    qa_records = iter_qa_records(source_dir)
+    first = next(qa_records, None)
+    if first is None:
+        raise HTTPException(status_code=404, detail="No QA data in source task")
+    qa_records = itertools.chain([first], qa_records)
+    total = source.record_count or sum(1 for _ in iter_qa_records(source_dir))
+
+    try:
+        compression_ext()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     # Create benchmark task
     counter = db.query(Task).filter(Task.type == "benchmark").count() + 1
@@ -95,19 +116,55 @@ async def start_benchmark(req: BenchmarkStartRequest, db: Session = Depends(get_
     db.commit()
 
     # Start benchmark in background
-    progress = {"total": len(qa_records), "completed": 0, "status": "running", "start_time": time.time()}
+    progress = {
+        "total": total, "completed": 0, "inflight": 0, "status": "running",
+        "start_time": time.time(),
+    }
     _running[task_id] = progress
 
     asyncio.create_task(
         _run_benchmark(task_id, qa_records, req, data_dir, progress)
     )
 
-    return {"task_id": task_id, "data_dir": str(data_dir), "total": len(qa_records)}
+    return {"task_id": task_id, "data_dir": str(data_dir), "total": total}
+
+
+def _save_progress(data_dir: Path, progress: dict):
+    """Atomically replace the benchmark's progress file (for the other workers)."""
+    path = data_dir / PROGRESS_FILE
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(progress, f)
+    os.replace(tmp, path)
+
+
+async def _share_progress(task_id: str, data_dir: Path, progress: dict, shard: str):
+    """AICP_WORKERS > 1: publish progress and the live window every sync interval."""
+    try:
+        while True:
+            _save_progress(data_dir, progress)
+            live_metrics.save(task_id, data_dir, shard)
+            await asyncio.sleep(settings.WORKER_SYNC_INTERVAL)
+    except asyncio.CancelledError:
+        pass
 
 
 async def _run_benchmark(task_id, qa_records, req, data_dir, progress):
     writer = PerformanceDataWriter(task_id, data_dir)
     writer.start_periodic_flush()
+    live = live_metrics.start(task_id, lambda: progress["inflight"])
+    shard = shard_id() if settings.WORKERS > 1 else None
+    sharing = asyncio.create_task(_share_progress(task_id, data_dir, progress, shard)) if shard else None
+
+    async def send(session, target_url, rec):
+        progress["inflight"] += 1
+        try:
+            stat = await _send_one(session, target_url, rec, req.timeout_s)
+        finally:
+            progress["inflight"] -= 1
+        live.observe(stat)
+        await writer.add_record(stat)
+        progress["completed"] += 1
 
     timeout = aiohttp.ClientTimeout(total=req.timeout_s)
     async with aiohttp.ClientSession(timeout=timeout) as session:
@@ -116,25 +173,23 @@ async def _run_benchmark(task_id, qa_records, req, data_dir, progress):
 
         if req.replay_mode == "sequential":
             for rec in qa_records:
-                stat = await _send_one(session, target_url, rec, req.timeout_s)
-                await writer.add_record(stat)
-                progress["completed"] += 1
+                await send(session, target_url, rec)
                 await asyncio.sleep(delay)
         else:
-            # Concurrent mode
-            sem = asyncio.Semaphore(req.concurrency)
+            # Concurrent mode: the workers pull from the same record iterator
+            async def worker():
+                for rec in qa_records:
+                    await send(session, target_url, rec)
 
-            async def bounded(rec):
-                async with sem:
-                    stat = await _send_one(session, target_url, rec, req.timeout_s)
-                    await writer.add_record(stat)
-                    progress["completed"] += 1
-
-            tasks = [bounded(rec) for rec in qa_records]
-            await asyncio.gather(*tasks, return_exceptions=True)
+            await asyncio.gather(*(worker() for _ in range(max(req.concurrency, 1))), return_exceptions=True)
 
+    if sharing:
+        sharing.cancel()
+    live_metrics.stop(task_id, data_dir, shard)
     await writer.finalize()
     progress["status"] = "completed"
+    if shard:
+        _save_progress(data_dir, progress)
 
     # Update DB
     from ..models.database import SessionLocal
@@ -172,47 +227,21 @@ async def _send_one(session: aiohttp.ClientSession, url: str, qa_record: dict, t
         "stream_options": {"include_usage": True},
     }
 
-    first_token_time = None
-    chunk_count = 0
-    usage_data = {}
-    response_parts = []
-    model = payload["model"]
+    metrics = StreamMetrics(payload["model"], start=arrival_time)
 
     try:
         async with session.post(url, json=payload) as resp:
-            buffer = b""
+            framer = SSEFramer()
             async for raw in resp.content.iter_any():
-                buffer += raw
-                while b"\n\n" in buffer:
-                    idx = buffer.find(b"\n\n") + 2
-                    msg = buffer[:idx]
-                    buffer = buffer[idx:]
-                    for line in msg.decode("utf-8", errors="replace").strip().split("\n"):
-                        if not line.startswith("data: "):
-                            continue
-                        data_str = line[6:].strip()
-                        if data_str in ("[DONE]", ""):
-                            continue
-                        try:
-                            data = json.loads(data_str)
-                            if data.get("usage"):
-                                usage_data = data["usage"]
-                            model = data.get("model", model)
-                            choices = data.get("choices", [])
-                            if choices:
-                                delta = choices[0].get("delta", {})
-                                content = delta.get("content")
-                                if content:
-                                    response_parts.append(content)
-                                    if first_token_time is None:
-                                        first_token_time = time.time()
-                            chunk_count += 1
-                        except json.JSONDecodeError:
-                            pass
+                for msg in framer.feed(raw):
+                    metrics.feed(msg)
     except Exception as e:
         pass
 
     completion_time = time.time()
+    first_token_time = metrics.first_token_time
+    usage_data = metrics.usage
+    chunk_count = metrics.chunk_count
     ttft = (first_token_time - arrival_time) * 1000 if first_token_time else 0
     e2e = (completion_time - arrival_time) * 1000
     decode_time = (completion_time - first_token_time) if first_token_time else 0
@@ -228,8 +257,9 @@ async def _send_one(session: aiohttp.ClientSession, url: str, qa_record: dict, t
 
     return {
         "request_id": request_id,
-        "model": model,
+        "model": metrics.model,
         "arrival_time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(arrival_time)),
+        "arrival_ts": round(arrival_time, 6),
         "completion_time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(completion_time)),
         "prompt_tokens": prompt_tokens,
         "forward_cal_tokens": 0,
@@ -241,24 +271,35 @@ async def _send_one(session: aiohttp.ClientSession, url: str, qa_record: dict, t
         "tps": round(tps, 2),
         "e2e_latency_ms": round(e2e, 2),
         "chunk_count": chunk_count,
+        "upstream": url.split("/")[2],
+        "token_offsets": metrics.token_offsets,
         "messages": messages,
-        "response_content": "".join(response_parts),
+        "response_content": metrics.response_content,
     }
 
 
 @router.get("/{task_id}/progress")
-async def get_progress(task_id: str):
-    if task_id in _running:
-        p = _running[task_id]
-        elapsed = time.time() - p["start_time"]
-        return BenchmarkProgress(
-            task_id=task_id,
-            total=p["total"],
-            completed=p["completed"],
-            status=p["status"],
-            elapsed_s=round(elapsed, 1),
-        )
-    return BenchmarkProgress(task_id=task_id, total=0, completed=0, status="not_found")
+async def get_progress(task_id: str, db: Session = Depends(get_db)):
+    p = _running.get(task_id)
+    if p is None:
+        # Run by another worker: its last published progress
+        task = db.query(Task).filter(Task.id == task_id, Task.type == "benchmark").first()
+        if not task or not task.data_dir:
+            return BenchmarkProgress(task_id=task_id, total=0, completed=0, status="not_found")
+        try:
+            with open(Path(task.data_dir) / PROGRESS_FILE, "r", encoding="utf-8") as f:
+                p = json.load(f)
+        except (OSError, ValueError):
+            count = task.record_count or 0
+            return BenchmarkProgress(task_id=task_id, total=count, completed=count, status=task.status)
+    elapsed = time.time() - p["start_time"]
+    return BenchmarkProgress(
+        task_id=task_id,
+        total=p["total"],
+        completed=p["completed"],
+        status=p["status"],
+        elapsed_s=round(elapsed, 1),
+    )
 
 
 @router.post("/upload-dataset")
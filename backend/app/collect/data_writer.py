@@ -1,19 +1,55 @@
 """
 Performance data file writer with automatic rotation.
-Writes CSV (performance metrics) + CSV (QA pairs) + JSON (summary).
+Segments rotate after MAX_RECORDS_PER_FILE records or, with MAX_FILE_BYTES, once
+the performance or QA segment holds that much (uncompressed) CSV; with DATA_COMPRESSION they are written as gzip or
+zstd segments (see utils/segments.py).
+Writes CSV (performance metrics) + CSV (QA pairs) + JSON (summary), and after
+finalize compacts the performance CSVs into a columnar store (see perf_store.py)
+and persists their row index and sort permutations (see perf_index.py).
+Summary statistics come from a quantile sketch updated for every record and
+saved at each periodic flush (see utils/sketch.py).
+QA pairs are also appended to a gzip JSONL file at each flush (the only QA
+output in ``jsonl`` mode), so finalize never has to re-read them, and added to
+the task's full-text search index (see qa_index.py).
+Records are journaled as they arrive and every flush ends with a checkpoint, so
+a task interrupted by a crash can be recovered on startup (see journal.py).
+With several uvicorn workers each one writes its own shard files (see shards.py).
+
+All file I/O runs on a dedicated writer thread. ``add_record`` only appends the
+record to the front buffer, as received; a full buffer is swapped out and its
+CSV/QA rows are built and written in the background while new records
+accumulate, so flushes never block the proxy's event loop. Buffered records
+keep their QA text until written, in every QA mode: a flush starts at
+FLUSH_BATCH records or FLUSH_QA_BYTES characters of QA text, whichever comes
+first, so the buffer holds about that much text (twice that while a flush is
+in flight).
 """
 
 import asyncio
 import csv
+import gzip
+import io
 import json
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, List
+from typing import Callable, Dict, List, Optional, Set, Tuple
 
-import pandas as pd
 from loguru import logger
 
 from ..config import settings
+from ..utils.itl import ITL_FILE, append_itl_records, itl_summary
+from ..utils.perf_index import write_index
+from ..utils.perf_store import write_columns
+from ..utils.segments import (
+    PERF_PREFIX, QA_PREFIX, append_segment, compression_ext, read_segment, read_segments, segment_files,
+    segment_path,
+)
+from ..utils.sketch import SKETCH_FILE, SummarySketch
+from .journal import WriteAheadJournal, journal_files, read_journal
+from .qa_capture import QA_MODES, QA_STREAM_FILE, canonical_qa_mode, messages_text, qa_chars
+from .qa_index import SEARCHABLE_MODES, QAIndex, qa_index_path
 
 
 class PerformanceDataWriter:
@@ -23,24 +59,56 @@ class PerformanceDataWriter:
         "序号", "request_id", "model", "arrival_time", "completion_time",
         "prompt_tokens", "forward_cal_tokens", "cached_tokens",
         "completion_tokens", "total_tokens", "ttft_ms", "tpot_ms",
-        "tps", "e2e_latency_ms", "chunk_count",
+        "tps", "e2e_latency_ms", "chunk_count", "upstream", "queue_wait_ms",
+        "itl_p50_ms", "itl_p99_ms", "itl_max_ms", "stall_count", "aborted",
+        "cache_hit", "hedged", "attempt", "arrival_ts",
     ]
 
-    QA_HEADERS = ["序号", "request_id", "model", "messages", "response_content"]
+    QA_HEADERS = [
+        "序号", "request_id", "model", "messages", "response_content",
+        "messages_chars", "response_chars",
+    ]
 
-    def __init__(self, task_id: str, data_dir: Path):
+    def __init__(
+        self, task_id: str, data_dir: Path, qa_mode: str = "full", shard: Optional[str] = None,
+    ):
+        qa_mode = canonical_qa_mode(qa_mode)
+        if qa_mode not in QA_MODES:
+            raise ValueError(f"qa_mode must be one of {QA_MODES}")
         self.task_id = task_id
         self.data_dir = data_dir
         self.data_dir.mkdir(parents=True, exist_ok=True)
+        self.qa_mode = qa_mode
+        self.shard = shard
+        self._suffix = f"_{shard}" if shard else ""
+        self._ext = compression_ext()
+        self._qa_stream_path = self.data_dir / QA_STREAM_FILE.replace(".", f"{self._suffix}.", 1)
+        self._itl_path = self.data_dir / ITL_FILE.replace(".", f"{self._suffix}.", 1)
+        self._seq = 0  # records added
 
         self._file_index = 0
         self._file_record_count = 0
+        self._file_bytes = [0, 0]  # perf, QA
         self._total_record_count = 0
         self._max_per_file = settings.MAX_RECORDS_PER_FILE
 
+        self.sampling: Optional[dict] = None  # set by the task manager before finalize
+        # Resumes the merged sketch when finalizing a sharded task
+        self._sketch_path = self.data_dir / SKETCH_FILE.replace(".", f"{self._suffix}.", 1)
+        self.sketch = SummarySketch.load(self._sketch_path) or SummarySketch()
+
         self._buffer: List[Dict] = []
-        self._lock = asyncio.Lock()
+        self._buffer_chars = 0  # QA text held by the buffer
+        self._lock = asyncio.Lock()  # one batch in flight at a time
         self._flush_task: asyncio.Task = None
+        self._bg_flush: Optional[asyncio.Task] = None
+        self.on_flush: Optional[Callable[[], None]] = None  # called on the loop after each flushed batch
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"writer-{task_id}")
+        self._touched: Set[Path] = set()  # written since the last checkpoint (writer thread)
+        self.journal = WriteAheadJournal(task_id, data_dir, shard) if settings.JOURNAL else None
+        self.qa_index: Optional[QAIndex] = None
+        if settings.QA_SEARCH_INDEX and qa_mode in SEARCHABLE_MODES:
+            self.qa_index = QAIndex(qa_index_path(data_dir, shard))
 
     @property
     def total_records(self) -> int:
@@ -51,15 +119,21 @@ class PerformanceDataWriter:
     # ------------------------------------------------------------------
 
     async def add_record(self, stat: dict):
-        async with self._lock:
-            self._buffer.append(stat)
-            if len(self._buffer) >= settings.FLUSH_BATCH:
-                await self._flush()
+        """Buffer a record; a full buffer is written in the background."""
+        self._seq += 1
+        if self.journal:
+            self.journal.append(self._seq, stat)
+        self._buffer.append(stat)
+        if self.qa_mode != "metrics":
+            self._buffer_chars += qa_chars(stat)
+        if self._buffer_full() and not self._lock.locked():
+            self._bg_flush = asyncio.create_task(self._background_flush())
 
     def start_periodic_flush(self):
         self._flush_task = asyncio.create_task(self._periodic_flush())
 
-    async def finalize(self):
+    async def finalize(self, summary: bool = True):
+        """Flush everything; shards skip the summary, which is built after merging."""
         if self._flush_task:
             self._flush_task.cancel()
             try:
@@ -67,48 +141,150 @@ class PerformanceDataWriter:
             except asyncio.CancelledError:
                 pass
 
-        async with self._lock:
-            await self._flush()
+        await self._flush()
+        await self._io(self.sketch.save, self._sketch_path)
+        if self.journal:
+            await self.journal.close()
+
+        if self.qa_index:
+            await self._io(self._index_skipped)
+            await self._io(self.qa_index.close, summary)
 
-        await self._generate_summary()
+        if summary:
+            await self._io(self._generate_summary)
+            # Readers parse the CSVs until the store is in place
+            self._executor.submit(self._compact)
+        self._executor.shutdown(wait=False)
 
     # ------------------------------------------------------------------
     # Internal
     # ------------------------------------------------------------------
 
+    async def _io(self, fn, *args):
+        """Run blocking file work on the writer thread (in submission order)."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _buffer_full(self) -> bool:
+        return len(self._buffer) >= settings.FLUSH_BATCH or (
+            settings.FLUSH_QA_BYTES > 0 and self._buffer_chars >= settings.FLUSH_QA_BYTES
+        )
+
+    @staticmethod
+    def _qa_row(seq: int, stat: dict) -> dict:
+        """Writer thread: the QA row of a record."""
+        messages = messages_text(stat.get("messages", []))
+        response = stat.get("response_content", "")
+        messages_chars = stat.get("messages_chars")
+        return {
+            "序号": seq,
+            "request_id": stat["request_id"],
+            "model": stat["model"],
+            "messages": messages,
+            "response_content": response,
+            "messages_chars": messages_chars if messages_chars is not None else len(messages),
+            "response_chars": stat.get("response_chars", len(response)),
+        }
+
+    def _write_qa_stream(self, rows: List[dict]):
+        # One gzip member per batch, so the file can be cut back to any checkpoint
+        data = b"".join(json.dumps(row, ensure_ascii=False).encode("utf-8") + b"\n" for row in rows)
+        with open(self._qa_stream_path, "ab") as f:
+            f.write(gzip.compress(data, compresslevel=6))
+
+    def _sync(self):
+        """Periodic: save the sketch for live summaries."""
+        if self.sketch.total:
+            self.sketch.save(self._sketch_path)
+
+    async def _background_flush(self):
+        try:
+            await self._flush()
+        except Exception as e:
+            logger.error(f"[{self.task_id}] Flush failed: {e}")
+
     async def _periodic_flush(self):
         try:
             while True:
                 await asyncio.sleep(settings.FLUSH_INTERVAL)
-                async with self._lock:
+                try:
                     await self._flush()
+                    await self._io(self._sync)
+                except Exception as e:
+                    logger.error(f"[{self.task_id}] Flush failed: {e}")
         except asyncio.CancelledError:
             pass
 
     async def _flush(self):
-        if not self._buffer:
-            return
-
-        # Check rotation
-        if self._file_record_count >= self._max_per_file:
-            self._file_index += 1
-            self._file_record_count = 0
-
-        perf_path = self.data_dir / f"performance_data_{self._file_index}.csv"
-        qa_path = self.data_dir / f"qa_pairs_{self._file_index}.csv"
+        """Swap the buffer out and write it on the writer thread; repeat while full."""
+        async with self._lock:
+            while self._buffer:
+                batch, self._buffer, self._buffer_chars = self._buffer, [], 0
+                await self._write_rotating(batch)
+                if self.journal:
+                    self.journal.checkpoint(await self._io(self._durable_state))
+                logger.debug(
+                    f"[{self.task_id}] Flushed {len(batch)} records (total: {self._total_record_count})"
+                )
+                if self.on_flush:
+                    self.on_flush()
+                if not self._buffer_full():
+                    break
+
+    async def _write_rotating(self, batch: List[dict]):
+        """Write a batch, moving to the next segment at the record or byte limit."""
+        start = 0
+        while True:
+            end = len(batch)
+            if self._max_per_file > 0:
+                end = min(end, start + self._max_per_file - self._file_record_count)
+            chunk = batch[start:end]
+            sizes = await self._io(
+                self._write_batch, chunk, self._file_index, self._total_record_count + 1
+            )
+            self._total_record_count += len(chunk)
+            self._file_record_count += len(chunk)
+            self._file_bytes = [a + b for a, b in zip(self._file_bytes, sizes)]
+            # Byte limit is checked after each write: a segment may exceed it by one batch
+            if (
+                (self._max_per_file > 0 and self._file_record_count >= self._max_per_file)
+                or (settings.MAX_FILE_BYTES > 0 and max(self._file_bytes) >= settings.MAX_FILE_BYTES)
+            ):
+                self._file_index += 1
+                self._file_record_count = 0
+                self._file_bytes = [0, 0]
+            start = end
+            if start >= len(batch):
+                return
+
+    def _write_batch(
+        self, batch: List[dict], file_index: int, first_seq: int,
+    ) -> Tuple[int, int]:
+        """Writer thread: append one batch to the segments and sidecars; returns the bytes added."""
+        perf_size = qa_size = 0
+        if not batch:
+            return perf_size, qa_size
+        qa_rows = []
+        if self.qa_mode != "metrics":
+            qa_rows = [self._qa_row(seq, stat) for seq, stat in enumerate(batch, first_seq)]
+            self._write_qa_stream(qa_rows)
+            self._touched.add(self._qa_stream_path)
+
+        perf_path = segment_path(self.data_dir, PERF_PREFIX + self._suffix, file_index, self._ext)
+        qa_path = segment_path(self.data_dir, QA_PREFIX + self._suffix, file_index, self._ext)
 
         perf_exists = perf_path.exists()
         qa_exists = qa_path.exists()
+        self._touched.update((perf_path, qa_path, self._itl_path))
 
         # Write performance CSV
-        with open(perf_path, "a", newline="", encoding="utf-8-sig") as f:
+        perf_rows = []
+        with io.StringIO(newline="") as f:
             writer = csv.DictWriter(f, fieldnames=self.PERF_HEADERS)
             if not perf_exists:
                 writer.writeheader()
-            for stat in self._buffer:
-                self._total_record_count += 1
+            for seq, stat in enumerate(batch, first_seq):
                 row = {
-                    "序号": self._total_record_count,
+                    "序号": seq,
                     "request_id": stat["request_id"],
                     "model": stat["model"],
                     "arrival_time": stat["arrival_time"],
@@ -123,80 +299,177 @@ class PerformanceDataWriter:
                     "tps": stat["tps"],
                     "e2e_latency_ms": stat["e2e_latency_ms"],
                     "chunk_count": stat["chunk_count"],
+                    "upstream": stat.get("upstream", ""),
+                    "queue_wait_ms": stat.get("queue_wait_ms", 0),
+                    "aborted": stat.get("aborted", 0),
+                    "cache_hit": stat.get("cache_hit", 0),
+                    "hedged": stat.get("hedged", 0),
+                    "attempt": stat.get("attempt", 1),
+                    "arrival_ts": stat.get("arrival_ts", ""),
                 }
+                row.update(itl_summary(stat.get("token_offsets", ())))
                 writer.writerow(row)
+                self.sketch.add(row)
+                perf_rows.append(row)
+            perf_size = append_segment(perf_path, f.getvalue(), new=not perf_exists)
 
         # Write QA pairs CSV
-        with open(qa_path, "a", newline="", encoding="utf-8-sig") as f:
-            writer = csv.DictWriter(f, fieldnames=self.QA_HEADERS)
-            if not qa_exists:
-                writer.writeheader()
-            seq = self._total_record_count - len(self._buffer) + 1
-            for stat in self._buffer:
-                writer.writerow({
-                    "序号": seq,
-                    "request_id": stat["request_id"],
-                    "model": stat["model"],
-                    "messages": json.dumps(stat.get("messages", []), ensure_ascii=False),
-                    "response_content": stat.get("response_content", ""),
-                })
-                seq += 1
-
-        self._file_record_count += len(self._buffer)
-        logger.debug(f"[{self.task_id}] Flushed {len(self._buffer)} records (total: {self._total_record_count})")
-        self._buffer.clear()
-
-    async def _generate_summary(self):
-        """Read all CSV files and generate performance_summary.json."""
-        all_csvs = sorted(self.data_dir.glob("performance_data_*.csv"))
-        if not all_csvs:
-            return
+        if self.qa_mode in ("full", "truncate", "hash"):
+            with io.StringIO(newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=self.QA_HEADERS)
+                if not qa_exists:
+                    writer.writeheader()
+                writer.writerows(qa_rows)
+                qa_size = append_segment(qa_path, f.getvalue(), new=not qa_exists)
+
+        if self.qa_index:
+            self.qa_index.add(perf_rows, qa_rows)
+
+        append_itl_records(
+            self._itl_path,
+            ((stat["request_id"], stat.get("token_offsets", ())) for stat in batch),
+        )
+        return perf_size, qa_size
+
+    def _appended_files(self) -> List[Path]:
+        """Files the next flush may append to."""
+        return [
+            segment_path(self.data_dir, PERF_PREFIX + self._suffix, self._file_index, self._ext),
+            segment_path(self.data_dir, QA_PREFIX + self._suffix, self._file_index, self._ext),
+            self._qa_stream_path,
+            self._itl_path,
+        ]
+
+    def _durable_state(self) -> dict:
+        """Writer thread: fsync what was written since the last checkpoint and describe it."""
+        for path in self._touched:
+            if path.exists():
+                with open(path, "rb") as f:
+                    os.fsync(f.fileno())
+        self._touched.clear()
+        return {
+            "records": self._total_record_count,
+            "file_index": self._file_index,
+            "file_record_count": self._file_record_count,
+            "file_bytes": self._file_bytes,
+            "sizes": {p.name: p.stat().st_size if p.exists() else 0 for p in self._appended_files()},
+        }
 
-        dfs = [pd.read_csv(f) for f in all_csvs]
-        df = pd.concat(dfs, ignore_index=True)
-
-        def stats(series):
-            return {
-                "avg": round(float(series.mean()), 2),
-                "p50": round(float(series.quantile(0.5)), 2),
-                "p90": round(float(series.quantile(0.9)), 2),
-                "p99": round(float(series.quantile(0.99)), 2),
-                "min": round(float(series.min()), 2),
-                "max": round(float(series.max()), 2),
+    @classmethod
+    async def recover(
+        cls, task_id: str, data_dir: Path, qa_mode: str = "full", shard: Optional[str] = None,
+    ) -> "PerformanceDataWriter":
+        """
+        Writer of an interrupted task: files cut back to the last journal
+        checkpoint and the journaled records after it added again. The caller
+        finalizes it.
+        """
+        writer = cls(task_id, data_dir, qa_mode=qa_mode, shard=shard)
+        records = await writer._io(writer._restore)
+        for stat in records:
+            await writer.add_record(stat)
+        logger.info(f"[{task_id}] Recovered {writer.total_records} records, replaying {len(records)}")
+        return writer
+
+    def _restore(self) -> List[dict]:
+        """Writer thread: undo writes after the last checkpoint and restore the counters."""
+        perf_prefix = PERF_PREFIX + self._suffix
+        prefixes = (perf_prefix, QA_PREFIX + self._suffix)
+        records = []
+        if journal_files(self.data_dir, self.shard):
+            checkpoint, records = read_journal(self.data_dir, self.shard)
+            checkpoint = checkpoint or {
+                "records": 0, "file_index": 0, "file_record_count": 0, "file_bytes": [0, 0], "sizes": {},
             }
+            for prefix in prefixes:
+                for path in segment_files(self.data_dir, prefix):
+                    if int(path.name[len(prefix) + 1:].split(".")[0]) > checkpoint["file_index"]:
+                        path.unlink()
+            self._file_index = checkpoint["file_index"]
+            self._file_record_count = checkpoint["file_record_count"]
+            self._file_bytes = list(checkpoint["file_bytes"])
+            for path in self._appended_files():
+                size = checkpoint["sizes"].get(path.name, 0)
+                if size and path.exists():
+                    os.truncate(path, size)
+                else:
+                    path.unlink(missing_ok=True)
+        else:
+            # Older task without a journal: keep what reached the files
+            self._file_index = len(segment_files(self.data_dir, perf_prefix))
+
+        indexed = self.qa_index.indexed_seqs() if self.qa_index else None
+        unindexed = []  # flushed rows the search index had not reached or had skipped
+        self.sketch = SummarySketch()
+        for path in segment_files(self.data_dir, perf_prefix):
+            for row in read_segment(path).to_dict("records"):
+                self.sketch.add(row)
+                if indexed is not None and row["序号"] not in indexed:
+                    unindexed.append(row)
+        self._total_record_count = self._seq = self.sketch.total
+        if self.qa_index:
+            self.qa_index.truncate(self._total_record_count)
+            self._backfill_qa_index(unindexed)
+        return records
+
+    def _index_skipped(self):
+        """Writer thread, finalize: index the batches the search index skipped under backlog."""
+        skipped = self.qa_index.take_skipped()
+        if not skipped:
+            return
+        perf_rows = [
+            row
+            for path in segment_files(self.data_dir, PERF_PREFIX + self._suffix)
+            for row in read_segment(path).to_dict("records")
+            if any(first <= row["序号"] <= last for first, last in skipped)
+        ]
+        logger.info(f"[{self.task_id}] Indexing {len(perf_rows)} records skipped by the search index")
+        self._backfill_qa_index(perf_rows)
+
+    def _backfill_qa_index(self, perf_rows: List[dict]):
+        """Writer thread, recovery and finalize: index flushed records from the QA stream."""
+        if not perf_rows or not self._qa_stream_path.exists():
+            return
+        seqs = {row["序号"] for row in perf_rows}
+        qa_rows = []
+        with gzip.open(self._qa_stream_path, "rb") as f:
+            for line in f:
+                rec = json.loads(line)
+                if rec["序号"] in seqs:
+                    qa_rows.append(rec)
+        self.qa_index.add(perf_rows, qa_rows)
+
+    def _generate_summary(self):
+        """Write performance_summary.json from the sketch (writer thread)."""
+        if not segment_files(self.data_dir, PERF_PREFIX):
+            return
 
-        summary = {
-            "task_id": self.task_id,
-            "total_requests": len(df),
-            "time_range": {
-                "start": str(df["arrival_time"].iloc[0]) if len(df) > 0 else "",
-                "end": str(df["completion_time"].iloc[-1]) if len(df) > 0 else "",
-            },
-            "summary": {
-                "ttft_ms": stats(df["ttft_ms"]),
-                "tpot_ms": stats(df["tpot_ms"]),
-                "tps": stats(df["tps"]),
-                "e2e_latency_ms": stats(df["e2e_latency_ms"]),
-                "prompt_tokens": stats(df["prompt_tokens"]),
-                "completion_tokens": stats(df["completion_tokens"]),
-                "cached_tokens": {
-                    "avg": round(float(df["cached_tokens"].mean()), 2),
-                    "total": int(df["cached_tokens"].sum()),
-                },
-            },
-        }
+        # Aborted requests and cache hits are kept out of the latency statistics
+        summary = {"task_id": self.task_id, **self.sketch.summary()}
+        summary["qa_mode"] = self.qa_mode
+        if self.sampling:
+            summary["sampling"] = self.sampling
+        if self.journal and self.journal.stats["records"]:
+            summary["journal"] = self.journal.stats
 
         path = self.data_dir / "performance_summary.json"
         with open(path, "w", encoding="utf-8") as f:
             json.dump(summary, f, indent=2, ensure_ascii=False)
         logger.info(f"[{self.task_id}] Summary saved to {path}")
 
-        # Also save QA pairs as JSON
-        qa_csvs = sorted(self.data_dir.glob("qa_pairs_*.csv"))
-        if qa_csvs:
-            qa_dfs = [pd.read_csv(f) for f in qa_csvs]
-            qa_df = pd.concat(qa_dfs, ignore_index=True)
-            qa_json_path = self.data_dir / "qa_pairs.json"
-            qa_records = qa_df.to_dict("records")
-            with open(qa_json_path, "w", encoding="utf-8") as f:
-                json.dump(qa_records, f, indent=2, ensure_ascii=False)
+    def _compact(self):
+        """
+        Writer thread, after finalize: compact the performance CSVs into columns
+        and persist their row index with the sort permutations.
+        """
+        all_csvs = segment_files(self.data_dir, PERF_PREFIX)
+        try:
+            df = read_segments(self.data_dir, PERF_PREFIX)
+            write_columns(self.data_dir, df, all_csvs)
+        except Exception as e:
+            logger.warning(f"[{self.task_id}] Columnar store not written: {e}")
+            return
+        try:
+            write_index(self.data_dir, df, all_csvs)
+        except Exception as e:
+            logger.warning(f"[{self.task_id}] Row index not written: {e}")
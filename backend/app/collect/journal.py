@@ -0,0 +1,237 @@
+"""
+Write-ahead journal of a task writer (crash recovery).
+
+Every record handed to the writer is appended to ``journal{shard}.<gen>.jsonl``
+before it is buffered. Appends are group-committed: they collect in memory and
+one background write + fsync persists them all, JOURNAL_COMMIT_MS after the
+first pending append or as soon as about JOURNAL_COMMIT_BYTES are pending. A
+crash loses at most that window instead of the writer's whole buffer. Records
+are serialized on the journal thread, so they must not be modified once
+appended.
+
+After each flush the writer fsyncs its files and adds a checkpoint line with
+their sizes and its counters. The journal then starts a new generation with the
+checkpoint as its first line and deletes the generations whose records are all
+covered, so it only ever holds the records of the last flush or two.
+
+Recovery (see recovery.py) truncates the files back to the last checkpoint and
+replays the journaled records after it.
+"""
+
+import asyncio
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Set, Tuple
+
+import orjson
+from loguru import logger
+
+from ..config import settings
+from .qa_capture import qa_chars
+
+JOURNAL_PREFIX = "journal"
+_RECORD_BYTES = 512  # journal line of a record without its QA text, roughly
+_PATTERN = re.compile(rf"{JOURNAL_PREFIX}(?:_(w\d+))?\.(\d+)\.jsonl")
+
+
+def journal_files(data_dir: Path, shard: Optional[str] = None) -> List[Path]:
+    """Journal generations of one writer, oldest first."""
+    found = []
+    for path in data_dir.glob(f"{JOURNAL_PREFIX}*.jsonl"):
+        match = _PATTERN.fullmatch(path.name)
+        if match and match.group(1) == shard:
+            found.append((int(match.group(2)), path))
+    return [path for _, path in sorted(found)]
+
+
+def journal_shards(data_dir: Path) -> Set[Optional[str]]:
+    """Writers (None for an unsharded task) that left a journal behind."""
+    shards = set()
+    for path in data_dir.glob(f"{JOURNAL_PREFIX}*.jsonl"):
+        match = _PATTERN.fullmatch(path.name)
+        if match:
+            shards.add(match.group(1))
+    return shards
+
+
+def read_journal(data_dir: Path, shard: Optional[str] = None) -> Tuple[Optional[dict], List[dict]]:
+    """
+    The last checkpoint (None if the writer never reached one) and the
+    journaled records after it, in arrival order.
+    """
+    checkpoint, records = None, {}
+    for path in journal_files(data_dir, shard):
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    entry = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    break  # torn tail of the last commit
+                if "checkpoint" in entry:
+                    if checkpoint is None or entry["checkpoint"]["records"] >= checkpoint["records"]:
+                        checkpoint = entry["checkpoint"]
+                else:
+                    records[entry["seq"]] = entry["stat"]  # replayed again by an interrupted recovery
+    done = checkpoint["records"] if checkpoint else 0
+    return checkpoint, [records[seq] for seq in sorted(records) if seq > done]
+
+
+class WriteAheadJournal:
+    """Group-committed append-only journal; appends come from the event loop."""
+
+    def __init__(self, task_id: str, data_dir: Path, shard: Optional[str] = None):
+        self.task_id = task_id
+        self.data_dir = data_dir
+        self.shard = shard
+        existing = journal_files(data_dir, shard)
+        self._gen = int(existing[-1].name.split(".")[-2]) + 1 if existing else 0
+        self._generations: List[Tuple[Path, int]] = []  # (path, highest seq), journal thread only
+        self._file = None
+
+        self._pending: List[Tuple[int, object]] = []  # (seq, stat), or (-1, line) for checkpoints
+        self._pending_bytes = 0
+        self._checkpoint: Optional[Tuple[int, bytes]] = None  # (records covered, line) pending
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._commit_task: Optional[asyncio.Task] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"journal-{task_id}")
+        self._stats = {
+            "commits": 0, "records": 0, "bytes": 0, "checkpoints": 0,
+            "fsync_ms_total": 0.0, "fsync_ms_max": 0.0, "max_records_per_commit": 0,
+        }
+
+    @property
+    def stats(self) -> dict:
+        s = self._stats
+        commits = s["commits"]
+        return {
+            "commits": commits,
+            "records": s["records"],
+            "bytes": s["bytes"],
+            "checkpoints": s["checkpoints"],
+            "pending": len(self._pending),
+            "records_per_commit": round(s["records"] / commits, 2) if commits else 0,
+            "max_records_per_commit": s["max_records_per_commit"],
+            "fsync_ms_avg": round(s["fsync_ms_total"] / commits, 3) if commits else 0,
+            "fsync_ms_max": round(s["fsync_ms_max"], 3),
+            "commit_ms": settings.JOURNAL_COMMIT_MS,
+            "commit_bytes": settings.JOURNAL_COMMIT_BYTES,
+        }
+
+    def append(self, seq: int, stat: dict):
+        """Journal one record; it is on disk after the next group commit."""
+        self._pending.append((seq, stat))
+        self._pending_bytes += _RECORD_BYTES + qa_chars(stat)
+        if self._pending_bytes >= settings.JOURNAL_COMMIT_BYTES:
+            self._kick()
+        elif self._timer is None and self._commit_task is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                settings.JOURNAL_COMMIT_MS / 1000, self._kick
+            )
+
+    def checkpoint(self, state: dict):
+        """Records up to ``state["records"]`` are durable in the writer's files."""
+        line = orjson.dumps({"checkpoint": state}) + b"\n"
+        self._pending.append((-1, line))
+        self._checkpoint = (state["records"], line)
+        self._kick()
+
+    async def close(self, delete: bool = True):
+        """Commit what is pending; drop the journal once the writer is finalized."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        await self._commit()
+        if self._commit_task is not None:
+            await self._commit_task
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._close, delete)
+        self._executor.shutdown(wait=False)
+
+    # ------------------------------------------------------------------
+    # Internal
+    # ------------------------------------------------------------------
+
+    def _kick(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._commit_task is None:
+            self._commit_task = asyncio.create_task(self._background_commit())
+
+    async def _background_commit(self):
+        try:
+            await self._commit()
+        except Exception as e:
+            logger.error(f"[{self.task_id}] Journal commit failed: {e}")
+        finally:
+            self._commit_task = None
+
+    async def _commit(self):
+        # Appends that arrive during a commit join the next one
+        while self._pending:
+            batch, self._pending, self._pending_bytes = self._pending, [], 0
+            checkpoint, self._checkpoint = self._checkpoint, None
+            await asyncio.get_running_loop().run_in_executor(
+                self._executor, self._write, batch, checkpoint
+            )
+
+    def _open(self):
+        path = self.data_dir / f"{JOURNAL_PREFIX}{'_' + self.shard if self.shard else ''}.{self._gen}.jsonl"
+        self._gen += 1
+        self._file = open(path, "ab")
+        self._generations.append((path, 0))
+
+    def _write(self, batch: List[Tuple[int, object]], checkpoint: Optional[Tuple[int, bytes]]):
+        """Journal thread: write and fsync one group; rotate after a checkpoint."""
+        if self._file is None:
+            self._open()
+        data = b"".join(
+            orjson.dumps({"seq": seq, "stat": entry}, default=list) + b"\n" if seq >= 0 else entry
+            for seq, entry in batch
+        )
+        started = time.perf_counter()
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        elapsed = (time.perf_counter() - started) * 1000
+
+        records = sum(1 for seq, _ in batch if seq >= 0)
+        path, top = self._generations[-1]
+        self._generations[-1] = (path, max([top] + [seq for seq, _ in batch]))
+        s = self._stats
+        s["commits"] += 1
+        s["records"] += records
+        s["bytes"] += len(data)
+        s["fsync_ms_total"] += elapsed
+        s["fsync_ms_max"] = max(s["fsync_ms_max"], elapsed)
+        s["max_records_per_commit"] = max(s["max_records_per_commit"], records)
+
+        if checkpoint is not None:
+            s["checkpoints"] += 1
+            self._rotate(*checkpoint)
+
+    def _rotate(self, covered: int, line: bytes):
+        """Start a generation with the checkpoint; delete the ones it covers."""
+        self._file.close()
+        self._open()
+        self._file.write(line)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        keep = []
+        for path, top in self._generations[:-1]:
+            if top <= covered:
+                path.unlink(missing_ok=True)
+            else:
+                keep.append((path, top))
+        self._generations[:-1] = keep
+
+    def _close(self, delete: bool):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if delete:
+            for path in journal_files(self.data_dir, self.shard):
+                path.unlink(missing_ok=True)
+
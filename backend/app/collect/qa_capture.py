@@ -0,0 +1,118 @@
+"""
+QA (prompt/response) capture modes for collection tasks.
+
+full      messages + response kept and written to qa_pairs_*.csv (default)
+truncate  both cut to QA_TRUNCATE_CHARS before they are buffered
+hash      only a blake2b digest and the character count are kept
+jsonl     full content, written only to qa_pairs.jsonl.gz (no QA CSV)
+metrics   no QA capture at all
+
+Every mode but ``metrics`` appends its QA rows to qa_pairs.jsonl.gz at each
+flush; that file is the canonical QA artifact and is read back row by row with
+:func:`iter_qa_records`. Only truncate, hash and metrics bound the memory a
+request takes: in full and jsonl modes the prompt and response are held until
+the request completes and then in the writer buffer until flushed (see
+data_writer.py). ``jsonl`` was called ``stream``, which is still accepted.
+"""
+
+import gzip
+import hashlib
+import json
+from pathlib import Path
+from typing import Iterator, List
+
+import orjson
+
+from ..utils.segments import QA_PREFIX, read_segment, segment_files
+
+QA_MODES = ("full", "truncate", "hash", "jsonl", "metrics")
+_ALIASES = {"stream": "jsonl"}
+QA_STREAM_FILE = "qa_pairs.jsonl.gz"
+QA_LEGACY_JSON = "qa_pairs.json"  # written at finalize by older versions
+
+
+def canonical_qa_mode(mode: str) -> str:
+    """The current name of a QA mode (tasks and clients may still use old ones)."""
+    return _ALIASES.get(mode, mode)
+
+
+def digest(data: bytes) -> str:
+    return "blake2b:" + hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def messages_text(messages) -> str:
+    """Messages as stored in QA files (JSON text)."""
+    if isinstance(messages, str):
+        return messages  # already shaped by the proxy
+    return json.dumps(messages, ensure_ascii=False)
+
+
+def qa_chars(stat: dict) -> int:
+    """Approximate characters of a record's QA text, without serializing it."""
+    messages = stat.get("messages")
+    chars = stat.get("messages_chars")
+    if chars is None:
+        if isinstance(messages, str):
+            chars = len(messages)
+        else:
+            chars = sum(
+                len(m.get("content")) for m in messages or ()
+                if isinstance(m, dict) and isinstance(m.get("content"), str)
+            )
+    response = stat.get("response_content") or ""
+    return chars + max(stat.get("response_chars") or 0, len(response))
+
+
+def shape_messages(messages, mode: str, limit: int):
+    """
+    Reduce the request messages to what the QA mode keeps.
+    Returns (value for the QA row, character count of the full JSON).
+    """
+    if mode in ("full", "jsonl"):
+        return messages, None
+    if mode == "metrics":
+        return "", 0
+    raw = orjson.dumps(messages)
+    if mode == "hash":
+        return digest(raw), len(raw.decode("utf-8"))
+    text = raw.decode("utf-8")
+    return text[:limit], len(text)
+
+
+def shape_response(text: str, mode: str, limit: int) -> str:
+    if mode in ("full", "jsonl"):
+        return text
+    if mode == "truncate":
+        return text[:limit]
+    if mode == "hash":
+        return digest(text.encode("utf-8"))
+    return ""
+
+
+def qa_stream_files(data_dir: Path) -> List[Path]:
+    """The task's QA stream, or the per-worker streams of a sharded task still running."""
+    stream = data_dir / QA_STREAM_FILE
+    if stream.exists():
+        return [stream]
+    return sorted(data_dir.glob(QA_STREAM_FILE.replace(".", "_w*.", 1)))
+
+
+def iter_qa_records(data_dir: Path) -> Iterator[dict]:
+    """
+    QA rows of a task, one at a time: qa_pairs.jsonl.gz, else the qa_pairs.json
+    of older tasks, else the QA CSV segments.
+    """
+    stream = data_dir / QA_STREAM_FILE
+    if stream.exists():
+        with gzip.open(stream, "rb") as f:
+            for line in f:
+                if line.strip():
+                    yield orjson.loads(line)
+        return
+    legacy = data_dir / QA_LEGACY_JSON
+    if legacy.exists():
+        with open(legacy, "r", encoding="utf-8") as f:
+            yield from json.load(f)
+        return
+    for path in segment_files(data_dir, QA_PREFIX):
+        yield from read_segment(path).to_dict("records")
@@ -0,0 +1,332 @@
+"""
+Full-text search index of a task's QA pairs.
+
+In the QA modes that keep the text (full, truncate, stream) the writer adds
+every flushed batch to ``qa_index.db`` (``qa_index_<shard>.db`` per worker), a
+SQLite database in the task directory (written on its own thread) with two
+tables sharing the record sequence number (序号) as key:
+
+qa_text      FTS5 table over messages and response (up to QA_SEARCH_MAX_CHARS
+             each), trigram tokenizer so that any substring of 3+ characters
+             matches (CJK text included)
+performance  the record's performance row, for latency filters and results
+
+Search (see :func:`search_qa`) is then one indexed query per database instead
+of a scan of the QA files; on a running task it sees the batches the index
+thread has added so far. Adding never makes the writer wait: batches queued
+while the index thread is busy are indexed together, and past
+QA_INDEX_BACKLOG queued rows new batches are skipped and indexed from the
+task files when the writer finalizes (until then searches miss them). Recovery drops the rows past the journal checkpoint
+(they are replayed) and indexes the flushed ones the index had not reached;
+merging shards rebuilds one index from the merged files (see
+:func:`build_qa_index`).
+"""
+
+import heapq
+import sqlite3
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+import pandas as pd
+from loguru import logger
+
+from ..config import settings
+from ..utils.segments import PERF_PREFIX, read_segments
+from .qa_capture import iter_qa_records
+
+QA_INDEX_FILE = "qa_index.db"
+SEARCHABLE_MODES = ("full", "truncate", "jsonl")
+_SEQ = "序号"
+_BUILD_BATCH = 5000
+
+
+def qa_index_path(data_dir: Path, shard: Optional[str] = None) -> Path:
+    return data_dir / QA_INDEX_FILE.replace(".", f"_{shard}." if shard else ".", 1)
+
+
+def qa_index_files(data_dir: Path) -> List[Path]:
+    """The task's index, or the shard indexes of a task still being collected."""
+    merged = data_dir / QA_INDEX_FILE
+    if merged.exists():
+        return [merged]
+    return sorted(data_dir.glob(QA_INDEX_FILE.replace(".", "_w*.", 1)))
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+class QAIndex:
+    """
+    Writable index of one writer. Batches are added on the index's own thread,
+    so tokenizing the text never holds up the writer's flushes.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._columns: Optional[List[str]] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._queued: List[Tuple[List[dict], List[dict]]] = []
+        self._queued_rows = 0
+        self._draining: Optional[Future] = None
+        self._skipped: List[Tuple[int, int]] = []  # 序号 ranges of the batches not queued
+
+    def add(self, perf_rows: List[dict], qa_rows: List[dict]):
+        """Queue one flushed batch for indexing (skipped when too far behind)."""
+        rows = max(len(perf_rows), len(qa_rows))
+        if not rows:
+            return
+        with self._lock:
+            limit = settings.QA_INDEX_BACKLOG
+            if limit > 0 and self._queued and self._queued_rows + rows > limit:
+                seqs = [row[_SEQ] for row in perf_rows or qa_rows]
+                if not self._skipped:
+                    logger.warning(f"QA index {self.path.name}: {self._queued_rows} rows behind, skipping batches")
+                self._skipped.append((min(seqs), max(seqs)))
+                return
+            self._queued.append((perf_rows, qa_rows))
+            self._queued_rows += rows
+            if self._draining is None:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=1, thread_name_prefix=f"qa-index-{self.path.stem}"
+                    )
+                self._draining = self._executor.submit(self._drain)
+
+    def take_skipped(self) -> List[Tuple[int, int]]:
+        """The 序号 ranges skipped under backlog since the last call."""
+        self.wait()
+        with self._lock:
+            skipped, self._skipped = self._skipped, []
+        return skipped
+
+    def wait(self):
+        """Block until the queued batches are indexed."""
+        with self._lock:
+            draining = self._draining
+        if draining is not None:
+            draining.result()
+
+    def indexed_seqs(self) -> Set[int]:
+        """序号 of the records indexed (batches skipped under backlog leave gaps)."""
+        if not self.path.exists():
+            return set()
+        conn = self._connect()
+        if not self._has_performance():
+            return set()
+        return {seq for (seq,) in conn.execute(f"SELECT {_quote(_SEQ)} FROM performance")}
+
+    def truncate(self, records: int):
+        """Drop the rows after the first ``records`` (recovery replays them)."""
+        if not self.path.exists():
+            return
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM qa_text WHERE rowid > ?", (records,))
+            if self._has_performance():
+                conn.execute(f"DELETE FROM performance WHERE {_quote(_SEQ)} > ?", (records,))
+
+    def close(self, complete: bool = False):
+        """
+        Wait for the queued batches. Once the task is complete, also merge the
+        FTS segments and leave WAL mode, so the file is self-contained for the
+        read-only searches.
+        """
+        self.wait()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        if self._conn is None:
+            return
+        try:
+            if complete:
+                with self._conn:
+                    self._conn.execute("INSERT INTO qa_text (qa_text) VALUES ('optimize')")
+                self._conn.execute("PRAGMA journal_mode=DELETE")
+        except sqlite3.Error as e:
+            logger.warning(f"QA index {self.path.name}: not optimized: {e}")
+        finally:
+            self._conn.close()
+            self._conn = None
+
+    # ------------------------------------------------------------------
+    # Internal
+    # ------------------------------------------------------------------
+
+    def _drain(self):
+        """Index thread: index what is queued, all of it in one transaction, until nothing is."""
+        while True:
+            with self._lock:
+                if not self._queued:
+                    self._draining = None
+                    return
+                batches, self._queued, self._queued_rows = self._queued, [], 0
+            self._add(
+                [row for perf_rows, _ in batches for row in perf_rows],
+                [row for _, qa_rows in batches for row in qa_rows],
+            )
+
+    def _add(self, perf_rows: List[dict], qa_rows: List[dict]):
+        """One batch, one transaction."""
+        try:
+            conn = self._connect()
+            with conn:
+                if perf_rows:
+                    if self._columns is None:
+                        self._create_performance(list(perf_rows[0]))
+                    conn.executemany(
+                        f"INSERT OR REPLACE INTO performance ({', '.join(map(_quote, self._columns))}) "
+                        f"VALUES ({', '.join('?' * len(self._columns))})",
+                        [[row.get(c) for c in self._columns] for row in perf_rows],
+                    )
+                if qa_rows:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO qa_text (rowid, messages, response) VALUES (?, ?, ?)",
+                        [
+                            (row[_SEQ], _indexed_text(row.get("messages")), _indexed_text(row.get("response_content")))
+                            for row in qa_rows
+                        ],
+                    )
+        except Exception as e:
+            logger.warning(f"QA index {self.path.name}: batch not indexed: {e}")
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS qa_text USING fts5(messages, response, tokenize='trigram')"
+            )
+            if self._has_performance():
+                self._columns = [r[1] for r in self._conn.execute("PRAGMA table_info(performance)")]
+        return self._conn
+
+    def _has_performance(self) -> bool:
+        return self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'performance'"
+        ).fetchone() is not None
+
+    def _create_performance(self, columns: List[str]):
+        rest = ", ".join(_quote(c) for c in columns if c != _SEQ)
+        self._conn.execute(f"CREATE TABLE IF NOT EXISTS performance ({_quote(_SEQ)} INTEGER PRIMARY KEY, {rest})")
+        self._columns = [_SEQ] + [c for c in columns if c != _SEQ]
+
+
+def _indexed_text(text) -> str:
+    """The part of a QA field that is indexed: all of it, or its head and tail."""
+    if not isinstance(text, str):
+        return ""
+    limit = settings.QA_SEARCH_MAX_CHARS
+    if limit <= 0 or len(text) <= limit:
+        return text
+    return text[:limit // 2] + "\n" + text[-(limit // 2):]
+
+
+def build_qa_index(data_dir: Path) -> int:
+    """
+    (Re)build ``qa_index.db`` from the task's files: its performance segments
+    and QA records, matched by request_id. Returns the rows indexed.
+    """
+    perf = read_segments(data_dir, PERF_PREFIX)
+    target = data_dir / QA_INDEX_FILE
+    tmp = data_dir / f".{QA_INDEX_FILE}.tmp"
+    tmp.unlink(missing_ok=True)
+    if perf.empty:
+        return 0
+    position = pd.Series(perf[_SEQ].to_numpy(), index=perf["request_id"])
+    position = position[~position.index.duplicated()]
+
+    index = QAIndex(tmp)
+    indexed = 0
+    try:
+        for start in range(0, len(perf), _BUILD_BATCH):
+            index._add(perf.iloc[start:start + _BUILD_BATCH].to_dict("records"), [])
+        batch = []
+        for rec in iter_qa_records(data_dir):
+            seq = position.get(rec.get("request_id"))
+            if seq is None:
+                continue
+            batch.append({**rec, _SEQ: int(seq)})
+            if len(batch) >= _BUILD_BATCH:
+                index._add([], batch)
+                indexed += len(batch)
+                batch = []
+        index._add([], batch)
+        indexed += len(batch)
+    finally:
+        index.close(complete=True)
+    for suffix in ("-wal", "-shm"):
+        Path(f"{target}{suffix}").unlink(missing_ok=True)
+    tmp.replace(target)
+    return indexed
+
+
+# ----------------------------------------------------------------------
+# Search
+# ----------------------------------------------------------------------
+
+def search_qa(
+    data_dir: Path,
+    query: str,
+    ranges: Dict[str, Tuple[Optional[float], Optional[float]]],
+    sort_by: str = "arrival_time",
+    descending: bool = False,
+    offset: int = 0,
+    limit: int = 20,
+) -> Tuple[int, List[dict]]:
+    """
+    Records whose messages or response match the FTS5 ``query``, with their
+    performance row and a snippet of the match, filtered by the
+    ``{column: (min, max)}`` ranges. Returns (total matches, requested page).
+    Raises ValueError for a bad query or column and FileNotFoundError when the
+    task has no index.
+    """
+    files = qa_index_files(data_dir)
+    if not files:
+        raise FileNotFoundError(data_dir / QA_INDEX_FILE)
+
+    where, params = ["qa_text MATCH ?"], [query]
+    for column, (low, high) in ranges.items():
+        if low is not None:
+            where.append(f"p.{_quote(column)} >= ?")
+            params.append(low)
+        if high is not None:
+            where.append(f"p.{_quote(column)} <= ?")
+            params.append(high)
+    joined = f"FROM qa_text JOIN performance p ON p.{_quote(_SEQ)} = qa_text.rowid WHERE {' AND '.join(where)}"
+    order = f"ORDER BY p.{_quote(sort_by)} {'DESC' if descending else 'ASC'}"
+
+    total, pages = 0, []
+    for path in files:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        try:
+            columns = {r[1] for r in conn.execute("PRAGMA table_info(performance)")}
+            if not columns:
+                continue  # nothing flushed yet
+            for column in [sort_by, *ranges]:
+                if column not in columns:
+                    raise ValueError(f"Unknown column: {column}")
+            total += conn.execute(f"SELECT count(*) {joined}", params).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT p.*, snippet(qa_text, -1, '[', ']', '…', 16) AS snippet {joined} {order} LIMIT ?",
+                [*params, offset + limit],
+            ).fetchall()
+            pages.append([dict(r) for r in rows])
+        except sqlite3.OperationalError as e:
+            raise ValueError(f"Bad search query: {e}") from None
+        finally:
+            conn.close()
+
+    # Shard indexes are each sorted; merge them
+    merged = heapq.merge(*pages, key=lambda r: _sort_key(r[sort_by]), reverse=descending)
+    return total, list(merged)[offset:offset + limit]
+
+
+def _sort_key(value):
+    return (value is not None, value)  # NULL sorts first, as in SQLite
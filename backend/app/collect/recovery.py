@@ -0,0 +1,194 @@
+"""
+Startup recovery of tasks interrupted by a crash or restart.
+
+A task still ``running`` in the DB when the service starts was cut off
+mid-collection or mid-benchmark; one still ``stopping`` was cut off while
+being stopped. Each of its writers is cut back to its last journal
+checkpoint, the journaled records after it are added again (see journal.py),
+and the task is finalized and marked completed as if stopped.
+
+With AICP_WORKERS > 1 only some workers may have restarted while the others
+keep collecting. Attached workers refresh their ``.live_<shard>.json`` dump every
+sync interval, so after waiting a few intervals a shard whose dump is stale is
+dead: it is recovered and marked done, and the task can be stopped as usual.
+When no shard is alive the worker that claims the task merges and finalizes it.
+A ``stopping`` task is left to the worker stopping it (see shards.write_stopper)
+unless that process is gone.
+Benchmarks are only recovered with a single worker, where nothing else can
+still be running them.
+"""
+
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+from loguru import logger
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..metrics.live import live_path
+from ..models.schemas import Task
+from ..utils.segments import PERF_PREFIX, read_segment, segment_files
+from .data_writer import PerformanceDataWriter
+from .journal import journal_shards
+from .shards import merge_sampling, merge_shards, read_markers, stopper_alive, write_marker, write_stopper
+
+_HEARTBEAT_INTERVALS = 3  # sync intervals without a live dump before a shard counts as dead
+_INTERRUPTED = ("running", "stopping")
+
+
+async def recover_interrupted_tasks():
+    """Finalize (or, with several workers, repair) tasks left running or stopping by a crash."""
+    from ..models.database import SessionLocal
+    db = SessionLocal()
+    try:
+        # Only tasks that were already running before this worker started
+        running = [t.id for t in db.query(Task).filter(Task.status.in_(_INTERRUPTED)).all()]
+        if running and settings.WORKERS > 1:
+            await asyncio.sleep(_HEARTBEAT_INTERVALS * settings.WORKER_SYNC_INTERVAL)
+            db.expire_all()
+        tasks = (
+            db.query(Task).filter(Task.id.in_(running), Task.status.in_(_INTERRUPTED)).all() if running else []
+        )
+        for task in tasks:
+            if not task.data_dir or not Path(task.data_dir).is_dir():
+                continue
+            try:
+                if settings.WORKERS == 1:
+                    await _recover_task(task, db)
+                elif task.status == "stopping":
+                    await _recover_stopping(task, db)
+                elif task.type == "collect":
+                    await _recover_dead_shards(task, db)
+            except Exception as e:
+                logger.error(f"[{task.id}] Recovery failed: {e}")
+    finally:
+        db.close()
+
+
+def _qa_mode(task: Task) -> str:
+    if task.type == "benchmark":
+        return "full"
+    return json.loads(task.config or "{}").get("qa_mode") or settings.QA_CAPTURE_MODE
+
+
+async def _recover_task(task: Task, db: Session):
+    data_dir = Path(task.data_dir)
+    logger.info(f"[{task.id}] Recovering interrupted {task.type} task")
+    markers = {m["shard"]: m for m in read_markers(data_dir)}
+    if markers or journal_shards(data_dir) - {None}:
+        # Left by a multi-worker run
+        for shard in _unfinished_shards(data_dir, markers):
+            await _recover_shard(task, data_dir, shard, markers.get(shard))
+        await _merge_and_complete(task, data_dir, db)
+        return
+    writer = await PerformanceDataWriter.recover(task.id, data_dir, qa_mode=_qa_mode(task))
+    await writer.finalize()
+    _complete(task, writer.total_records, db)
+
+
+async def _recover_dead_shards(task: Task, db: Session):
+    data_dir = Path(task.data_dir)
+    markers = {m["shard"]: m for m in read_markers(data_dir)}
+    shards = _unfinished_shards(data_dir, markers)
+    stale_after = _HEARTBEAT_INTERVALS * settings.WORKER_SYNC_INTERVAL
+    alive = {s for s in shards if _heartbeat_age(data_dir, s) < stale_after}
+
+    if alive:
+        # The task goes on in the other workers; only repair the dead shards
+        for shard in shards - alive:
+            lock = data_dir / f".recover_{shard}"
+            try:
+                os.close(os.open(lock, os.O_CREAT | os.O_EXCL))
+            except FileExistsError:
+                continue  # another restarted worker has it
+            try:
+                await _recover_shard(task, data_dir, shard, markers.get(shard))
+            finally:
+                lock.unlink(missing_ok=True)
+        return
+
+    # Every worker went down: exactly one restarted worker claims the task
+    claimed = db.query(Task).filter(Task.id == task.id, Task.status == "running").update(
+        {"status": "stopping"}, synchronize_session=False
+    )
+    db.commit()
+    if not claimed:
+        return
+    write_stopper(data_dir)
+    logger.info(f"[{task.id}] Recovering interrupted collection task")
+    for shard in shards:
+        await _recover_shard(task, data_dir, shard, markers.get(shard))
+    await _merge_and_complete(task, data_dir, db)
+
+
+async def _recover_stopping(task: Task, db: Session):
+    data_dir = Path(task.data_dir)
+    if stopper_alive(data_dir):
+        return  # still waiting for the shards or merging them
+    lock = data_dir / ".recover_stop"
+    try:
+        os.close(os.open(lock, os.O_CREAT | os.O_EXCL))
+    except FileExistsError:
+        return  # another restarted worker has it
+    try:
+        write_stopper(data_dir)
+        logger.info(f"[{task.id}] Recovering collection task interrupted while stopping")
+        markers = {m["shard"]: m for m in read_markers(data_dir)}
+        for shard in _unfinished_shards(data_dir, markers):
+            await _recover_shard(task, data_dir, shard, markers.get(shard))
+        await _merge_and_complete(task, data_dir, db)
+    finally:
+        lock.unlink(missing_ok=True)
+
+
+def _unfinished_shards(data_dir: Path, markers: dict) -> set:
+    return {s for s, m in markers.items() if not m.get("done")} | (journal_shards(data_dir) - {None})
+
+
+def _heartbeat_age(data_dir: Path, shard: str) -> float:
+    try:
+        return time.time() - live_path(data_dir, shard).stat().st_mtime
+    except FileNotFoundError:
+        return float("inf")
+
+
+async def _recover_shard(task: Task, data_dir: Path, shard: str, marker: Optional[dict] = None):
+    writer = await PerformanceDataWriter.recover(task.id, data_dir, qa_mode=_qa_mode(task), shard=shard)
+    await writer.finalize(summary=False)
+    marker = marker or {}
+    write_marker(
+        data_dir, shard, records=writer.total_records, done=True,
+        sampling=marker.get("sampling"), dropped=marker.get("dropped", 0),
+    )
+    live_path(data_dir, shard).unlink(missing_ok=True)
+
+
+async def _merge_and_complete(task: Task, data_dir: Path, db: Session):
+    markers = read_markers(data_dir)
+    total = await asyncio.get_running_loop().run_in_executor(None, _merge, data_dir)
+    writer = PerformanceDataWriter(task.id, data_dir, qa_mode=_qa_mode(task))
+    writer.sampling = merge_sampling([m.get("sampling") for m in markers])
+    await writer.finalize()
+    _complete(task, total, db)
+
+
+def _merge(data_dir: Path) -> int:
+    """Worker thread: merge the shards; the record count of the merged task."""
+    total = merge_shards(data_dir, settings.MAX_RECORDS_PER_FILE, settings.MAX_FILE_BYTES)
+    if not total:
+        # Merged before the crash
+        total = sum(len(read_segment(path)) for path in segment_files(data_dir, PERF_PREFIX))
+    return total
+
+
+def _complete(task: Task, total: int, db: Session):
+    task.status = "completed"
+    task.completed_at = datetime.now(timezone.utc)
+    task.record_count = total
+    db.commit()
+    logger.info(f"[{task.id}] Recovered task completed (records: {total})")
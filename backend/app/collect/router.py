@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
+from typing import Optional
 from sqlalchemy.orm import Session
 
 from ..models.database import get_db
@@ -13,6 +14,9 @@ class StartCollectRequest(BaseModel):
     name: str
     stop_type: str = "count"  # count | time
     stop_value: int = 500
+    sample_mode: str = "all"  # all | ratio | hash | budget
+    sample_value: float = 1.0  # fraction for ratio/hash, requests per second for budget
+    qa_mode: Optional[str] = None  # full | truncate | hash | jsonl | metrics (default: AICP_QA_CAPTURE_MODE)
 
 
 class StopCollectRequest(BaseModel):
@@ -25,10 +29,14 @@ async def start_collect(req: StartCollectRequest, db: Session = Depends(get_db))
         result = await collection_manager.start_task(
             name=req.name, stop_type=req.stop_type,
             stop_value=req.stop_value, db=db,
+            sample_mode=req.sample_mode, sample_value=req.sample_value,
+            qa_mode=req.qa_mode,
         )
         return result
     except RuntimeError as e:
         raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.post("/stop")
@@ -43,13 +51,19 @@ async def stop_collect(req: StopCollectRequest, db: Session = Depends(get_db)):
 @router.get("/status")
 async def collect_status():
     if collection_manager.has_active_task():
-        writer = collection_manager._active_writer
         return {
             "active": True,
             "task_id": collection_manager.active_task_id,
-            "record_count": writer.total_records if writer else 0,
+            "record_count": collection_manager.record_count,
+            "queue": collection_manager.queue_status,
+            "sampling": collection_manager.sampling_status,
+            "journal": collection_manager.journal_status,
         }
-    return {"active": False, "task_id": None, "record_count": 0}
+    return {
+        "active": False, "task_id": None, "record_count": 0,
+        "queue": collection_manager.queue_status,
+        "sampling": collection_manager.sampling_status,
+    }
 
 
 @router.get("/tasks")
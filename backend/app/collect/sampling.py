@@ -0,0 +1,67 @@
+"""
+Request sampling for collection tasks.
+Unsampled requests bypass the metrics path and are proxied as plain passthrough.
+"""
+
+import random
+import time
+import zlib
+
+SAMPLE_MODES = ("all", "ratio", "hash", "budget")
+
+
+class SamplingPolicy:
+    """
+    all     every request
+    ratio   random fraction ``value`` (0-1)
+    hash    deterministic fraction ``value`` by CRC32 of the request body,
+            so identical requests are always (or never) sampled
+    budget  at most ``value`` requests per wall-clock second; with several
+            uvicorn workers each one takes an equal share
+    """
+
+    def __init__(self, mode: str = "all", value: float = 1.0, workers: int = 1):
+        if mode not in SAMPLE_MODES:
+            raise ValueError(f"sample_mode must be one of {SAMPLE_MODES}")
+        if mode in ("ratio", "hash") and not 0 < value <= 1:
+            raise ValueError("sample_value must be in (0, 1] for ratio/hash sampling")
+        if mode == "budget" and value < 1:
+            raise ValueError("sample_value must be >= 1 request/s for budget sampling")
+        self.mode = mode
+        self.value = value
+        self.seen = 0
+        self.sampled = 0
+        self._threshold = int(value * 0xFFFFFFFF)
+        self._budget = value / max(workers, 1)
+        self._second = 0
+        self._second_count = 0
+
+    def should_sample(self, body: bytes = b"") -> bool:
+        self.seen += 1
+        mode = self.mode
+        if mode == "all":
+            take = True
+        elif mode == "ratio":
+            take = random.random() < self.value
+        elif mode == "hash":
+            take = zlib.crc32(body) <= self._threshold
+        else:
+            now = int(time.monotonic())
+            if now != self._second:
+                self._second = now
+                self._second_count = 0
+            take = self._second_count < self._budget
+            if take:
+                self._second_count += 1
+        if take:
+            self.sampled += 1
+        return take
+
+    def snapshot(self) -> dict:
+        return {
+            "mode": self.mode,
+            "value": self.value,
+            "seen": self.seen,
+            "sampled": self.sampled,
+            "ratio": round(self.sampled / self.seen, 4) if self.seen else 0,
+        }
@@ -0,0 +1,303 @@
+"""
+Per-worker shards of a collection task (AICP_WORKERS > 1).
+
+Every uvicorn worker writes its own files into the task directory, named with
+its shard id (``w<pid>``)::
+
+    performance_data_w123_0.csv  qa_pairs_w123_0.csv   (.csv.gz / .csv.zst when compressed)
+    itl_offsets_w123.bin         qa_pairs_w123.jsonl.gz
+    metrics_sketch_w123.json     qa_index_w123.db
+    .shard_w123.json             marker: record count, done flag, sampling/queue stats
+    .stopping                    shard id of the worker stopping the task
+
+The worker that stops the task waits for every marker to be done, then merges
+the shards into the usual single-writer layout, ordered by arrival time. A
+shard still open after COLLECT_STOP_TIMEOUT is left out of the merge, and its
+files are kept as they are.
+"""
+
+import gzip
+import heapq
+import json
+import os
+import re
+import shutil
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+import orjson
+import pandas as pd
+
+from ..utils.itl import ITL_FILE
+from ..utils.segments import PERF_PREFIX, QA_PREFIX, compression_ext, read_segment, segment_path
+from ..utils.sketch import SKETCH_FILE, SummarySketch
+from .qa_capture import QA_STREAM_FILE
+from .qa_index import QA_INDEX_FILE, build_qa_index
+
+_QA_MEMBER = 5000  # records per gzip member of the merged QA stream
+_SORT_RUN = 50000  # QA records sorted in memory at a time while merging
+_SHARD_NAME = re.compile(r"_(w\d+)[_.]")
+STOPPER_FILE = ".stopping"
+
+
+def shard_id() -> str:
+    return f"w{os.getpid()}"
+
+
+def marker_path(data_dir: Path, shard: str) -> Path:
+    return data_dir / f".shard_{shard}.json"
+
+
+def write_marker(data_dir: Path, shard: str, **state):
+    """Atomically replace the shard's marker file."""
+    path = marker_path(data_dir, shard)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"shard": shard, **state}, f)
+    os.replace(tmp, path)
+
+
+def write_stopper(data_dir: Path):
+    """Record this worker as the one stopping (and merging) the task."""
+    (data_dir / STOPPER_FILE).write_text(shard_id(), encoding="utf-8")
+
+
+def stopper_alive(data_dir: Path) -> bool:
+    """Whether the worker that claimed the stop is still running."""
+    try:
+        pid = int((data_dir / STOPPER_FILE).read_text(encoding="utf-8").strip()[1:])
+    except (OSError, ValueError):
+        return False
+    if pid == os.getpid():
+        return False  # a previous process that had our pid
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def read_markers(data_dir: Path) -> List[dict]:
+    markers = []
+    for path in sorted(data_dir.glob(".shard_*.json")):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                markers.append(json.load(f))
+        except (OSError, ValueError):
+            continue  # being replaced; picked up on the next poll
+    return markers
+
+
+def merge_sampling(snapshots: List[dict]) -> dict:
+    """Combine per-worker SamplingPolicy snapshots."""
+    snapshots = [s for s in snapshots if s]
+    if not snapshots:
+        return {}
+    merged = dict(snapshots[0])
+    merged["seen"] = sum(s.get("seen", 0) for s in snapshots)
+    merged["sampled"] = sum(s.get("sampled", 0) for s in snapshots)
+    merged["ratio"] = round(merged["sampled"] / merged["seen"], 4) if merged["seen"] else 0
+    merged["workers"] = len(snapshots)
+    return merged
+
+
+def _write_chunks(df: pd.DataFrame, data_dir: Path, prefix: str, file_index: pd.Series):
+    ext = compression_ext()
+    for index, chunk in df.groupby(file_index, sort=True):
+        chunk.to_csv(segment_path(data_dir, prefix, index, ext), index=False, encoding="utf-8-sig")
+
+
+def _row_sizes(df: pd.DataFrame) -> np.ndarray:
+    """Approximate CSV size of each row (characters plus separators)."""
+    return df.astype(str).apply(lambda col: col.str.len()).sum(axis=1).to_numpy() + len(df.columns)
+
+
+def _segment_index(perf_sizes: np.ndarray, qa_sizes: np.ndarray, max_records: int, max_bytes: int) -> np.ndarray:
+    """Segment of each row under the writer's rotation limits."""
+    if max_bytes <= 0:
+        positions = np.arange(len(perf_sizes))
+        return positions // max_records if max_records > 0 else np.zeros_like(positions)
+    index = np.empty(len(perf_sizes), dtype=np.int64)
+    segment = records = perf_bytes = qa_bytes = 0
+    for i in range(len(perf_sizes)):
+        index[i] = segment
+        records += 1
+        perf_bytes += perf_sizes[i]
+        qa_bytes += qa_sizes[i]
+        if (max_records > 0 and records >= max_records) or max(perf_bytes, qa_bytes) >= max_bytes:
+            segment += 1
+            records = perf_bytes = qa_bytes = 0
+    return index
+
+
+def _merge_qa_stream(data_dir: Path, parts: List[Path], position: Dict[str, int]):
+    """
+    Rewrite the shards' qa_pairs_w*.jsonl.gz as one qa_pairs.jsonl.gz in merged
+    order, with 序号 renumbered like the CSVs. Records without a performance row
+    are dropped. A shard writes its records as they complete, not as they
+    arrived, so the records are sorted in runs of _SORT_RUN spilled to
+    temporary files, which are then merged: at most one run is held in memory.
+    """
+    runs: List[Path] = []
+    try:
+        run = []
+        for part in parts:
+            with gzip.open(part, "rb") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    rec = orjson.loads(line)
+                    order = position.get(rec.get("request_id"))
+                    if order is None:
+                        continue
+                    rec["序号"] = order + 1
+                    run.append((order, orjson.dumps(rec)))
+                    if len(run) >= _SORT_RUN:
+                        runs.append(_spill_run(data_dir, len(runs), run))
+                        run = []
+        if run:
+            runs.append(_spill_run(data_dir, len(runs), run))
+
+        tmp = data_dir / f".{QA_STREAM_FILE}.tmp"
+        with open(tmp, "wb") as out:
+            # One gzip member per _QA_MEMBER records, as the writer appends them
+            member = []
+            for _, line in heapq.merge(*(_read_run(path) for path in runs), key=lambda item: item[0]):
+                member.append(line)
+                if len(member) >= _QA_MEMBER:
+                    out.write(gzip.compress(b"".join(member), compresslevel=6))
+                    member = []
+            if member:
+                out.write(gzip.compress(b"".join(member), compresslevel=6))
+        os.replace(tmp, data_dir / QA_STREAM_FILE)
+    finally:
+        for path in runs:
+            path.unlink(missing_ok=True)
+
+
+def _spill_run(data_dir: Path, index: int, run: List[Tuple[int, bytes]]) -> Path:
+    """Write one sorted run as ``order<TAB>record`` lines."""
+    run.sort(key=lambda item: item[0])
+    path = data_dir / f".qa_run_{index}.tmp"
+    with gzip.open(path, "wb", compresslevel=1) as f:
+        for order, line in run:
+            f.write(b"%d\t%s\n" % (order, line))
+    return path
+
+
+def _read_run(path: Path) -> Iterator[Tuple[int, bytes]]:
+    with gzip.open(path, "rb") as f:
+        for line in f:
+            order, _, record = line.partition(b"\t")
+            yield int(order), record
+
+
+def _shard_files(data_dir: Path, pattern: str, shards: Optional[Set[str]]) -> List[Path]:
+    """Files matching ``pattern`` that belong to ``shards`` (all shards when None)."""
+    found = []
+    for path in sorted(data_dir.glob(pattern)):
+        match = _SHARD_NAME.search(path.name)
+        if shards is None or (match and match.group(1) in shards):
+            found.append(path)
+    return found
+
+
+def merge_shards(data_dir: Path, max_per_file: int, max_bytes: int = 0, shards: Optional[Set[str]] = None) -> int:
+    """
+    Merge the shard files of a task into performance_data_N.csv / qa_pairs_N.csv,
+    itl_offsets.bin, qa_pairs.jsonl.gz, metrics_sketch.json and qa_index.db.
+    Only ``shards`` are merged when given; the files of the others are left
+    alone. Returns the merged record count.
+    """
+    perf_files = _shard_files(data_dir, f"{PERF_PREFIX}_w*_*.csv*", shards)
+    total = 0
+    position: Optional[Dict[str, int]] = None
+    if perf_files:
+        perf = pd.concat([read_segment(f) for f in perf_files], ignore_index=True)
+        # arrival_time has whole seconds; arrival_ts orders the requests within one
+        # (shards written before it existed keep their file order there)
+        keys = ["arrival_time"] + (["arrival_ts"] if "arrival_ts" in perf.columns else [])
+        perf = perf.sort_values(keys, kind="mergesort", ignore_index=True)
+        total = len(perf)
+        perf["序号"] = range(1, total + 1)
+        position = dict(zip(perf["request_id"], range(total)))
+
+        # QA rows follow the merged performance order
+        qa_files = _shard_files(data_dir, f"{QA_PREFIX}_w*_*.csv*", shards)
+        qa = None
+        if qa_files:
+            qa = pd.concat([read_segment(f) for f in qa_files], ignore_index=True)
+            order = qa["request_id"].map(position)
+            qa = qa.assign(_order=order).dropna(subset=["_order"])
+            qa = qa.sort_values("_order", kind="mergesort")
+            qa["_order"] = qa["_order"].astype(int)
+            qa["序号"] = qa["_order"] + 1
+
+        # Perf and QA segments rotate together, like the writer's
+        perf_sizes = np.zeros(total, dtype=np.int64)
+        qa_sizes = np.zeros(total, dtype=np.int64)
+        if max_bytes > 0:
+            perf_sizes = _row_sizes(perf)
+            if qa is not None:
+                qa_sizes[qa["_order"].to_numpy()] = _row_sizes(qa.drop(columns="_order"))
+        file_index = _segment_index(perf_sizes, qa_sizes, max_per_file, max_bytes)
+
+        _write_chunks(perf, data_dir, PERF_PREFIX, file_index)
+        if qa is not None:
+            qa_index = file_index[qa["_order"].to_numpy()]
+            _write_chunks(qa.drop(columns="_order"), data_dir, QA_PREFIX, qa_index)
+            for f in qa_files:
+                f.unlink()
+        for f in perf_files:
+            f.unlink()
+
+    # QA records follow the merged performance order too
+    qa_parts = _shard_files(data_dir, QA_STREAM_FILE.replace(".", "_w*.", 1), shards)
+    if qa_parts:
+        _merge_qa_stream(data_dir, qa_parts, position or {})
+        for part in qa_parts:
+            part.unlink()
+
+    # ITL records are keyed by request id, so the shard files are just concatenated
+    stem, _, ext = ITL_FILE.partition(".")
+    parts = _shard_files(data_dir, f"{stem}_w*.{ext}", shards)
+    if parts:
+        with open(data_dir / ITL_FILE, "ab") as out:
+            for part in parts:
+                with open(part, "rb") as f:
+                    shutil.copyfileobj(f, out)
+                part.unlink()
+
+    # Quantile sketches merge bucket by bucket
+    sketch_parts = _shard_files(data_dir, SKETCH_FILE.replace(".", "_w*.", 1), shards)
+    if sketch_parts:
+        merged = None
+        for part in sketch_parts:
+            sketch = SummarySketch.load(part)
+            if sketch is None:
+                continue
+            if merged is None:
+                merged = sketch
+            else:
+                merged.merge(sketch)
+        if merged is not None:
+            merged.save(data_dir / SKETCH_FILE)
+        for part in sketch_parts:
+            part.unlink()
+
+    # Full-text indexes are rebuilt over the merged records
+    index_parts = _shard_files(data_dir, QA_INDEX_FILE.replace(".", "_w*.", 1) + "*", shards)
+    if index_parts:
+        build_qa_index(data_dir)
+        for part in index_parts:
+            part.unlink(missing_ok=True)
+
+    for f in _shard_files(data_dir, ".shard_*.json", shards):
+        f.unlink()
+    (data_dir / STOPPER_FILE).unlink(missing_ok=True)
+    for f in _shard_files(data_dir, ".live_*.json", shards):
+        f.unlink(missing_ok=True)  # left behind by a worker that did not finish
+    return total
@@ -1,19 +1,32 @@
 """
 Collection task lifecycle manager.
 Manages active collection tasks and routes incoming performance records.
+Records are handed over through a bounded queue and written by a dedicated
+consumer task, so proxied client streams never wait on file I/O or finalize.
+
+With AICP_WORKERS > 1 every uvicorn worker has its own manager. The task row in
+the DB is the shared state: workers poll it to attach to / detach from the
+running task, each writing its own shard, and the worker that stops the task
+claims it (running -> stopping), waits for the other shards and merges them.
 """
 
+import asyncio
 import json
+import time
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 from loguru import logger
 from sqlalchemy.orm import Session
 
 from ..config import settings
+from ..metrics.live import live_metrics
 from ..models.schemas import Task
 from .data_writer import PerformanceDataWriter
+from .qa_capture import QA_MODES, canonical_qa_mode
+from .sampling import SamplingPolicy
+from .shards import merge_sampling, merge_shards, read_markers, shard_id, write_marker, write_stopper
 
 
 class CollectionTaskManager:
@@ -25,6 +38,15 @@ class CollectionTaskManager:
         self._stop_type: Optional[str] = None
         self._stop_value: int = 0
         self._counter = 0
+        self._sampling = SamplingPolicy()
+        self._qa_mode = canonical_qa_mode(settings.QA_CAPTURE_MODE)
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._consumer: Optional[asyncio.Task] = None
+        self._auto_stop_task: Optional[asyncio.Task] = None
+        self._queue_stats = self._new_queue_stats()
+
+        self._shard: Optional[str] = shard_id() if settings.WORKERS > 1 else None
 
     def has_active_task(self) -> bool:
         return self._active_writer is not None
@@ -33,6 +55,53 @@ class CollectionTaskManager:
     def active_task_id(self) -> Optional[str]:
         return self._active_task_id
 
+    def should_collect(self, body: bytes = b"") -> bool:
+        """Sampling decision for one proxied request of the active task."""
+        return self._active_writer is not None and self._sampling.should_sample(body)
+
+    @property
+    def shard(self) -> Optional[str]:
+        return self._shard
+
+    @property
+    def qa_mode(self) -> str:
+        return self._qa_mode
+
+    @property
+    def sampling_status(self) -> dict:
+        return self._sampling.snapshot()
+
+    @property
+    def record_count(self) -> int:
+        """Records written so far, across all workers' shards."""
+        writer = self._active_writer
+        if writer is None:
+            return 0
+        if self._shard is None:
+            return writer.total_records
+        return sum(m.get("records", 0) for m in read_markers(writer.data_dir))
+
+    @property
+    def queue_status(self) -> dict:
+        return {
+            **self._queue_stats,
+            "depth": self._queue.qsize() if self._queue else 0,
+            "capacity": settings.STAT_QUEUE_SIZE,
+            "policy": settings.STAT_QUEUE_POLICY,
+        }
+
+    @property
+    def journal_status(self) -> Optional[dict]:
+        """Group-commit statistics of the active writer's journal."""
+        writer = self._active_writer
+        if writer is None or writer.journal is None:
+            return None
+        return writer.journal.stats
+
+    @staticmethod
+    def _new_queue_stats() -> dict:
+        return {"enqueued": 0, "dropped": 0, "blocked": 0, "max_depth": 0}
+
     def _next_id(self) -> str:
         self._counter += 1
         return f"collect_{self._counter:03d}"
@@ -50,45 +119,110 @@ class CollectionTaskManager:
                 pass
 
     async def start_task(
-        self, name: str, stop_type: str, stop_value: int, db: Session
+        self, name: str, stop_type: str, stop_value: int, db: Session,
+        sample_mode: str = "all", sample_value: float = 1.0, qa_mode: Optional[str] = None,
     ) -> dict:
         if self._active_writer:
             raise RuntimeError("A collection task is already running. Stop it first.")
+        if self._shard and db.query(Task).filter(
+            Task.type == "collect", Task.status.in_(("running", "stopping"))
+        ).first():
+            raise RuntimeError("A collection task is already running. Stop it first.")
+        sampling = SamplingPolicy(sample_mode, sample_value, workers=settings.WORKERS)
+        qa_mode = canonical_qa_mode(qa_mode or settings.QA_CAPTURE_MODE)
+        if qa_mode not in QA_MODES:
+            raise ValueError(f"qa_mode must be one of {QA_MODES}")
 
         self.sync_counter(db)
         task_id = self._next_id()
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         data_dir = settings.DATA_DIR / f"{task_id}_{timestamp}"
+        config = {
+            "stop_type": stop_type, "stop_value": stop_value,
+            "sample_mode": sample_mode, "sample_value": sample_value,
+            "qa_mode": qa_mode,
+        }
 
         task = Task(
             id=task_id,
             name=name,
             type="collect",
             status="running",
-            config=json.dumps({"stop_type": stop_type, "stop_value": stop_value}),
+            config=json.dumps(config),
             data_dir=str(data_dir),
             record_count=0,
         )
         db.add(task)
         db.commit()
 
-        writer = PerformanceDataWriter(task_id, data_dir)
-        writer.start_periodic_flush()
-        self._active_writer = writer
-        self._active_task_id = task_id
-        self._stop_type = stop_type
-        self._stop_value = stop_value
+        self._attach(task_id, data_dir, config, sampling)
 
-        logger.info(f"Collection task started: {task_id} ({stop_type}={stop_value})")
+        logger.info(
+            f"Collection task started: {task_id} ({stop_type}={stop_value}, "
+            f"sampling={sample_mode}:{sample_value}, qa={qa_mode})"
+        )
         return {"task_id": task_id, "data_dir": str(data_dir)}
 
     async def stop_task(self, task_id: str, db: Session):
+        if self._shard:
+            await self._stop_sharded(task_id, db)
+            return
         if self._active_task_id != task_id:
             raise ValueError(f"Task {task_id} is not the active task.")
 
-        await self._active_writer.finalize()
-        total = self._active_writer.total_records
+        writer = await self._detach()
+        await writer.finalize()
+        self._complete(task_id, writer.total_records, db)
+
+    def _attach(
+        self, task_id: str, data_dir: Path, config: dict, sampling: Optional[SamplingPolicy] = None,
+    ):
+        qa_mode = config.get("qa_mode") or settings.QA_CAPTURE_MODE
+        writer = PerformanceDataWriter(task_id, data_dir, qa_mode=qa_mode, shard=self._shard)
+        writer.on_flush = lambda: self._flushed(task_id, writer)
+        writer.start_periodic_flush()
+        live_metrics.start(task_id, _proxy_inflight)
+        self._queue = asyncio.Queue(maxsize=settings.STAT_QUEUE_SIZE)
+        self._queue_stats = self._new_queue_stats()
+        self._consumer = asyncio.create_task(self._consume(task_id, writer, self._queue))
+        self._sampling = sampling or SamplingPolicy(
+            config.get("sample_mode", "all"), config.get("sample_value", 1.0),
+            workers=settings.WORKERS,
+        )
+        self._qa_mode = writer.qa_mode
+        self._active_writer = writer
+        self._active_task_id = task_id
+        self._stop_type = config.get("stop_type")
+        self._stop_value = config.get("stop_value", 0)
+        if self._shard:
+            self._write_marker(writer, done=False)
+
+    async def _detach(self) -> Optional[PerformanceDataWriter]:
+        """
+        Stop taking records and drain the queue into the writer.
+        Shards are flushed and marked done here; the caller finalizes
+        a single-worker writer.
+        """
+        writer, queue, consumer = self._active_writer, self._queue, self._consumer
+        if writer is None:
+            return None
+        # Detach first: new records are ignored and a second stop call is rejected.
+        live_metrics.stop(self._active_task_id, writer.data_dir, self._shard)
+        self._active_writer = None
+        self._active_task_id = None
+
+        # Drain whatever is still queued before finalizing.
+        if not consumer.done():
+            await queue.put(None)
+        await consumer
+
+        writer.sampling = self._sampling.snapshot()
+        if self._shard:
+            await writer.finalize(summary=False)
+            self._write_marker(writer, done=True)
+        return writer
 
+    def _complete(self, task_id: str, total: int, db: Session):
         task = db.query(Task).filter(Task.id == task_id).first()
         if task:
             task.status = "completed"
@@ -96,25 +230,189 @@ class CollectionTaskManager:
             task.record_count = total
             db.commit()
 
-        logger.info(f"Collection task stopped: {task_id} (records: {total})")
-        self._active_writer = None
-        self._active_task_id = None
+        logger.info(
+            f"Collection task stopped: {task_id} (records: {total}, "
+            f"dropped: {self._queue_stats['dropped']})"
+        )
+
+    # ------------------------------------------------------------------
+    # Multi-worker coordination
+    # ------------------------------------------------------------------
+
+    async def shutdown(self):
+        if self._shard:
+            await self._detach()  # let the stopping worker merge what we have
+
+    async def sync(self):
+        """Join or leave the task started/stopped through another worker."""
+        from ..models.database import SessionLocal
+        db = SessionLocal()
+        try:
+            task = db.query(Task).filter(Task.type == "collect", Task.status == "running").first()
+            running = (task.id, Path(task.data_dir), json.loads(task.config or "{}")) if task else None
+        finally:
+            db.close()
+
+        if self._active_writer is not None:
+            if running is None or running[0] != self._active_task_id:
+                logger.info(f"[{self._active_task_id}] Task stopped elsewhere, closing shard {self._shard}")
+                await self._detach()
+            else:
+                live_metrics.save(self._active_task_id, self._active_writer.data_dir, self._shard)
+        elif running is not None:
+            logger.info(f"[{running[0]}] Joining collection task as shard {self._shard}")
+            self._attach(*running)
+
+    async def _stop_sharded(self, task_id: str, db: Session):
+        # Exactly one worker wins the running -> stopping transition.
+        claimed = db.query(Task).filter(Task.id == task_id, Task.status == "running").update(
+            {"status": "stopping"}, synchronize_session=False
+        )
+        db.commit()
+        if not claimed:
+            raise ValueError(f"Task {task_id} is not the active task.")
+        task = db.query(Task).filter(Task.id == task_id).first()
+        config = json.loads(task.config or "{}")
+        data_dir = Path(task.data_dir)
+        write_stopper(data_dir)
+
+        if self._active_task_id == task_id:
+            await self._detach()
+        markers = await self._wait_for_shards(data_dir)
+
+        # A shard still open may still be appending to its files: leave them alone
+        done = {m["shard"] for m in markers if m.get("done")}
+        pending = [m["shard"] for m in markers if not m.get("done")]
+        if pending:
+            logger.warning(f"[{task_id}] Merging without shards that did not finish, their files are kept: {pending}")
+        markers = [m for m in markers if m.get("done")]
+        # The merge rewrites every file of the task: off the event loop
+        total = await asyncio.get_running_loop().run_in_executor(
+            None, merge_shards, data_dir, settings.MAX_RECORDS_PER_FILE, settings.MAX_FILE_BYTES, done
+        )
+        writer = PerformanceDataWriter(
+            task_id, data_dir, qa_mode=config.get("qa_mode") or settings.QA_CAPTURE_MODE
+        )
+        writer.sampling = merge_sampling([m.get("sampling") for m in markers])
+        await writer.finalize()
+        self._queue_stats["dropped"] = sum(m.get("dropped", 0) for m in markers)
+        self._complete(task_id, total, db)
+
+    async def _wait_for_shards(self, data_dir: Path) -> List[dict]:
+        """Wait until every worker that joined the task has closed its shard, at most COLLECT_STOP_TIMEOUT."""
+        # A worker that saw the task running just before the claim writes its
+        # marker right away; one poll interval covers that window.
+        await asyncio.sleep(settings.WORKER_SYNC_INTERVAL)
+        deadline = time.monotonic() + settings.COLLECT_STOP_TIMEOUT
+        while True:
+            markers = read_markers(data_dir)
+            if all(m.get("done") for m in markers):
+                return markers
+            if time.monotonic() >= deadline:
+                return markers
+            await asyncio.sleep(settings.WORKER_SYNC_INTERVAL / 4)
+
+    def _write_marker(self, writer: PerformanceDataWriter, done: bool):
+        write_marker(
+            writer.data_dir, self._shard,
+            records=writer.total_records, done=done,
+            sampling=self._sampling.snapshot(), dropped=self._queue_stats["dropped"],
+        )
+
+    def add_record_nowait(self, stat: dict):
+        """
+        Queue a record without ever suspending; dropped if the queue is full.
+        Used from cancelled or closing proxy generators, which cannot await.
+        """
+        queue = self._queue
+        if not self._active_writer or queue is None:
+            return
+        if not self._put_nowait(queue, stat):
+            self._queue_stats["dropped"] += 1
 
     async def add_record(self, stat: dict):
-        if not self._active_writer:
+        """Queue a record for the active task without waiting on the writer."""
+        queue = self._queue
+        if not self._active_writer or queue is None:
+            return
+        if self._put_nowait(queue, stat):
+            return
+
+        qs = self._queue_stats
+        if settings.STAT_QUEUE_POLICY != "block":
+            qs["dropped"] += 1
             return
+        qs["blocked"] += 1
+        try:
+            await asyncio.wait_for(queue.put(stat), timeout=settings.FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            qs["dropped"] += 1
+            return
+        self._count_enqueued(queue)
+
+    def _put_nowait(self, queue: asyncio.Queue, stat: dict) -> bool:
+        try:
+            queue.put_nowait(stat)
+        except asyncio.QueueFull:
+            return False
+        self._count_enqueued(queue)
+        return True
 
-        await self._active_writer.add_record(stat)
+    def _count_enqueued(self, queue: asyncio.Queue):
+        qs = self._queue_stats
+        qs["enqueued"] += 1
+        depth = queue.qsize()
+        if depth > qs["max_depth"]:
+            qs["max_depth"] = depth
 
-        # Auto-stop if count limit reached
-        if self._stop_type == "count" and self._active_writer.total_records >= self._stop_value:
-            logger.info(f"Auto-stopping task {self._active_task_id}: count limit reached.")
-            from ..models.database import SessionLocal
-            db = SessionLocal()
+    async def _consume(self, task_id: str, writer: PerformanceDataWriter, queue: asyncio.Queue):
+        """Write queued records until the task is detached."""
+        live = live_metrics.get(task_id)
+        while True:
+            stat = await queue.get()
+            if stat is None:
+                return
+            live.observe(stat)
             try:
-                await self.stop_task(self._active_task_id, db)
-            finally:
-                db.close()
+                await writer.add_record(stat)
+            except Exception as e:
+                logger.error(f"[{task_id}] Failed to write record: {e}")
+
+    def _flushed(self, task_id: str, writer: PerformanceDataWriter):
+        """
+        Writer callback after each flushed batch (full buffer or periodic
+        tick): publish the shard's count and auto-stop once the count limit is
+        reached. Records that arrive until the stop are still written.
+        """
+        if self._active_writer is not writer:
+            return  # detached; the stop is already under way
+        total = writer.total_records
+        if self._shard:
+            self._write_marker(writer, done=False)
+            total = sum(m.get("records", 0) for m in read_markers(writer.data_dir))
+        if self._stop_type != "count" or total < self._stop_value:
+            return
+        if self._auto_stop_task is not None and not self._auto_stop_task.done():
+            return
+        logger.info(f"Auto-stopping task {task_id}: count limit reached.")
+        self._auto_stop_task = asyncio.create_task(self._auto_stop(task_id))
+
+    async def _auto_stop(self, task_id: str):
+        from ..models.database import SessionLocal
+        db = SessionLocal()
+        try:
+            await self.stop_task(task_id, db)
+        except ValueError:
+            pass  # already stopped manually
+        finally:
+            db.close()
+
+
+def _proxy_inflight() -> int:
+    """Requests currently in flight through this worker's proxy."""
+    from ..proxy.config_cache import active_proxy_config
+    pool = active_proxy_config.pool
+    return pool.outstanding if pool is not None else 0
 
 
 collection_manager = CollectionTaskManager()
@@ -9,6 +9,7 @@ from sqlalchemy.orm import Session
 
 from ..models.database import get_db
 from ..models.schemas import Task
+from ..utils.dataset_cache import cached_performance
 
 router = APIRouter(prefix="/api/compare", tags=["compare"])
 
@@ -17,12 +18,10 @@ def _load_df(task_id: str, db: Session) -> pd.DataFrame:
     task = db.query(Task).filter(Task.id == task_id).first()
     if not task or not task.data_dir:
         raise HTTPException(status_code=404, detail=f"Task {task_id} not found")
-    data_dir = Path(task.data_dir)
-    files = sorted(data_dir.glob("performance_data_*.csv"))
-    if not files:
+    df = cached_performance(Path(task.data_dir))
+    if df.empty:
         raise HTTPException(status_code=404, detail=f"No data for {task_id}")
-    dfs = [pd.read_csv(f) for f in files]
-    return pd.concat(dfs, ignore_index=True)
+    return df
 
 
 @router.get("")
@@ -8,11 +8,33 @@ class Settings(BaseSettings):
     PORT: int = 8080
     PROXY_PORT: int = 8081
 
+    # Workers
+    WORKERS: int = 1  # uvicorn worker processes; >1 shards collection per worker
+    WORKER_SYNC_INTERVAL: float = 1.0  # seconds between polls for other workers' changes
+    COLLECT_STOP_TIMEOUT: float = 30.0  # max wait for other workers' shards on stop
+
     # Data Storage
     DATA_DIR: Path = Path("/data/results")
     MAX_RECORDS_PER_FILE: int = 1000
+    MAX_FILE_BYTES: int = 0  # also rotate segments at this size; 0 = records only
+    DATA_COMPRESSION: str = "none"  # none | gzip | zstd (needs zstandard) for CSV segments
+    DATASET_CACHE_BYTES: int = 512 * 1024 * 1024  # task data kept in memory for the APIs; 0 = off
     FLUSH_INTERVAL: int = 5
     FLUSH_BATCH: int = 10
+    FLUSH_QA_BYTES: int = 8 * 1024 * 1024  # also flush once buffered QA text reaches this (characters)
+    JOURNAL: bool = True  # write-ahead journal of buffered records, replayed on startup
+    JOURNAL_COMMIT_MS: float = 50  # max delay before pending journal appends are fsynced
+    JOURNAL_COMMIT_BYTES: int = 1024 * 1024  # fsync early once this much is pending
+    QA_SEARCH_INDEX: bool = True  # FTS5 index of captured QA text (qa_index.db in the task dir)
+    QA_SEARCH_MAX_CHARS: int = 16384  # indexed per messages/response (head and tail halves); 0 = all
+    QA_INDEX_BACKLOG: int = 50000  # rows queued for the search index before batches wait for finalize; 0 = no limit
+    LIVE_WINDOW: int = 10  # seconds covered by /api/metrics/{task_id}/live
+    LIVE_INTERVAL: float = 1.0  # seconds between live metric events
+    STAT_QUEUE_SIZE: int = 10000  # records buffered between proxy and writer
+    STAT_QUEUE_POLICY: str = "drop"  # drop | block (backpressure onto the client stream)
+    QA_CAPTURE_MODE: str = "full"  # full | truncate | hash | jsonl | metrics
+    QA_TRUNCATE_CHARS: int = 2000
+    ITL_STALL_MS: float = 250.0  # inter-token gap counted as a decode stall
 
     # Database
     DATABASE_URL: str = ""
@@ -27,6 +49,31 @@ class Settings(BaseSettings):
     # Proxy
     PROXY_TIMEOUT: int = 300
     PROXY_MAX_CONNECTIONS: int = 500
+    SSE_PARSER: str = "orjson"  # orjson (selective) | stdlib (full json.loads)
+    PROXY_EJECT_FAILURES: int = 3  # consecutive connect errors before ejecting an upstream
+    PROXY_EJECT_SECONDS: int = 30
+    PROXY_AFFINITY_PREFIX_CHARS: int = 2048  # max bytes of the first message hashed for prefix_affinity
+    PROXY_AFFINITY_LOAD_FACTOR: float = 1.25  # bounded-load cap relative to average
+    PROXY_DISCONNECT_POLL: float = 0.5  # seconds between client-disconnect checks
+    PROXY_MAX_INFLIGHT: int = 0  # per-upstream concurrent requests; 0 = no admission control
+    PROXY_QUEUE_SIZE: int = 1000  # requests waiting for a slot before 503
+    PROXY_QUEUE_TIMEOUT: float = 30.0  # max seconds a request waits for a slot
+    PROXY_FAIR_QUEUING: bool = False  # round-robin free slots across clients
+    PROXY_CLIENT_HEADER: str = ""  # header identifying the client for fairness (default: client IP)
+    PROXY_HEDGE_AFTER_MS: float = 0  # hedge when no first chunk by then; 0 = off
+    PROXY_HEDGE_PERCENTILE: float = 0  # e.g. 95: use this percentile of recent first-chunk times
+    PROXY_HEDGE_MIN_SAMPLES: int = 50  # samples needed before the percentile is used
+    PROXY_HEDGE_WINDOW: int = 500  # first-chunk times kept for the percentile
+    PROXY_HEDGE_MAX_RATIO: float = 0.1  # max share of requests that may be hedged
+
+    # Response cache (keyed by a blake2b digest of the path and the raw body bytes)
+    RESPONSE_CACHE: bool = False
+    RESPONSE_CACHE_DETERMINISTIC_ONLY: bool = True  # only cache requests with temperature 0
+    RESPONSE_CACHE_MAX_ENTRIES: int = 1000
+    RESPONSE_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+    RESPONSE_CACHE_TTL: int = 3600  # seconds
+    RESPONSE_CACHE_REPLAY: str = "fast"  # fast | paced (recorded inter-chunk timing)
+    RESPONSE_CACHE_DISK: bool = False  # also keep entries in DATA_DIR/response_cache
 
     model_config = {"env_file": ".env", "env_prefix": "AICP_"}
 
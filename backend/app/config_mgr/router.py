@@ -1,10 +1,16 @@
+import json
+
 from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, field_validator
+from typing import List, Optional
 from sqlalchemy.orm import Session
 
 from ..models.database import get_db
 from ..models.schemas import ProxyConfig
+from ..proxy.config_cache import active_proxy_config
+from ..proxy.forwarder import proxy_forwarder
+from ..proxy.response_cache import response_cache
+from ..proxy.upstream import LB_POLICIES, parse_target
 
 router = APIRouter(prefix="/api/config", tags=["config"])
 
@@ -14,6 +20,8 @@ class ProxyConfigRequest(BaseModel):
     target_port: int
     api_type: str = "openai_compatible"
     custom_tokens_jsonpath: Optional[str] = None
+    upstreams: List[str] = []  # extra replicas as "host:port"; target is always included
+    lb_policy: str = "least_outstanding"  # round_robin | least_outstanding | prefix_affinity
 
 
 class ProxyConfigResponse(BaseModel):
@@ -22,13 +30,34 @@ class ProxyConfigResponse(BaseModel):
     target_port: int
     api_type: str
     custom_tokens_jsonpath: Optional[str]
+    upstreams: List[str] = []
+    lb_policy: Optional[str] = None
     is_active: bool
 
     model_config = {"from_attributes": True}
 
+    @field_validator("upstreams", mode="before")
+    @classmethod
+    def _parse_upstreams(cls, v):
+        if isinstance(v, str):
+            return json.loads(v)
+        return v or []
+
 
 @router.post("/proxy", response_model=ProxyConfigResponse)
 async def set_proxy_config(req: ProxyConfigRequest, db: Session = Depends(get_db)):
+    if req.lb_policy not in LB_POLICIES:
+        raise HTTPException(status_code=400, detail=f"lb_policy must be one of {LB_POLICIES}")
+    primary = f"{req.target_host}:{req.target_port}"
+    upstreams = [primary]
+    for target in req.upstreams:
+        try:
+            host, port = parse_target(target)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid upstream: {target}")
+        if f"{host}:{port}" not in upstreams:
+            upstreams.append(f"{host}:{port}")
+
     # Deactivate all existing configs
     db.query(ProxyConfig).update({"is_active": False})
 
@@ -37,11 +66,14 @@ async def set_proxy_config(req: ProxyConfigRequest, db: Session = Depends(get_db
         target_port=req.target_port,
         api_type=req.api_type,
         custom_tokens_jsonpath=req.custom_tokens_jsonpath,
+        upstreams=json.dumps(upstreams),
+        lb_policy=req.lb_policy,
         is_active=True,
     )
     db.add(config)
     db.commit()
     db.refresh(config)
+    active_proxy_config.refresh(db)
     return config
 
 
@@ -53,6 +85,27 @@ async def get_proxy_config(db: Session = Depends(get_db)):
     return config
 
 
+@router.get("/proxy/upstreams")
+async def get_upstream_status():
+    """Live per-upstream counters of the active pool."""
+    pool = active_proxy_config.pool
+    if not pool:
+        return {"lb_policy": None, "upstreams": []}
+    return {**pool.snapshot(), "hedging": proxy_forwarder.hedge.snapshot()}
+
+
+@router.get("/proxy/cache")
+async def get_response_cache_status():
+    """Response cache hit/miss counters and bytes saved."""
+    return response_cache.snapshot()
+
+
+@router.delete("/proxy/cache")
+async def clear_response_cache():
+    await response_cache.clear()
+    return response_cache.snapshot()
+
+
 @router.delete("/proxy/{config_id}")
 async def delete_proxy_config(config_id: int, db: Session = Depends(get_db)):
     config = db.query(ProxyConfig).filter(ProxyConfig.id == config_id).first()
@@ -60,4 +113,5 @@ async def delete_proxy_config(config_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Config not found")
     db.delete(config)
     db.commit()
+    active_proxy_config.refresh(db)
     return {"status": "deleted"}
@@ -4,9 +4,14 @@ from pathlib import Path
 from typing import Optional
 
 import pandas as pd
+from ..collect.qa_capture import qa_stream_files
+from ..collect.qa_index import search_qa
 from ..config import settings
 from ..models.database import get_db
 from ..models.schemas import Task
+from ..utils.dataset_cache import cached_performance
+from ..utils.perf_index import performance_page
+from ..utils.segments import QA_PREFIX, read_segments, renumber
 from sqlalchemy.orm import Session
 from fastapi import Depends
 
@@ -27,14 +32,6 @@ def _find_task_dir(task_id: str, db: Session) -> Path:
     raise HTTPException(status_code=404, detail=f"Task {task_id} data not found")
 
 
-def _read_all_csvs(data_dir: Path, pattern: str) -> pd.DataFrame:
-    files = sorted(data_dir.glob(pattern))
-    if not files:
-        return pd.DataFrame()
-    dfs = [pd.read_csv(f) for f in files]
-    return pd.concat(dfs, ignore_index=True)
-
-
 @router.get("/tasks")
 async def list_task_files(db: Session = Depends(get_db)):
     tasks = db.query(Task).order_by(Task.created_at.desc()).all()
@@ -69,15 +66,21 @@ async def get_performance_data(
     db: Session = Depends(get_db),
 ):
     task_dir = _find_task_dir(task_id, db)
-    df = _read_all_csvs(task_dir, "performance_data_*.csv")
+    start = (page - 1) * size
+    descending = sort_order != "asc"
+    result = performance_page(task_dir, start, size, sort_by, descending)
+    if result is not None:
+        total, df = result
+        return {"total": total, "page": page, "size": size, "items": df.to_dict("records")}
+
+    # No stored order for this column (running task): sort the whole frame
+    df = cached_performance(task_dir)
     if df.empty:
         return {"total": 0, "page": page, "size": size, "items": []}
-
     if sort_by and sort_by in df.columns:
-        df = df.sort_values(sort_by, ascending=(sort_order == "asc"))
+        df = df.sort_values(sort_by, ascending=not descending)
 
     total = len(df)
-    start = (page - 1) * size
     items = df.iloc[start : start + size].to_dict("records")
 
     return {"total": total, "page": page, "size": size, "items": items}
@@ -91,7 +94,14 @@ async def get_qa_data(
     db: Session = Depends(get_db),
 ):
     task_dir = _find_task_dir(task_id, db)
-    df = _read_all_csvs(task_dir, "qa_pairs_*.csv")
+    df = read_segments(task_dir, QA_PREFIX)
+    streams = qa_stream_files(task_dir) if df.empty else []
+    if streams:
+        df = pd.concat(
+            [pd.read_json(path, lines=True, compression="gzip") for path in streams], ignore_index=True
+        )
+        if len(streams) > 1:
+            renumber(df)
     if df.empty:
         return {"total": 0, "page": page, "size": size, "items": []}
 
@@ -102,6 +112,43 @@ async def get_qa_data(
     return {"total": total, "page": page, "size": size, "items": items}
 
 
+@router.get("/{task_id}/qa/search")
+async def search_qa_pairs(
+    task_id: str,
+    q: str = Query(..., min_length=1, description="FTS5 query over messages and response (terms of 3+ characters)"),
+    min_ttft_ms: Optional[float] = None,
+    max_ttft_ms: Optional[float] = None,
+    min_tpot_ms: Optional[float] = None,
+    max_tpot_ms: Optional[float] = None,
+    min_e2e_latency_ms: Optional[float] = None,
+    max_e2e_latency_ms: Optional[float] = None,
+    sort_by: str = "arrival_time",
+    sort_order: str = "asc",
+    page: int = Query(1, ge=1),
+    size: int = Query(20, ge=1, le=200),
+    db: Session = Depends(get_db),
+):
+    """QA pairs matching ``q`` with their performance rows, within the latency ranges given."""
+    task_dir = _find_task_dir(task_id, db)
+    ranges = {
+        "ttft_ms": (min_ttft_ms, max_ttft_ms),
+        "tpot_ms": (min_tpot_ms, max_tpot_ms),
+        "e2e_latency_ms": (min_e2e_latency_ms, max_e2e_latency_ms),
+    }
+    ranges = {col: bounds for col, bounds in ranges.items() if bounds != (None, None)}
+    try:
+        total, items = search_qa(
+            task_dir, q, ranges, sort_by, descending=(sort_order != "asc"),
+            offset=(page - 1) * size, limit=size,
+        )
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Task has no QA search index")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {"total": total, "page": page, "size": size, "items": items}
+
+
 @router.get("/{task_id}/summary")
 async def get_summary(task_id: str, db: Session = Depends(get_db)):
     task_dir = _find_task_dir(task_id, db)
@@ -1,3 +1,4 @@
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
@@ -7,6 +8,22 @@ from .config import settings
 from .models.database import init_db
 
 
+async def _follow_other_workers(recovery: asyncio.Task):
+    """AICP_WORKERS > 1: pick up proxy config and collection task changes made through other workers."""
+    from .collect.task_manager import collection_manager
+    from .proxy.config_cache import active_proxy_config
+
+    # Joining a task left running by a crash would make its dead shards look alive
+    await recovery
+    while True:
+        await asyncio.sleep(settings.WORKER_SYNC_INTERVAL)
+        try:
+            active_proxy_config.sync()
+            await collection_manager.sync()
+        except Exception as e:
+            logger.error(f"Worker sync failed: {e}")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Starting AICP Performance Testing Tool...")
@@ -15,12 +32,26 @@ async def lifespan(app: FastAPI):
     init_db()
     logger.info(f"Data directory: {settings.DATA_DIR}")
 
+    from .proxy.config_cache import active_proxy_config
+    active_proxy_config.refresh()
+
     # Initialize proxy forwarder
     from .proxy.forwarder import proxy_forwarder
     await proxy_forwarder.start()
 
+    # Finalize tasks interrupted by a crash (replays their journals)
+    from .collect.recovery import recover_interrupted_tasks
+    recovery = asyncio.create_task(recover_interrupted_tasks())
+
+    sync_task = asyncio.create_task(_follow_other_workers(recovery)) if settings.WORKERS > 1 else None
+
     yield
 
+    if sync_task:
+        sync_task.cancel()
+    recovery.cancel()
+    from .collect.task_manager import collection_manager
+    await collection_manager.shutdown()
     await proxy_forwarder.stop()
     logger.info("Shutdown complete.")
 
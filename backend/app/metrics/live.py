@@ -0,0 +1,185 @@
+"""
+Live metrics of running collection and benchmark tasks.
+
+Records are added as they arrive (collection consumer, benchmark runner) into
+per-second buckets holding request/token counts and TTFT/TPOT/E2E sketches, so
+a snapshot over the last LIVE_WINDOW seconds only merges a few small buckets.
+``GET /api/metrics/{task_id}/live`` pushes a snapshot every LIVE_INTERVAL
+seconds as server-sent events.
+
+With AICP_WORKERS > 1 every worker dumps its window into the task directory
+(``.live_w<pid>.json``) once per sync interval, and snapshots merge the other
+workers' dumps with the local window. A worker that runs no window of the
+task (a benchmark runs in one worker only) serves the merged dumps alone;
+dumps not refreshed for a while are those of a worker that went away.
+"""
+
+import json
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional
+
+from ..config import settings
+from ..utils.sketch import DDSketch
+
+LIVE_METRICS = ("ttft_ms", "tpot_ms", "e2e_latency_ms")
+
+
+class _Second:
+    __slots__ = ("requests", "tokens", "sketches")
+
+    def __init__(self):
+        self.requests = 0
+        self.tokens = 0
+        self.sketches = {name: DDSketch() for name in LIVE_METRICS}
+
+    def to_dict(self) -> dict:
+        return {
+            "requests": self.requests, "tokens": self.tokens,
+            "sketches": {name: s.to_dict() for name, s in self.sketches.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "_Second":
+        bucket = cls()
+        bucket.requests = data["requests"]
+        bucket.tokens = data["tokens"]
+        bucket.sketches = {name: DDSketch.from_dict(s) for name, s in data["sketches"].items()}
+        return bucket
+
+
+class LiveWindow:
+    """Rolling per-second window over the records of one task."""
+
+    def __init__(self, task_id: str, inflight: Callable[[], int] = lambda: 0):
+        self.task_id = task_id
+        self.inflight = inflight
+        self.started = time.time()
+        self.records = 0
+        self._seconds: "OrderedDict[int, _Second]" = OrderedDict()
+
+    def observe(self, stat: dict, now: Optional[float] = None):
+        second = int(now if now is not None else time.time())
+        bucket = self._seconds.get(second)
+        if bucket is None:
+            bucket = self._seconds[second] = _Second()
+            self._evict(second)
+        self.records += 1
+        bucket.requests += 1
+        bucket.tokens += int(stat.get("completion_tokens") or 0)
+        # Partial (aborted) and replayed (cache hit) timings stay out of the percentiles
+        if not stat.get("aborted") and not stat.get("cache_hit"):
+            for name, sketch in bucket.sketches.items():
+                sketch.add(float(stat.get(name) or 0))
+
+    def _evict(self, second: int):
+        oldest = second - settings.LIVE_WINDOW
+        while self._seconds and next(iter(self._seconds)) <= oldest:
+            self._seconds.popitem(last=False)
+
+    def dump(self) -> dict:
+        return {
+            "records": self.records,
+            "inflight": self.inflight(),
+            "started": self.started,
+            "seconds": {str(s): b.to_dict() for s, b in self._seconds.items()},
+        }
+
+    def snapshot(self, others: Iterable[dict] = (), now: Optional[float] = None) -> dict:
+        """Window statistics, merged with other workers' dumps."""
+        now = now if now is not None else time.time()
+        first = int(now) - settings.LIVE_WINDOW + 1
+        merged = _Second()
+        records, inflight, started = self.records, self.inflight(), self.started
+
+        buckets = [b for s, b in self._seconds.items() if s >= first]
+        for other in others:
+            records += other["records"]
+            inflight += other["inflight"]
+            started = min(started, other["started"])
+            buckets.extend(
+                _Second.from_dict(b) for s, b in other["seconds"].items() if int(s) >= first
+            )
+        for bucket in buckets:
+            merged.requests += bucket.requests
+            merged.tokens += bucket.tokens
+            for name, sketch in merged.sketches.items():
+                sketch.merge(bucket.sketches[name])
+
+        span = max(now - max(first, started), 1e-3)
+        result = {
+            "task_id": self.task_id,
+            "timestamp": round(now, 3),
+            "window_s": settings.LIVE_WINDOW,
+            "records": records,
+            "inflight": inflight,
+            "requests_per_s": round(merged.requests / span, 2),
+            "output_tokens_per_s": round(merged.tokens / span, 2),
+        }
+        for name, sketch in merged.sketches.items():
+            result[name] = sketch.stats()
+        return result
+
+
+class LiveMetrics:
+    """Live windows of the tasks running in this worker."""
+
+    def __init__(self):
+        self._windows: Dict[str, LiveWindow] = {}
+
+    def start(self, task_id: str, inflight: Callable[[], int] = lambda: 0) -> LiveWindow:
+        self._windows[task_id] = LiveWindow(task_id, inflight)
+        return self._windows[task_id]
+
+    def get(self, task_id: str) -> Optional[LiveWindow]:
+        return self._windows.get(task_id)
+
+    def stop(self, task_id: str, data_dir: Optional[Path] = None, shard: Optional[str] = None):
+        self._windows.pop(task_id, None)
+        if data_dir is not None and shard:
+            live_path(data_dir, shard).unlink(missing_ok=True)
+
+    def save(self, task_id: str, data_dir: Path, shard: str):
+        """Dump this worker's window for the other workers (sharded tasks)."""
+        window = self._windows.get(task_id)
+        if window is None:
+            return
+        path = live_path(data_dir, shard)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(window.dump(), f)
+        os.replace(tmp, path)
+
+    def snapshot(
+        self, task_id: str, data_dir: Optional[Path] = None, shard: Optional[str] = None,
+    ) -> Optional[dict]:
+        """Current window of a running task (None once it has finished)."""
+        window = self._windows.get(task_id)
+        others = []
+        if data_dir is not None and settings.WORKERS > 1:
+            own = live_path(data_dir, shard).name if shard else None
+            stale = time.time() - max(settings.LIVE_WINDOW, 5 * settings.WORKER_SYNC_INTERVAL)
+            for path in data_dir.glob(".live_*.json"):
+                if path.name == own:
+                    continue
+                try:
+                    if path.stat().st_mtime < stale:
+                        continue
+                    with open(path, "r", encoding="utf-8") as f:
+                        others.append(json.load(f))
+                except (OSError, ValueError):
+                    continue  # being replaced
+        if window is None:
+            if not others:
+                return None
+            window = LiveWindow(task_id)  # the task runs in other workers only
+        return window.snapshot(others)
+
+
+def live_path(data_dir: Path, shard: str) -> Path:
+    return data_dir / f".live_{shard}.json"
+
+
+live_metrics = LiveMetrics()
@@ -1,28 +1,57 @@
+import asyncio
+import json
+
 import pandas as pd
 import numpy as np
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 from pathlib import Path
+from typing import Optional
 from sqlalchemy.orm import Session
 
+from ..collect.task_manager import collection_manager
 from ..config import settings
 from ..models.database import get_db
 from ..models.schemas import Task
+from ..utils.itl import ITL_FILE, iter_itl_records, request_key
+from ..utils.dataset_cache import cached_performance
+from ..utils.sketch import load_task_sketch
+from .live import live_metrics
 
 router = APIRouter(prefix="/api/metrics", tags=["metrics"])
 
 
-def _load_perf_df(task_id: str, db: Session) -> pd.DataFrame:
+def _task_dir(task_id: str, db: Session) -> Path:
     task = db.query(Task).filter(Task.id == task_id).first()
     if not task or not task.data_dir:
         raise HTTPException(status_code=404, detail="Task not found")
     data_dir = Path(task.data_dir)
     if not data_dir.exists():
         raise HTTPException(status_code=404, detail="Data directory not found")
-    files = sorted(data_dir.glob("performance_data_*.csv"))
-    if not files:
+    return data_dir
+
+
+def _load_perf_df(task_id: str, db: Session) -> pd.DataFrame:
+    df = cached_performance(_task_dir(task_id, db))
+    if df.empty:
         raise HTTPException(status_code=404, detail="No performance data")
-    dfs = [pd.read_csv(f) for f in files]
-    return pd.concat(dfs, ignore_index=True)
+    return df
+
+
+def _flag_count(df: pd.DataFrame, col: str) -> int:
+    return int(df[col].fillna(0).sum()) if col in df.columns else 0
+
+
+def _completed(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Drop client-aborted requests (partial timings) and response-cache hits
+    (no upstream involved) unless nothing else is left.
+    """
+    keep = pd.Series(True, index=df.index)
+    for col in ("aborted", "cache_hit"):
+        if col in df.columns:
+            keep &= df[col].fillna(0) == 0
+    return df[keep] if keep.any() else df
 
 
 def _histogram(series: pd.Series, bins: list, labels: list) -> list:
@@ -33,7 +62,7 @@ def _histogram(series: pd.Series, bins: list, labels: list) -> list:
 
 @router.get("/{task_id}/distributions")
 async def get_distributions(task_id: str, db: Session = Depends(get_db)):
-    df = _load_perf_df(task_id, db)
+    df = _completed(_load_perf_df(task_id, db))
 
     context_length = _histogram(
         df["prompt_tokens"],
@@ -62,9 +91,40 @@ async def get_distributions(task_id: str, db: Session = Depends(get_db)):
     }
 
 
+def _sketch_summary(data_dir: Path) -> Optional[dict]:
+    """Summary from the task's persisted quantile sketches (O(1) in the record count)."""
+    sketch = load_task_sketch(data_dir)
+    if sketch is None or not sketch.total:
+        return None
+    full = sketch.summary()
+    stats = full.pop("summary")
+    result = {k: v for k, v in full.items() if k != "time_range"}
+    for col in ("ttft_ms", "tpot_ms", "tps", "e2e_latency_ms", "queue_wait_ms", "itl_p99_ms"):
+        result[col] = stats[col]
+    result["stall_count"] = stats["stall_count"]["total"]
+    return result
+
+
 @router.get("/{task_id}/summary")
 async def get_metrics_summary(task_id: str, db: Session = Depends(get_db)):
-    df = _load_perf_df(task_id, db)
+    data_dir = _task_dir(task_id, db)
+    result = _sketch_summary(data_dir)
+    if result is None:
+        result = _summary_from_records(task_id, db)
+
+    summary_file = data_dir / "performance_summary.json"
+    if summary_file.exists():
+        with open(summary_file, "r", encoding="utf-8") as f:
+            sampling = json.load(f).get("sampling")
+        if sampling:
+            result["sampling"] = sampling
+    return result
+
+
+def _summary_from_records(task_id: str, db: Session) -> dict:
+    """Exact summary from the records, for tasks recorded without a sketch."""
+    all_df = _load_perf_df(task_id, db)
+    df = _completed(all_df)
 
     def s(col):
         series = df[col]
@@ -77,10 +137,137 @@ async def get_metrics_summary(task_id: str, db: Session = Depends(get_db)):
             "max": round(float(series.max()), 2),
         }
 
-    return {
-        "total_requests": len(df),
+    result = {
+        "total_requests": len(all_df),
+        "aborted_requests": _flag_count(all_df, "aborted"),
+        "cache_hits": _flag_count(all_df, "cache_hit"),
+        "hedged_requests": _flag_count(all_df, "hedged"),
+        "hedge_wins": int((all_df["attempt"] == 2).sum()) if "attempt" in all_df.columns else 0,
         "ttft_ms": s("ttft_ms"),
         "tpot_ms": s("tpot_ms"),
         "tps": s("tps"),
         "e2e_latency_ms": s("e2e_latency_ms"),
     }
+    if "queue_wait_ms" in df.columns:
+        df["queue_wait_ms"] = df["queue_wait_ms"].fillna(0)
+        result["queue_wait_ms"] = s("queue_wait_ms")
+    if "stall_count" in df.columns:
+        df["itl_p99_ms"] = df["itl_p99_ms"].fillna(0)
+        df["stall_count"] = df["stall_count"].fillna(0)
+        result["itl_p99_ms"] = s("itl_p99_ms")
+        result["stall_count"] = int(df["stall_count"].sum())
+    return result
+
+
+@router.get("/{task_id}/live")
+async def stream_live_metrics(task_id: str, db: Session = Depends(get_db)):
+    """
+    Server-sent events for a running task: every LIVE_INTERVAL seconds, the
+    throughput, in-flight count and TTFT/TPOT/E2E percentiles of the last
+    LIVE_WINDOW seconds. Ends with an ``end`` event when the task finishes.
+    """
+    data_dir = _task_dir(task_id, db)
+    shard = collection_manager.shard
+    if live_metrics.snapshot(task_id, data_dir, shard) is None:
+        raise HTTPException(status_code=404, detail="Task is not running")
+
+    async def events():
+        while True:
+            snapshot = live_metrics.snapshot(task_id, data_dir, shard)
+            if snapshot is None:
+                yield f"event: end\ndata: {json.dumps({'task_id': task_id})}\n\n"
+                return
+            yield f"data: {json.dumps(snapshot)}\n\n"
+            await asyncio.sleep(settings.LIVE_INTERVAL)
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"},
+    )
+
+
+@router.get("/{task_id}/itl")
+async def get_itl(task_id: str, request_id: str = None, db: Session = Depends(get_db)):
+    """
+    Inter-token latency from the per-token sidecar.
+    With request_id: that request's token offsets and gaps; otherwise the
+    pooled gap distribution over every token of the task.
+    """
+    path = _task_dir(task_id, db) / ITL_FILE
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="No ITL data")
+
+    if request_id:
+        key = request_key(request_id)
+        for rec_key, offsets in iter_itl_records(path):
+            if rec_key == key:
+                offsets = offsets.astype(np.float64)
+                gaps = np.diff(offsets)
+                return {
+                    "request_id": request_id,
+                    "token_offsets_ms": np.round(offsets, 2).tolist(),
+                    "itl_ms": np.round(gaps, 2).tolist(),
+                    "max_stall_ms": round(float(gaps.max()), 2) if len(gaps) else 0,
+                    "stall_count": int((gaps > settings.ITL_STALL_MS).sum()),
+                }
+        raise HTTPException(status_code=404, detail="Request not found in ITL data")
+
+    gaps_list = []
+    stalled_requests = 0
+    requests = 0
+    for _, offsets in iter_itl_records(path):
+        requests += 1
+        if len(offsets) < 2:
+            continue
+        gaps = np.diff(offsets.astype(np.float64))
+        gaps_list.append(gaps)
+        if (gaps > settings.ITL_STALL_MS).any():
+            stalled_requests += 1
+    if not gaps_list:
+        return {"requests": requests, "tokens": 0}
+
+    gaps = np.concatenate(gaps_list)
+    p50, p90, p99 = np.percentile(gaps, [50, 90, 99])
+    return {
+        "requests": requests,
+        "tokens": int(len(gaps) + len(gaps_list)),
+        "itl_ms": {
+            "avg": round(float(gaps.mean()), 2),
+            "p50": round(float(p50), 2),
+            "p90": round(float(p90), 2),
+            "p99": round(float(p99), 2),
+            "max": round(float(gaps.max()), 2),
+        },
+        "stall_threshold_ms": settings.ITL_STALL_MS,
+        "stall_count": int((gaps > settings.ITL_STALL_MS).sum()),
+        "requests_with_stalls": stalled_requests,
+    }
+
+
+@router.get("/{task_id}/upstreams")
+async def get_upstream_breakdown(task_id: str, db: Session = Depends(get_db)):
+    """Per-replica latency breakdown (records tagged with their upstream)."""
+    df = _load_perf_df(task_id, db)
+    if "upstream" not in df.columns:
+        return []
+    df["upstream"] = df["upstream"].fillna("")
+
+    def s(series):
+        return {
+            "avg": round(float(series.mean()), 2),
+            "p50": round(float(series.quantile(0.5)), 2),
+            "p99": round(float(series.quantile(0.99)), 2),
+        }
+
+    return [
+        {
+            "upstream": upstream,
+            "requests": len(g),
+            "ttft_ms": s(g["ttft_ms"]),
+            "tpot_ms": s(g["tpot_ms"]),
+            "e2e_latency_ms": s(g["e2e_latency_ms"]),
+            "cache_hit_rate": round(
+                float(g["cached_tokens"].sum() / max(g["prompt_tokens"].sum(), 1)), 4
+            ),
+        }
+        for upstream, g in df.groupby("upstream", sort=True)
+    ]
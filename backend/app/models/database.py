@@ -1,4 +1,6 @@
-from sqlalchemy import create_engine
+import fcntl
+
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.orm import sessionmaker, Session, declarative_base
 from typing import Generator
 from ..config import settings
@@ -18,9 +20,27 @@ def init_db():
         echo=False,
     )
     SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-    Base.metadata.create_all(bind=engine)
 
-    _ensure_admin_user()
+    # uvicorn workers start together; only one may create/migrate at a time
+    with open(settings.DATA_DIR / ".init_db.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        Base.metadata.create_all(bind=engine)
+        _add_missing_columns()
+
+        _ensure_admin_user()
+
+
+def _add_missing_columns():
+    """create_all() does not alter existing tables; add columns introduced since."""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {col_type}'))
 
 
 def _ensure_admin_user():
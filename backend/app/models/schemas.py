@@ -24,6 +24,8 @@ class ProxyConfig(Base):
     target_port = Column(Integer, nullable=False)
     api_type = Column(String(32), default="openai_compatible")
     custom_tokens_jsonpath = Column(String(256), nullable=True)
+    upstreams = Column(Text, nullable=True)  # JSON list of "host:port"; empty = target only
+    lb_policy = Column(String(32), default="least_outstanding")  # round_robin | least_outstanding | prefix_affinity
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=utcnow)
 
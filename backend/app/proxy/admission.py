@@ -0,0 +1,161 @@
+"""
+Admission control in front of the upstream pool.
+
+With PROXY_MAX_INFLIGHT > 0 each upstream serves at most that many concurrent
+requests; the rest wait in a bounded queue (PROXY_QUEUE_SIZE) for up to
+PROXY_QUEUE_TIMEOUT seconds. A freed slot is handed straight to the next
+waiter, in arrival order or, with PROXY_FAIR_QUEUING, round-robin across
+clients so one busy client cannot starve the others. A waiter that cannot use
+the free slot (it excludes that upstream after a failed attempt) is passed
+over, and a new request takes a free slot no waiter can use.
+"""
+
+import asyncio
+from collections import OrderedDict, deque
+from typing import Optional
+
+from ..config import settings
+
+
+class AdmissionRejected(Exception):
+    """The wait queue is full or the wait timed out."""
+
+
+class _Waiter:
+    __slots__ = ("client", "exclude", "key", "future")
+
+    def __init__(self, client: str, exclude, key: Optional[bytes], future: asyncio.Future):
+        self.client = client
+        self.exclude = exclude
+        self.key = key
+        self.future = future
+
+
+class AdmissionController:
+    """Per-upstream in-flight limit with a bounded (optionally fair) wait queue."""
+
+    def __init__(self, pool, limit: int, queue_size: int, timeout: float, fair: bool = False):
+        self.pool = pool
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.fair = fair
+        self._queues: "OrderedDict[str, deque]" = OrderedDict()
+        self._waiting = 0
+
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.max_depth = 0
+
+    @classmethod
+    def from_settings(cls, pool) -> Optional["AdmissionController"]:
+        if settings.PROXY_MAX_INFLIGHT <= 0:
+            return None
+        return cls(
+            pool,
+            limit=settings.PROXY_MAX_INFLIGHT,
+            queue_size=settings.PROXY_QUEUE_SIZE,
+            timeout=settings.PROXY_QUEUE_TIMEOUT,
+            fair=settings.PROXY_FAIR_QUEUING,
+        )
+
+    async def acquire(self, exclude=(), key: Optional[bytes] = None, client: str = ""):
+        """
+        Wait for a slot on an upstream. Returns None when every upstream is
+        excluded; raises AdmissionRejected when the queue is full or times out.
+        """
+        if not self.pool.has_candidates(exclude):
+            return None
+        if self._waiting:
+            self._wake()  # queued requests first
+        upstream = self.pool.acquire(exclude, key, limit=self.limit)
+        if upstream is not None:
+            self.admitted += 1
+            return upstream
+        if self._waiting >= self.queue_size:
+            self.rejected += 1
+            raise AdmissionRejected(f"Proxy queue full ({self.queue_size} waiting)")
+
+        waiter = _Waiter(
+            client if self.fair else "", exclude, key,
+            asyncio.get_running_loop().create_future(),
+        )
+        self._queues.setdefault(waiter.client, deque()).append(waiter)
+        self._waiting += 1
+        self.queued += 1
+        if self._waiting > self.max_depth:
+            self.max_depth = self._waiting
+
+        try:
+            await asyncio.wait((waiter.future,), timeout=self.timeout)
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        if not waiter.future.done():
+            self._abandon(waiter)
+            self.timed_out += 1
+            raise AdmissionRejected(f"Waited more than {self.timeout}s in the proxy queue")
+        self.admitted += 1
+        return waiter.future.result()
+
+    def release(self, upstream):
+        upstream.release()
+        self._wake()
+
+    def snapshot(self) -> dict:
+        return {
+            "max_inflight": self.limit,
+            "waiting": self._waiting,
+            "queue_size": self.queue_size,
+            "fair": self.fair,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "max_depth": self.max_depth,
+        }
+
+    # ------------------------------------------------------------------
+    # Internal
+    # ------------------------------------------------------------------
+
+    def _wake(self):
+        """Hand free slots to waiters (next client in turn when fair)."""
+        queues = self._queues
+        while queues and any(u.outstanding < self.limit for u in self.pool.upstreams):
+            for client, queue in queues.items():
+                waiter, upstream = self._place(queue)
+                if waiter is not None:
+                    break
+            else:
+                return  # no waiter can use the free slots
+            queue.remove(waiter)
+            if queue:
+                queues.move_to_end(client)
+            else:
+                del queues[client]
+            self._waiting -= 1
+            waiter.future.set_result(upstream)
+
+    def _place(self, queue: deque):
+        """The first waiter of ``queue`` that gets a slot, with its upstream."""
+        for waiter in queue:
+            upstream = self.pool.acquire(waiter.exclude, waiter.key, limit=self.limit)
+            if upstream is not None:
+                return waiter, upstream
+        return None, None
+
+    def _abandon(self, waiter: _Waiter):
+        if waiter.future.done():
+            # Granted a slot just as the wait ended: give it to the next waiter.
+            self.release(waiter.future.result())
+            return
+        waiter.future.cancel()
+        queue = self._queues.get(waiter.client)
+        if queue is not None:
+            queue.remove(waiter)
+            if not queue:
+                del self._queues[waiter.client]
+        self._waiting -= 1
@@ -0,0 +1,95 @@
+"""
+In-memory copy of the active proxy configuration.
+The proxy hot path reads it without touching the database; config endpoints
+refresh it after every change. With several uvicorn workers, the others pick
+the change up through sync().
+"""
+
+import json
+from typing import Optional
+
+from loguru import logger
+from sqlalchemy.orm import Session
+
+from ..models.schemas import ProxyConfig
+from .upstream import UpstreamPool, parse_target
+
+
+class ActiveProxyConfig:
+    """Holds the detached active ProxyConfig row and its upstream pool."""
+
+    def __init__(self):
+        self._config: Optional[ProxyConfig] = None
+        self._pool: Optional[UpstreamPool] = None
+        self._loaded = False
+
+    def get(self) -> Optional[ProxyConfig]:
+        if not self._loaded:
+            self.refresh()
+        return self._config
+
+    @property
+    def pool(self) -> Optional[UpstreamPool]:
+        if not self._loaded:
+            self.refresh()
+        return self._pool
+
+    def refresh(self, db: Optional[Session] = None):
+        """Reload from the database (uses its own session when db is None)."""
+        from ..models.database import SessionLocal
+
+        own_session = db is None
+        if own_session:
+            db = SessionLocal()
+        try:
+            config = db.query(ProxyConfig).filter(ProxyConfig.is_active == True).first()
+            if config is not None:
+                db.expunge(config)
+            if config is None:
+                self._pool = None
+            elif self._pool is None or self._config is None or self._config.id != config.id:
+                self._pool = build_pool(config)
+            self._config = config
+            self._loaded = True
+        finally:
+            if own_session:
+                db.close()
+
+        if config:
+            targets = ", ".join(u.key for u in self._pool.upstreams)
+            logger.info(f"Active proxy targets ({self._pool.policy}): {targets}")
+        else:
+            logger.info("No active proxy target configured.")
+
+    def sync(self):
+        """Refresh if another worker switched the active config (id check only)."""
+        from ..models.database import SessionLocal
+
+        db = SessionLocal()
+        try:
+            row = db.query(ProxyConfig.id).filter(ProxyConfig.is_active == True).first()
+            active_id = row[0] if row else None
+            current_id = self._config.id if self._config else None
+            if not self._loaded or active_id != current_id:
+                self.refresh(db)
+        finally:
+            db.close()
+
+    def invalidate(self):
+        self._loaded = False
+
+
+def config_targets(config: ProxyConfig) -> list:
+    """Configured upstreams as "host:port" strings (the primary target if none)."""
+    targets = json.loads(config.upstreams) if config.upstreams else []
+    return targets or [f"{config.target_host}:{config.target_port}"]
+
+
+def build_pool(config: ProxyConfig) -> UpstreamPool:
+    return UpstreamPool(
+        [parse_target(t) for t in config_targets(config)],
+        policy=config.lb_policy or "least_outstanding",
+    )
+
+
+active_proxy_config = ActiveProxyConfig()
@@ -2,20 +2,33 @@
 Core proxy forwarding layer.
 Adapted from llm-inference-forward (OpenAI-Forward) project.
 Handles transparent request forwarding with SSE streaming and performance metrics extraction.
+
+While a response is being relayed, a watcher polls the client connection; on
+disconnect the upstream response is closed (not drained), so the inference
+server can stop generating. Collected requests cut short this way are recorded
+with ``aborted=1`` and the timings observed up to that point.
 """
 
 import asyncio
 import json
 import time
 import uuid
-from typing import Optional, Dict, Any
+from typing import Optional
 
 import aiohttp
 from fastapi import Request
 from loguru import logger
 from starlette.responses import StreamingResponse, Response
 
+from ..collect.qa_capture import shape_messages, shape_response
 from ..config import settings
+from ..utils.sse import SSEFramer
+from ..utils.stream_metrics import StreamMetrics
+from .admission import AdmissionRejected
+from .hedge import ClientGone, HedgePolicy, PrimedResponse
+from .payload import force_stream_usage
+from .response_cache import response_cache
+from .upstream import Upstream, UpstreamPool, affinity_key
 
 
 class ProxyForwarder:
@@ -23,6 +36,7 @@ class ProxyForwarder:
 
     def __init__(self):
         self.client: Optional[aiohttp.ClientSession] = None
+        self.hedge = HedgePolicy()
 
     async def start(self):
         timeout = aiohttp.ClientTimeout(total=settings.PROXY_TIMEOUT)
@@ -40,23 +54,23 @@ class ProxyForwarder:
     async def forward(
         self,
         request: Request,
-        target_host: str,
-        target_port: int,
+        pool: UpstreamPool,
         path: str,
         collect_metrics: bool = False,
+        qa_mode: str = "full",
     ) -> Response:
         """
-        Forward request to target and optionally collect metrics.
+        Forward request to an upstream from the pool and optionally collect metrics.
 
         When collect_metrics is True:
         - Force stream=true + stream_options.include_usage=true
         - Extract TTFT, TPOT, TPS, token counts, cache hits from SSE chunks
         - If original request was non-stream, reassemble into single JSON response
+        - Keep only as much prompt/response content as qa_mode needs
         """
         request_id = str(uuid.uuid4())
         arrival_time = time.time()
         body = await request.body()
-        target_url = f"http://{target_host}:{target_port}{path}"
 
         # Prepare headers (remove hop-by-hop)
         fwd_headers = {}
@@ -64,65 +78,79 @@ class ProxyForwarder:
             if k.lower() not in ("host", "content-length", "transfer-encoding"):
                 fwd_headers[k] = v
 
-        # Parse payload for stream manipulation
+        # Splice stream options into the body without re-serializing it
         original_stream = True
         original_include_usage = False
         force_conversion = False
-        payload_dict = None
+        rewrite = None
 
         if collect_metrics and body:
             try:
-                payload_dict = json.loads(body)
-                original_stream = payload_dict.get("stream", False)
-
-                # Force streaming for metrics collection
-                payload_dict["stream"] = True
-                if not isinstance(payload_dict.get("stream_options"), dict):
-                    payload_dict["stream_options"] = {}
-                original_include_usage = payload_dict["stream_options"].get(
-                    "include_usage", False
-                )
-                payload_dict["stream_options"]["include_usage"] = True
-
-                if not original_stream:
-                    force_conversion = True
-
-                body = json.dumps(payload_dict).encode("utf-8")
-            except (json.JSONDecodeError, AttributeError):
+                rewrite = force_stream_usage(body)
+                original_stream = rewrite["stream"]
+                original_include_usage = rewrite["include_usage"]
+                force_conversion = not original_stream
+                body = rewrite["body"]
+            except ValueError:
                 collect_metrics = False
 
         fwd_headers["content-length"] = str(len(body))
 
-        try:
-            resp = await self.client.request(
-                method=request.method,
-                url=target_url,
-                data=body,
-                headers=fwd_headers,
-            )
-        except Exception as e:
-            logger.error(f"Proxy forward failed: {e}")
-            return Response(
-                content=json.dumps({"error": str(e)}),
-                status_code=502,
-                media_type="application/json",
-            )
+        cache_key = None
+        if response_cache.enabled and "no-cache" not in request.headers.get("cache-control", ""):
+            if rewrite:
+                cache_key = response_cache.key(request.method, path, body, rewrite["temperature"])
+            else:
+                cache_key = response_cache.key(request.method, path, body)
+        cached = await response_cache.get(cache_key) if cache_key else None
+
+        attempt, hedged = 1, False
+        if cached is not None:
+            resp, upstream, queue_wait = response_cache.replay(cached), None, 0.0
+        else:
+            opened = await self._open_upstream(request, pool, path, body, fwd_headers)
+            if isinstance(opened, Response):
+                return opened
+            resp, upstream, queue_wait, sent_at = opened
+            if self._hedgeable(request, pool, resp, streamed=rewrite is not None):
+                try:
+                    resp, upstream, sent_at, attempt, hedged = await self._hedged(
+                        request, pool, path, body, fwd_headers, resp, upstream, sent_at
+                    )
+                except ClientGone as e:
+                    logger.info(f"Proxy request abandoned: {e}")
+                    return Response(status_code=499)
+                except Exception as e:
+                    return self._error_response(e)
+            if cache_key and resp.status == 200:
+                resp = response_cache.record(resp, cache_key, sent_at)
 
         if not collect_metrics:
             return StreamingResponse(
-                content=self._passthrough(resp),
+                content=self._passthrough(request, resp, pool, upstream),
                 status_code=resp.status,
                 media_type=resp.content_type,
             )
 
         # Metrics collection path
+        messages, messages_chars = shape_messages(
+            rewrite["messages"] if rewrite else [], qa_mode, settings.QA_TRUNCATE_CHARS
+        )
         meta = {
             "request_id": request_id,
             "arrival_time": arrival_time,
-            "model": payload_dict.get("model", "unknown") if payload_dict else "unknown",
-            "messages": payload_dict.get("messages", []) if payload_dict else [],
+            "model": rewrite["model"] if rewrite else "unknown",
+            "messages": messages,
+            "messages_chars": messages_chars,
+            "qa_mode": qa_mode,
             "original_stream": original_stream,
             "original_include_usage": original_include_usage,
+            "upstream": upstream,  # None for a response-cache hit
+            "pool": pool,
+            "queue_wait_ms": round(queue_wait * 1000, 2),
+            "hedged": hedged,
+            "attempt": attempt,
+            "request": request,
         }
 
         if force_conversion:
@@ -138,80 +166,257 @@ class ProxyForwarder:
                 media_type="text/event-stream",
             )
 
+    async def _open_upstream(
+        self, request: Request, pool: UpstreamPool, path: str, body: bytes, headers: dict,
+    ):
+        """
+        Send the request to an upstream from the pool; connect errors are retried
+        on the remaining upstreams. Returns (resp, upstream, queue wait in s,
+        monotonic send time) or an error Response.
+        """
+        route_key = affinity_key(body) if pool.policy == "prefix_affinity" else None
+        tried = []
+        last_error: Exception = RuntimeError("No upstream available")
+        queue_wait = 0.0
+        while True:
+            if pool.admission is not None:
+                waited_from = time.time()
+                try:
+                    upstream = await pool.admission.acquire(
+                        exclude=tried, key=route_key, client=self._client_id(request)
+                    )
+                except AdmissionRejected as e:
+                    return self._error_response(e, status_code=503)
+                finally:
+                    queue_wait += time.time() - waited_from
+            else:
+                upstream = pool.acquire(exclude=tried, key=route_key)
+            if upstream is None:
+                return self._error_response(last_error)
+            sent_at = time.monotonic()
+            try:
+                resp = await self.client.request(
+                    method=request.method,
+                    url=f"{upstream.base_url}{path}",
+                    data=body,
+                    headers=headers,
+                )
+            except aiohttp.ClientConnectorError as e:
+                logger.warning(f"Upstream {upstream.key} connect failed: {e}")
+                pool.release(upstream)
+                pool.report_failure(upstream)
+                tried.append(upstream)
+                last_error = e
+                continue
+            except Exception as e:
+                pool.release(upstream)
+                return self._error_response(e)
+            pool.report_success(upstream)
+            return resp, upstream, queue_wait, sent_at
+
+    def _hedgeable(self, request: Request, pool: UpstreamPool, resp: aiohttp.ClientResponse, streamed: bool) -> bool:
+        """
+        Only streamed POSTs are hedged: for anything else the first byte comes
+        with the complete response, so waiting for it would duplicate long
+        completions and feed their full latency into the TTFT threshold.
+        """
+        return (
+            self.hedge.enabled and streamed and request.method == "POST"
+            and len(pool) > 1 and resp.status == 200
+        )
+
+    async def _hedged(
+        self, request: Request, pool: UpstreamPool, path: str, body: bytes, headers: dict,
+        resp: aiohttp.ClientResponse, upstream: Upstream, sent_at: float,
+    ):
+        """
+        Wait for the first body chunk; past the hedge threshold, race a second
+        upstream for it. Returns (primed response, upstream, send time,
+        attempt number of the winner, whether a hedge was sent). Raises
+        ClientGone, with every attempt closed, if the client disconnects first.
+        """
+        hedge = self.hedge
+        hedge.requests += 1
+        first = asyncio.ensure_future(self._first_chunk(resp))
+        gone = asyncio.ensure_future(self._client_gone(request))
+        try:
+            return await self._race(request, pool, path, body, headers, resp, upstream, sent_at, first, gone)
+        finally:
+            gone.cancel()
+
+    async def _race(
+        self, request: Request, pool: UpstreamPool, path: str, body: bytes, headers: dict,
+        resp: aiohttp.ClientResponse, upstream: Upstream, sent_at: float,
+        first: asyncio.Future, gone: asyncio.Future,
+    ):
+        hedge = self.hedge
+        second_upstream = None
+        threshold = hedge.threshold()
+        # None: percentile mode still warming up, no hedging until enough samples
+        if threshold is not None:
+            await asyncio.wait(
+                (first, gone), timeout=max(threshold - (time.monotonic() - sent_at), 0),
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not first.done() and not gone.done() and hedge.allow():
+                limit = pool.admission.limit if pool.admission is not None else 0
+                second_upstream = pool.acquire(exclude=(upstream,), limit=limit)
+        if second_upstream is None:
+            await asyncio.wait((first, gone), return_when=asyncio.FIRST_COMPLETED)
+            if not first.done():
+                first.cancel()
+                await asyncio.gather(first, return_exceptions=True)
+            try:
+                if first.cancelled():
+                    raise ClientGone(f"client disconnected before the first chunk from {upstream.key}")
+                _, chunk = first.result()
+            except BaseException:
+                resp.close()
+                pool.release(upstream)
+                raise
+            hedge.observe(time.monotonic() - sent_at)
+            return PrimedResponse(resp, chunk), upstream, sent_at, 1, False
+
+        hedge.hedged += 1
+        second_sent = time.monotonic()
+        second = asyncio.ensure_future(
+            self._hedge_attempt(request.method, second_upstream, path, body, headers)
+        )
+        attempts = {first: (resp, upstream, sent_at, 1), second: (None, second_upstream, second_sent, 2)}
+        logger.info(
+            f"Hedging: no first chunk from {upstream.key} after "
+            f"{(second_sent - sent_at) * 1000:.0f}ms, also sending to {second_upstream.key}"
+        )
+
+        winner, error = None, None
+        pending = set(attempts)
+        while pending and winner is None and not gone.done():
+            done, _ = await asyncio.wait(pending | {gone}, return_when=asyncio.FIRST_COMPLETED)
+            for task in done - {gone}:
+                pending.discard(task)
+                if task.exception() is None:
+                    winner = winner or task
+                else:
+                    error = error or task.exception()
+        if winner is None and gone.done():
+            error = ClientGone("client disconnected during a hedged request")
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        # Close and release the loser (and any failed or abandoned attempt)
+        for task, (primary_resp, task_upstream, _, attempt) in attempts.items():
+            if task is winner:
+                continue
+            if not task.cancelled() and task.exception() is None:
+                task.result()[0].close()
+            elif primary_resp is not None:
+                primary_resp.close()
+            if attempt == 2 and not task.cancelled() and isinstance(
+                task.exception(), aiohttp.ClientConnectorError
+            ):
+                pool.report_failure(task_upstream)
+            pool.release(task_upstream)
+
+        if winner is None:
+            raise error
+        win_resp, chunk = winner.result()
+        _, win_upstream, win_sent, attempt = attempts[winner]
+        if attempt == 2:
+            hedge.hedge_wins += 1
+            pool.report_success(win_upstream)
+        hedge.observe(time.monotonic() - win_sent)
+        return PrimedResponse(win_resp, chunk), win_upstream, win_sent, attempt, True
+
+    @staticmethod
+    async def _client_gone(request: Request):
+        while not await request.is_disconnected():
+            await asyncio.sleep(settings.PROXY_DISCONNECT_POLL)
+
+    @staticmethod
+    async def _first_chunk(resp: aiohttp.ClientResponse):
+        return resp, await resp.content.readany()
+
+    async def _hedge_attempt(self, method: str, upstream: Upstream, path: str, body: bytes, headers: dict):
+        resp = await self.client.request(
+            method=method, url=f"{upstream.base_url}{path}", data=body, headers=headers,
+        )
+        try:
+            if resp.status != 200:
+                raise aiohttp.ClientResponseError(
+                    resp.request_info, resp.history, status=resp.status,
+                    message=f"hedge to {upstream.key} returned {resp.status}",
+                )
+            return resp, await resp.content.readany()
+        except BaseException:
+            resp.close()
+            raise
+
     # ------------------------------------------------------------------
     # Internal generators
     # ------------------------------------------------------------------
 
-    async def _passthrough(self, resp: aiohttp.ClientResponse):
+    async def _passthrough(
+        self, request: Request, resp: aiohttp.ClientResponse, pool: UpstreamPool, upstream: Upstream,
+    ):
         """Simple byte passthrough."""
-        async for chunk in resp.content.iter_any():
-            yield chunk
+        watcher = self._watch_disconnect(request, resp)
+        aborted = False
+        try:
+            async for chunk in resp.content.iter_any():
+                yield chunk
+        except (asyncio.CancelledError, GeneratorExit):
+            aborted = True
+            raise
+        except aiohttp.ClientError:
+            if not watcher.done():
+                raise
+        finally:
+            aborted = self._stop_watcher(watcher) or aborted
+            self._release(resp, pool, upstream, aborted)
 
     async def _collect_streaming(
         self, resp: aiohttp.ClientResponse, meta: dict
     ):
         """
         Stream SSE to client while collecting metrics.
-        Handles SSE message boundary detection (\\n\\n).
+        Message boundaries are detected incrementally by SSEFramer.
         """
-        remaining = b""
-        first_token_time = None
-        chunk_count = 0
-        usage_data: Dict[str, Any] = {}
-        response_parts = []
-        model = meta["model"]
-
-        async for raw_chunk in resp.content.iter_any():
-            combined = remaining + raw_chunk
-
-            while b"\n\n" in combined:
-                boundary = combined.find(b"\n\n") + 2
-                complete_msg = combined[:boundary]
-                combined = combined[boundary:]
-
-                # Parse for metrics
-                self._extract_chunk_metrics(
-                    complete_msg, meta, response_parts,
-                    usage_data, first_token_time, chunk_count,
-                )
-                msg_str = complete_msg.decode("utf-8", errors="replace")
-                for line in msg_str.strip().split("\n"):
-                    if line.startswith("data: ") and line[6:].strip() not in ("[DONE]", ""):
-                        try:
-                            data = json.loads(line[6:])
-                            if data.get("usage"):
-                                usage_data = data["usage"]
-                                model = data.get("model", model)
-                            choices = data.get("choices", [])
-                            if choices:
-                                delta = choices[0].get("delta", {})
-                                content = delta.get("content")
-                                if content:
-                                    response_parts.append(content)
-                                    if first_token_time is None:
-                                        first_token_time = time.time()
-                            chunk_count += 1
-                        except json.JSONDecodeError:
-                            pass
-
-                # Decide whether to forward usage chunk
-                if not meta["original_include_usage"] and usage_data:
-                    # Check if this chunk IS the usage-only chunk
-                    pass  # still forward for simplicity
-
-                yield complete_msg
-
-            remaining = combined
-
-        if remaining:
-            yield remaining
+        framer = SSEFramer()
+        metrics = StreamMetrics(
+            meta["model"], start=meta["arrival_time"],
+            capture=meta["qa_mode"], limit=settings.QA_TRUNCATE_CHARS,
+        )
+
+        watcher = self._watch_disconnect(meta["request"], resp)
+        aborted = False
+        try:
+            async for raw_chunk in resp.content.iter_any():
+                for complete_msg in framer.feed(raw_chunk):
+                    metrics.feed(complete_msg)
+                    yield complete_msg
+
+            remaining = framer.flush()
+            if remaining:
+                yield remaining
+        except (asyncio.CancelledError, GeneratorExit):
+            aborted = True
+            raise
+        except aiohttp.ClientError:
+            if not watcher.done():
+                raise
+        finally:
+            aborted = self._stop_watcher(watcher) or aborted
+            self._release(resp, meta["pool"], meta["upstream"], aborted)
+            if aborted:
+                self._record_aborted(meta, metrics)
+        if aborted:
+            return
 
         # Record metrics after stream completes
         completion_time = time.time()
-        stat = self._build_stat(
-            meta, first_token_time, completion_time, chunk_count,
-            usage_data, response_parts, model,
-        )
+        stat = self._build_stat(meta, metrics, completion_time)
         await self._emit_stat(stat)
 
     async def _collect_and_convert(
@@ -220,111 +425,130 @@ class ProxyForwarder:
         """
         Collect all SSE chunks, extract metrics, then yield a single non-streaming JSON response.
         """
-        remaining = b""
-        first_token_time = None
-        chunk_count = 0
-        usage_data: Dict[str, Any] = {}
-        response_parts = []
-        model = meta["model"]
-        finish_reason = "stop"
-        request_id_from_server = None
-
-        async for raw_chunk in resp.content.iter_any():
-            combined = remaining + raw_chunk
-
-            while b"\n\n" in combined:
-                boundary = combined.find(b"\n\n") + 2
-                complete_msg = combined[:boundary]
-                combined = combined[boundary:]
-
-                msg_str = complete_msg.decode("utf-8", errors="replace")
-                for line in msg_str.strip().split("\n"):
-                    if not line.startswith("data: "):
-                        continue
-                    payload = line[6:].strip()
-                    if payload in ("[DONE]", ""):
-                        continue
-                    try:
-                        data = json.loads(payload)
-                        if not request_id_from_server:
-                            request_id_from_server = data.get("id")
-                        if data.get("usage"):
-                            usage_data = data["usage"]
-                        model = data.get("model", model)
-                        choices = data.get("choices", [])
-                        if choices:
-                            delta = choices[0].get("delta", {})
-                            content = delta.get("content")
-                            if content:
-                                response_parts.append(content)
-                                if first_token_time is None:
-                                    first_token_time = time.time()
-                            fr = choices[0].get("finish_reason")
-                            if fr:
-                                finish_reason = fr
-                        chunk_count += 1
-                    except json.JSONDecodeError:
-                        pass
-
-            remaining = combined
-
-        # Handle any remaining data
-        if remaining:
-            msg_str = remaining.decode("utf-8", errors="replace")
-            for line in msg_str.strip().split("\n"):
-                if line.startswith("data: "):
-                    payload = line[6:].strip()
-                    if payload not in ("[DONE]", ""):
-                        try:
-                            data = json.loads(payload)
-                            if data.get("usage"):
-                                usage_data = data["usage"]
-                        except json.JSONDecodeError:
-                            pass
+        framer = SSEFramer()
+        # The client needs the whole body, so capture everything and shape afterwards.
+        metrics = StreamMetrics(meta["model"], start=meta["arrival_time"])
+
+        # Nothing is sent until the upstream finishes, so the watcher is the
+        # only way to notice the client leaving.
+        watcher = self._watch_disconnect(meta["request"], resp)
+        aborted = False
+        try:
+            async for raw_chunk in resp.content.iter_any():
+                for complete_msg in framer.feed(raw_chunk):
+                    metrics.feed(complete_msg)
+
+            # Handle any remaining data
+            remaining = framer.flush()
+            if remaining:
+                metrics.feed(remaining)
+        except (asyncio.CancelledError, GeneratorExit):
+            aborted = True
+            raise
+        except aiohttp.ClientError:
+            if not watcher.done():
+                raise
+        finally:
+            aborted = self._stop_watcher(watcher) or aborted
+            self._release(resp, meta["pool"], meta["upstream"], aborted)
+            if aborted:
+                self._record_aborted(meta, metrics)
+        if aborted:
+            return
 
         completion_time = time.time()
-        complete_content = "".join(response_parts)
 
         # Build non-streaming response
         non_stream_resp = {
-            "id": request_id_from_server or meta["request_id"],
+            "id": metrics.response_id or meta["request_id"],
             "object": "chat.completion",
             "created": int(meta["arrival_time"]),
-            "model": model,
+            "model": metrics.model,
             "choices": [
                 {
                     "index": 0,
-                    "message": {"role": "assistant", "content": complete_content},
-                    "finish_reason": finish_reason,
+                    "message": {"role": "assistant", "content": metrics.response_content},
+                    "finish_reason": metrics.finish_reason or "stop",
                 }
             ],
         }
-        if usage_data and meta["original_include_usage"]:
-            non_stream_resp["usage"] = usage_data
+        if metrics.usage and meta["original_include_usage"]:
+            non_stream_resp["usage"] = metrics.usage
 
         yield json.dumps(non_stream_resp, ensure_ascii=False).encode("utf-8")
 
         # Record metrics
-        stat = self._build_stat(
-            meta, first_token_time, completion_time, chunk_count,
-            usage_data, response_parts, model,
-        )
+        stat = self._build_stat(meta, metrics, completion_time)
         await self._emit_stat(stat)
 
     # ------------------------------------------------------------------
     # Helpers
     # ------------------------------------------------------------------
 
-    def _extract_chunk_metrics(self, chunk_bytes, meta, response_parts,
-                                usage_data, first_token_time, chunk_count):
-        """Placeholder for inline metric extraction (used by _collect_streaming)."""
-        pass
+    @staticmethod
+    def _error_response(error: Exception, status_code: int = 502) -> Response:
+        logger.error(f"Proxy forward failed: {error}")
+        return Response(
+            content=json.dumps({"error": str(error)}),
+            status_code=status_code,
+            media_type="application/json",
+        )
+
+    @staticmethod
+    def _client_id(request: Request) -> str:
+        """Fairness key: PROXY_CLIENT_HEADER if configured, else the client address."""
+        if settings.PROXY_CLIENT_HEADER:
+            return request.headers.get(settings.PROXY_CLIENT_HEADER, "")
+        return request.client.host if request.client else ""
+
+    @staticmethod
+    def _release(
+        resp: aiohttp.ClientResponse, pool: UpstreamPool, upstream: Optional[Upstream],
+        aborted: bool = False,
+    ):
+        # close() drops the connection so the upstream sees the disconnect;
+        # release() would keep it for reuse.
+        if aborted:
+            resp.close()
+        else:
+            resp.release()
+        if upstream is not None:
+            pool.release(upstream)
+
+    @staticmethod
+    def _watch_disconnect(request: Request, resp: aiohttp.ClientResponse) -> asyncio.Task:
+        async def watch():
+            while not await request.is_disconnected():
+                await asyncio.sleep(settings.PROXY_DISCONNECT_POLL)
+            resp.close()
+
+        return asyncio.create_task(watch())
+
+    @staticmethod
+    def _stop_watcher(watcher: asyncio.Task) -> bool:
+        """Stop the disconnect watcher; True if it saw the client disconnect."""
+        if watcher.done():
+            return not watcher.cancelled() and watcher.exception() is None
+        watcher.cancel()
+        return False
+
+    def _record_aborted(self, meta, metrics: StreamMetrics):
+        """Record a request the client abandoned, with its partial timings."""
+        from ..collect.task_manager import collection_manager
+
+        stat = self._build_stat(meta, metrics, time.time(), aborted=True)
+        logger.info(
+            f"Client disconnected: aborted upstream request {meta['request_id']} "
+            f"after {stat['e2e_latency_ms']}ms ({metrics.chunk_count} chunks)"
+        )
+        # The generator may be cancelled or closing here, so no awaiting.
+        collection_manager.add_record_nowait(stat)
 
-    def _build_stat(
-        self, meta, first_token_time, completion_time, chunk_count,
-        usage_data, response_parts, model,
-    ) -> dict:
+    def _build_stat(self, meta, metrics: StreamMetrics, completion_time, aborted: bool = False) -> dict:
         arrival = meta["arrival_time"]
+        first_token_time = metrics.first_token_time
+        usage_data = metrics.usage
+        chunk_count = metrics.chunk_count
         ttft = (first_token_time - arrival) * 1000 if first_token_time else 0
         e2e = (completion_time - arrival) * 1000
         decode_time = (completion_time - first_token_time) if first_token_time else 0
@@ -343,10 +567,17 @@ class ProxyForwarder:
         tpot = (decode_time * 1000 / output_count) if output_count > 0 and decode_time > 0 else 0
         tps = (output_count / decode_time) if decode_time > 0 else 0
 
+        response_content = metrics.response_content
+        if metrics.capture != meta["qa_mode"]:
+            response_content = shape_response(
+                response_content, meta["qa_mode"], settings.QA_TRUNCATE_CHARS
+            )
+
         return {
             "request_id": meta["request_id"],
-            "model": model,
+            "model": metrics.model,
             "arrival_time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(arrival)),
+            "arrival_ts": round(arrival, 6),
             "completion_time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(completion_time)),
             "prompt_tokens": prompt_tokens,
             "forward_cal_tokens": 0,
@@ -358,8 +589,17 @@ class ProxyForwarder:
             "tps": round(tps, 2),
             "e2e_latency_ms": round(e2e, 2),
             "chunk_count": chunk_count,
+            "aborted": int(aborted),
+            "upstream": meta["upstream"].key if meta["upstream"] else "cache",
+            "cache_hit": int(meta["upstream"] is None),
+            "hedged": int(meta.get("hedged", False)),
+            "attempt": meta.get("attempt", 1),
+            "queue_wait_ms": meta.get("queue_wait_ms", 0),
+            "token_offsets": metrics.token_offsets,
             "messages": meta.get("messages", []),
-            "response_content": "".join(response_parts),
+            "messages_chars": meta.get("messages_chars"),
+            "response_content": response_content,
+            "response_chars": metrics.response_chars,
         }
 
     async def _emit_stat(self, stat: dict):
@@ -0,0 +1,106 @@
+"""
+Hedged requests against slow first chunks.
+
+If the chosen upstream has not produced its first body chunk within the hedge
+threshold, the forwarder sends the same request to another upstream of the
+pool; whichever produces a chunk first is relayed and the other is closed.
+
+Threshold: PROXY_HEDGE_AFTER_MS, or once PROXY_HEDGE_MIN_SAMPLES have been seen,
+the PROXY_HEDGE_PERCENTILE of recent time-to-first-chunk (when configured).
+PROXY_HEDGE_MAX_RATIO caps the share of requests that may be hedged, so a
+cluster-wide slowdown does not double the load.
+"""
+
+import math
+from collections import deque
+from typing import Optional
+
+from ..config import settings
+
+
+class ClientGone(Exception):
+    """The client disconnected while the first chunk was awaited."""
+
+
+class _PrimedContent:
+    def __init__(self, resp, first: bytes):
+        self._resp = resp
+        self._first = first
+
+    async def iter_any(self):
+        if self._first:
+            yield self._first
+        async for chunk in self._resp.content.iter_any():
+            yield chunk
+
+
+class PrimedResponse:
+    """An upstream response whose first chunk was already read by the race."""
+
+    def __init__(self, resp, first: bytes):
+        self.resp = resp
+        self.content = _PrimedContent(resp, first)
+
+    @property
+    def status(self) -> int:
+        return self.resp.status
+
+    @property
+    def content_type(self) -> str:
+        return self.resp.content_type
+
+    def release(self):
+        self.resp.release()
+
+    def close(self):
+        self.resp.close()
+
+
+class HedgePolicy:
+    """Hedge threshold from settings / rolling first-chunk latency, plus counters."""
+
+    def __init__(self):
+        self._samples = deque(maxlen=settings.PROXY_HEDGE_WINDOW)
+        self._sorted: Optional[list] = None
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.budget_skips = 0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.PROXY_HEDGE_AFTER_MS > 0 or settings.PROXY_HEDGE_PERCENTILE > 0
+
+    def threshold(self) -> Optional[float]:
+        """Seconds to wait for the first chunk before hedging (None: do not hedge)."""
+        pct = settings.PROXY_HEDGE_PERCENTILE
+        if pct > 0 and len(self._samples) >= settings.PROXY_HEDGE_MIN_SAMPLES:
+            if self._sorted is None:
+                self._sorted = sorted(self._samples)
+            values = self._sorted
+            return values[min(len(values) - 1, math.ceil(pct / 100 * len(values)) - 1)]
+        if settings.PROXY_HEDGE_AFTER_MS > 0:
+            return settings.PROXY_HEDGE_AFTER_MS / 1000
+        return None
+
+    def observe(self, seconds: float):
+        self._samples.append(seconds)
+        self._sorted = None
+
+    def allow(self) -> bool:
+        if self.hedged < settings.PROXY_HEDGE_MAX_RATIO * self.requests:
+            return True
+        self.budget_skips += 1
+        return False
+
+    def snapshot(self) -> dict:
+        threshold = self.threshold()
+        return {
+            "enabled": self.enabled,
+            "threshold_ms": round(threshold * 1000, 2) if threshold is not None else None,
+            "samples": len(self._samples),
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "budget_skips": self.budget_skips,
+        }
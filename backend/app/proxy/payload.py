@@ -0,0 +1,152 @@
+"""
+Request-body rewriting for metrics collection.
+Forces ``stream=true`` and ``stream_options.include_usage=true`` by splicing only
+those two values into the original bytes, so large ``messages`` arrays are never
+re-serialized on the proxy hot path.
+"""
+
+import re
+from typing import Dict, Optional
+
+import orjson
+
+_WS = b" \t\r\n"
+_STRUCT = re.compile(rb'["\[\]{}]')
+_SCALAR_END = re.compile(rb"[,}\]\s]")
+
+
+def _skip_ws(b: bytes, i: int) -> int:
+    n = len(b)
+    while i < n and b[i] in _WS:
+        i += 1
+    return i
+
+
+def _skip_string(b: bytes, i: int) -> int:
+    """``i`` points at the opening quote; returns the index after the closing quote."""
+    j = i + 1
+    while True:
+        j = b.find(b'"', j)
+        if j < 0:
+            raise ValueError("unterminated string")
+        k = j - 1
+        while b[k] == 0x5C:  # backslash
+            k -= 1
+        if (j - 1 - k) % 2 == 0:
+            return j + 1
+        j += 1
+
+
+def _skip_value(b: bytes, i: int) -> int:
+    """Return the end index of the (small) JSON value starting at ``i``."""
+    c = b[i:i + 1]
+    if c == b'"':
+        return _skip_string(b, i)
+    if c in (b"{", b"["):
+        depth = 0
+        while True:
+            m = _STRUCT.search(b, i)
+            if m is None:
+                raise ValueError("unterminated container")
+            i = m.start()
+            if b[i] == 0x22:  # "
+                i = _skip_string(b, i)
+                continue
+            depth += 1 if b[i] in (0x7B, 0x5B) else -1
+            i += 1
+            if depth == 0:
+                return i
+    m = _SCALAR_END.search(b, i)
+    return m.start() if m else len(b)
+
+
+def _key_value_spans(body: bytes, key: bytes) -> list:
+    """
+    Value spans of every ``"key":`` occurrence in the raw body.
+    A quote inside a JSON string is always escaped, so an unescaped ``"key"``
+    followed by ``:`` can only be an object key (at some nesting depth).
+    """
+    needle = b'"' + key + b'"'
+    spans = []
+    pos = body.find(needle)
+    while pos >= 0:
+        after = _skip_ws(body, pos + len(needle))
+        if body[after:after + 1] == b":":
+            if pos > 0 and body[pos - 1] == 0x5C:
+                raise ValueError("ambiguous key position")
+            start = _skip_ws(body, after + 1)
+            spans.append((start, _skip_value(body, start)))
+        pos = body.find(needle, pos + len(needle))
+    return spans
+
+
+def _splice(body: bytes, payload: dict, values: Dict[str, bytes]) -> Optional[bytes]:
+    """
+    Replace (or append) top-level values in the raw body.
+    Returns None when a key occurs more than once or only in nested objects,
+    in which case the caller must re-serialize.
+    """
+    patches = []
+    appended = []
+    for key, new_value in values.items():
+        spans = _key_value_spans(body, key.encode())
+        if key in payload:
+            if len(spans) != 1:
+                return None
+            patches.append((spans[0][0], spans[0][1], new_value))
+        elif spans:
+            return None
+        else:
+            appended.append(b'"' + key.encode() + b'":' + new_value)
+
+    if appended:
+        close = body.rstrip(_WS).rfind(b"}")
+        sep = b"," if payload else b""
+        patches.append((close, close, sep + b",".join(appended)))
+    patches.sort()
+
+    parts = []
+    pos = 0
+    for start, end, replacement in patches:
+        parts.append(body[pos:start])
+        parts.append(replacement)
+        pos = end
+    parts.append(body[pos:])
+    return b"".join(parts)
+
+
+def force_stream_usage(body: bytes) -> dict:
+    """
+    Rewrite a chat-completions body so the upstream streams and reports usage.
+
+    Returns a dict with the new ``body`` plus the request's original ``stream``,
+    ``include_usage``, ``model``, ``messages`` and ``temperature``.
+    Raises ValueError if the body is not a JSON object.
+    """
+    payload = orjson.loads(body)
+    if not isinstance(payload, dict):
+        raise ValueError("not a JSON object")
+
+    original_stream = payload.get("stream", False)
+    stream_options = payload.get("stream_options")
+    stream_options = dict(stream_options) if isinstance(stream_options, dict) else {}
+    original_include_usage = stream_options.get("include_usage", False)
+    stream_options["include_usage"] = True
+
+    new_body = _splice(body, payload, {
+        "stream": b"true",
+        "stream_options": orjson.dumps(stream_options),
+    })
+    if new_body is None:
+        payload["stream"] = True
+        payload["stream_options"] = stream_options
+        new_body = orjson.dumps(payload)
+
+    return {
+        "body": new_body,
+        "stream": original_stream,
+        "include_usage": original_include_usage,
+        "model": payload.get("model", "unknown"),
+        "messages": payload.get("messages", []),
+        "temperature": payload.get("temperature"),
+    }
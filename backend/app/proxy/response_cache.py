@@ -0,0 +1,310 @@
+"""
+Opt-in exact-match response cache for the proxy (AICP_RESPONSE_CACHE=true).
+
+Keyed by a hash of the forwarded request (path + body bytes): clients resend
+identical requests byte for byte, and hashing the bytes spares re-parsing
+and re-serializing the body (the proxy parses it once, when rewriting it for
+metrics). By default only deterministic requests (``temperature: 0``) are
+cached.
+
+A miss records the upstream response chunk by chunk with each chunk's arrival
+offset; a hit replays it as a response-like object, either at full speed or
+re-paced to the recorded timing, through the same forwarding generators as a
+live upstream response. Entries live in an LRU bounded by count, bytes and
+TTL, and with RESPONSE_CACHE_DISK also in DATA_DIR/response_cache, shared by
+workers and kept across restarts. Disk reads and writes run on the cache's
+own threads: a lookup awaits its read, a store is written in the background.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional
+
+import orjson
+from loguru import logger
+
+from ..config import settings
+
+CACHE_DIR = "response_cache"
+UNPARSED = object()  # key(): the body's temperature is not known yet
+
+
+class CacheEntry:
+    __slots__ = ("status", "content_type", "chunks", "offsets", "size", "created")
+
+    def __init__(self, status: int, content_type: str, chunks: List[bytes], offsets: List[float],
+                 created: Optional[float] = None):
+        self.status = status
+        self.content_type = content_type
+        self.chunks = chunks
+        self.offsets = offsets  # ms from sending the request to each chunk
+        self.size = sum(len(c) for c in chunks)
+        self.created = created if created is not None else time.time()
+
+    def expired(self, now: float) -> bool:
+        return now - self.created > settings.RESPONSE_CACHE_TTL
+
+    def to_bytes(self) -> bytes:
+        header = {
+            "status": self.status, "content_type": self.content_type, "created": self.created,
+            "offsets": self.offsets, "sizes": [len(c) for c in self.chunks],
+        }
+        return json.dumps(header).encode("utf-8") + b"\n" + b"".join(self.chunks)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "CacheEntry":
+        head, _, body = data.partition(b"\n")
+        header = json.loads(head)
+        chunks, pos = [], 0
+        for size in header["sizes"]:
+            chunks.append(body[pos:pos + size])
+            pos += size
+        return cls(header["status"], header["content_type"], chunks, header["offsets"], header["created"])
+
+
+class _ReplayContent:
+    def __init__(self, entry: CacheEntry, paced: bool):
+        self._entry = entry
+        self._paced = paced
+        self.closed = False
+
+    async def iter_any(self):
+        start = time.monotonic()
+        for chunk, offset in zip(self._entry.chunks, self._entry.offsets):
+            if self._paced:
+                delay = start + offset / 1000 - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            if self.closed:
+                return
+            yield chunk
+
+
+class CachedResponse:
+    """Stands in for aiohttp.ClientResponse when serving a hit."""
+
+    def __init__(self, entry: CacheEntry, paced: bool):
+        self.status = entry.status
+        self.content_type = entry.content_type
+        self.content = _ReplayContent(entry, paced)
+
+    def release(self):
+        pass
+
+    def close(self):
+        self.content.closed = True
+
+
+class _RecordingContent:
+    def __init__(self, owner: "RecordingResponse"):
+        self._owner = owner
+
+    async def iter_any(self):
+        owner = self._owner
+        chunks, offsets = [], []
+        size = 0
+        recording = True
+        async for chunk in owner.resp.content.iter_any():
+            if recording:
+                size += len(chunk)
+                if size > settings.RESPONSE_CACHE_MAX_BYTES:
+                    recording = False  # too large to ever fit
+                    chunks, offsets = [], []
+                else:
+                    chunks.append(chunk)
+                    offsets.append(round((time.monotonic() - owner.started) * 1000, 2))
+            yield chunk
+        # Only complete responses are stored; close() means the client left.
+        if recording and not owner.closed:
+            owner.cache.put(owner.key, CacheEntry(
+                owner.resp.status, owner.resp.content_type, chunks, offsets,
+            ))
+
+
+class RecordingResponse:
+    """Wraps a live upstream response and stores it in the cache once complete."""
+
+    def __init__(self, resp, cache: "ResponseCache", key: str, started: float):
+        self.resp = resp
+        self.cache = cache
+        self.key = key
+        self.started = started
+        self.closed = False
+        self.content = _RecordingContent(self)
+
+    @property
+    def status(self) -> int:
+        return self.resp.status
+
+    @property
+    def content_type(self) -> str:
+        return self.resp.content_type
+
+    def release(self):
+        self.resp.release()
+
+    def close(self):
+        self.closed = True
+        self.resp.close()
+
+
+class ResponseCache:
+    """LRU + TTL cache of upstream responses with hit/miss/bytes-saved counters."""
+
+    def __init__(self):
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.bytes_saved = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def enabled(self) -> bool:
+        return settings.RESPONSE_CACHE
+
+    def key(self, method: str, path: str, body: bytes, temperature=UNPARSED) -> Optional[str]:
+        """
+        Key of a cacheable request, or None. Pass the body's ``temperature``
+        when it was already parsed; otherwise the body is parsed only if
+        RESPONSE_CACHE_DETERMINISTIC_ONLY needs it.
+        """
+        if method != "POST" or not body:
+            return None
+        if settings.RESPONSE_CACHE_DETERMINISTIC_ONLY:
+            if temperature is UNPARSED:
+                try:
+                    data = orjson.loads(body)
+                except orjson.JSONDecodeError:
+                    return None
+                temperature = data.get("temperature") if isinstance(data, dict) else None
+            if temperature != 0:
+                return None
+        return hashlib.blake2b(path.encode("utf-8") + b"\0" + body, digest_size=16).hexdigest()
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.expired(now):
+                self._remove(key)
+                entry = None
+            else:
+                self._entries.move_to_end(key)
+        if entry is None and settings.RESPONSE_CACHE_DISK:
+            entry = await asyncio.get_running_loop().run_in_executor(self._io(), self._load, key, now)
+            if entry is not None:
+                self._insert(key, entry)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.bytes_saved += entry.size
+        return entry
+
+    def put(self, key: str, entry: CacheEntry):
+        if entry.status != 200 or entry.size > settings.RESPONSE_CACHE_MAX_BYTES:
+            return
+        self._insert(key, entry)
+        self.stores += 1
+        if settings.RESPONSE_CACHE_DISK:
+            self._io().submit(self._save, key, entry)
+
+    def replay(self, entry: CacheEntry) -> CachedResponse:
+        return CachedResponse(entry, paced=settings.RESPONSE_CACHE_REPLAY == "paced")
+
+    def record(self, resp, key: str, started: float) -> RecordingResponse:
+        return RecordingResponse(resp, self, key, started)
+
+    async def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+        if settings.RESPONSE_CACHE_DISK:
+            await asyncio.get_running_loop().run_in_executor(self._io(), self._clear_dir)
+
+    def snapshot(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "replay": settings.RESPONSE_CACHE_REPLAY,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "bytes_saved": self.bytes_saved,
+        }
+
+    # ------------------------------------------------------------------
+    # Internal
+    # ------------------------------------------------------------------
+
+    def _insert(self, key: str, entry: CacheEntry):
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = entry
+        self._bytes += entry.size
+        while self._entries and (
+            len(self._entries) > settings.RESPONSE_CACHE_MAX_ENTRIES
+            or self._bytes > settings.RESPONSE_CACHE_MAX_BYTES
+        ):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def _io(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="response-cache")
+        return self._executor
+
+    @staticmethod
+    def _dir() -> Path:
+        path = settings.DATA_DIR / CACHE_DIR
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def _load(self, key: str, now: float) -> Optional[CacheEntry]:
+        path = self._dir() / f"{key}.bin"
+        try:
+            entry = CacheEntry.from_bytes(path.read_bytes())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Dropping unreadable cache entry {path.name}: {e}")
+            path.unlink(missing_ok=True)
+            return None
+        if entry.expired(now):
+            path.unlink(missing_ok=True)
+            return None
+        return entry
+
+    def _save(self, key: str, entry: CacheEntry):
+        path = self._dir() / f"{key}.bin"
+        tmp = path.with_suffix(f".{os.getpid()}.{id(entry)}.tmp")
+        try:
+            tmp.write_bytes(entry.to_bytes())
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Cache entry {path.name} not saved: {e}")
+            tmp.unlink(missing_ok=True)
+
+    def _clear_dir(self):
+        for path in self._dir().glob("*.bin"):
+            path.unlink(missing_ok=True)
+
+
+response_cache = ResponseCache()
@@ -3,20 +3,15 @@ from sqlalchemy.orm import Session
 
 from ..models.database import get_db
 from ..models.schemas import ProxyConfig
+from .config_cache import active_proxy_config
 from .forwarder import proxy_forwarder
 
 router = APIRouter(tags=["proxy"])
 
 
 def _get_active_config() -> ProxyConfig:
-    """Get active proxy configuration from database."""
-    from ..models.database import SessionLocal
-    db = SessionLocal()
-    try:
-        config = db.query(ProxyConfig).filter(ProxyConfig.is_active == True).first()
-        return config
-    finally:
-        db.close()
+    """Get active proxy configuration (cached in memory, no DB I/O)."""
+    return active_proxy_config.get()
 
 
 @router.api_route(
@@ -30,12 +25,14 @@ async def proxy_all(request: Request, full_path: str):
         raise HTTPException(status_code=503, detail="Proxy not configured. Set target service first.")
 
     from ..collect.task_manager import collection_manager
-    collect = collection_manager.has_active_task()
+    collect = collection_manager.has_active_task() and collection_manager.should_collect(
+        await request.body()
+    )
 
     return await proxy_forwarder.forward(
         request=request,
-        target_host=config.target_host,
-        target_port=config.target_port,
+        pool=active_proxy_config.pool,
         path=f"/{full_path}",
         collect_metrics=collect,
+        qa_mode=collection_manager.qa_mode,
     )
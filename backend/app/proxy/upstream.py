@@ -0,0 +1,217 @@
+"""
+Upstream pool for the proxy.
+Round-robin, least-outstanding-requests or prefix-affinity selection over
+inference replicas, with passive ejection of replicas that fail to accept connections.
+Optional admission control (per-upstream in-flight limit + wait queue) lives in
+admission.py; requests then go through ``pool.admission`` and ``pool.release``.
+"""
+
+import bisect
+import hashlib
+import math
+import re
+import time
+from typing import List, Optional, Tuple
+
+from loguru import logger
+
+from ..config import settings
+from .admission import AdmissionController
+
+LB_POLICIES = ("round_robin", "least_outstanding", "prefix_affinity")
+_RING_VNODES = 100
+_FIRST_MESSAGE = re.compile(rb'"messages"\s*:\s*\[\s*\{')
+_BRACE_OR_STRING = re.compile(rb'"(?:[^"\\]|\\.)*"|[{}]')
+
+
+def _hash64(data: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+
+def affinity_key(body: bytes) -> Optional[bytes]:
+    """
+    Raw bytes of the first message (usually the system prompt), at most
+    PROXY_AFFINITY_PREFIX_CHARS of them. Requests sharing it should land on the
+    replica holding its KV cache, whatever the later turns and body keys are.
+    """
+    match = _FIRST_MESSAGE.search(body)
+    if match is None:
+        return None
+    start = match.end() - 1
+    window = body[start:start + settings.PROXY_AFFINITY_PREFIX_CHARS]
+    depth = 0
+    # Braces inside strings are skipped with the strings
+    for token in _BRACE_OR_STRING.finditer(window):
+        if token.group() == b"{":
+            depth += 1
+        elif token.group() == b"}":
+            depth -= 1
+            if not depth:
+                return window[:token.end()]
+    return window  # the first message is longer than the cap
+
+
+class Upstream:
+    """One inference replica and its live counters."""
+
+    __slots__ = (
+        "host", "port", "outstanding", "total", "failures",
+        "consecutive_failures", "ejected_until",
+    )
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.outstanding = 0
+        self.total = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+
+    @property
+    def key(self) -> str:
+        return f"{self.host}:{self.port}"
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def release(self):
+        self.outstanding -= 1
+
+    def available(self, now: float) -> bool:
+        return self.ejected_until <= now
+
+    def snapshot(self) -> dict:
+        return {
+            "upstream": self.key,
+            "outstanding": self.outstanding,
+            "total": self.total,
+            "failures": self.failures,
+            "ejected": not self.available(time.monotonic()),
+        }
+
+
+def parse_target(target: str) -> Tuple[str, int]:
+    """Parse "host:port" (port defaults to 80)."""
+    host, _, port = target.strip().rpartition(":")
+    if not host:
+        return port, 80
+    return host, int(port)
+
+
+class UpstreamPool:
+    """Select an upstream per request and track outstanding requests."""
+
+    def __init__(self, targets: List[Tuple[str, int]], policy: str = "least_outstanding"):
+        if not targets:
+            raise ValueError("Upstream pool needs at least one target")
+        if policy not in LB_POLICIES:
+            raise ValueError(f"Unknown lb_policy: {policy}")
+        self.upstreams = [Upstream(h, p) for h, p in targets]
+        self.policy = policy
+        self._rr = 0
+        self._ring: List[Tuple[int, int]] = sorted(
+            (_hash64(f"{u.key}#{v}".encode()), i)
+            for i, u in enumerate(self.upstreams)
+            for v in range(_RING_VNODES)
+        )
+        self._ring_hashes = [h for h, _ in self._ring]
+        self.admission = AdmissionController.from_settings(self)
+
+    def __len__(self) -> int:
+        return len(self.upstreams)
+
+    def _candidates(self, exclude=()) -> List[Upstream]:
+        now = time.monotonic()
+        live = [u for u in self.upstreams if u.available(now) and u not in exclude]
+        if live:
+            return live
+        # Everything ejected: fall back to all non-excluded replicas rather than fail.
+        return [u for u in self.upstreams if u not in exclude]
+
+    def has_candidates(self, exclude=()) -> bool:
+        return any(u not in exclude for u in self.upstreams)
+
+    def acquire(
+        self, exclude=(), key: Optional[bytes] = None, limit: int = 0,
+    ) -> Optional[Upstream]:
+        """
+        Pick an upstream and count the request against it.
+        With ``limit``, only upstreams below that many outstanding requests qualify.
+        """
+        candidates = self._candidates(exclude)
+        if limit:
+            candidates = [u for u in candidates if u.outstanding < limit]
+        if not candidates:
+            return None
+        if self.policy == "prefix_affinity" and key and len(candidates) > 1:
+            upstream = self._affinity_pick(key, candidates)
+        elif self.policy == "round_robin" or len(candidates) == 1:
+            upstream = candidates[self._rr % len(candidates)]
+            self._rr += 1
+        else:
+            # Least outstanding; rotate the starting point to spread ties.
+            start = self._rr % len(candidates)
+            self._rr += 1
+            upstream = min(
+                candidates[start:] + candidates[:start], key=lambda u: u.outstanding
+            )
+        upstream.outstanding += 1
+        upstream.total += 1
+        return upstream
+
+    def _affinity_pick(self, key: bytes, candidates: List[Upstream]) -> Upstream:
+        """
+        Consistent hashing with bounded load: walk the ring from the key's
+        position and take the first candidate whose outstanding count is within
+        PROXY_AFFINITY_LOAD_FACTOR of the average.
+        """
+        total = sum(u.outstanding for u in candidates) + 1
+        bound = math.ceil(total * settings.PROXY_AFFINITY_LOAD_FACTOR / len(candidates))
+        allowed = set(map(id, candidates))
+        start = bisect.bisect(self._ring_hashes, _hash64(key))
+        ring = self._ring
+        seen = set()
+        for step in range(len(ring)):
+            upstream = self.upstreams[ring[(start + step) % len(ring)][1]]
+            if id(upstream) not in allowed or id(upstream) in seen:
+                continue
+            if upstream.outstanding < bound:
+                return upstream
+            seen.add(id(upstream))
+            if len(seen) == len(candidates):
+                break
+        return min(candidates, key=lambda u: u.outstanding)
+
+    def release(self, upstream: Upstream):
+        """Request finished: free its slot (and admit a waiter, if any)."""
+        if self.admission is not None:
+            self.admission.release(upstream)
+        else:
+            upstream.release()
+
+    def report_success(self, upstream: Upstream):
+        upstream.consecutive_failures = 0
+
+    def report_failure(self, upstream: Upstream):
+        """Record a connect error; eject after PROXY_EJECT_FAILURES in a row."""
+        upstream.failures += 1
+        upstream.consecutive_failures += 1
+        if upstream.consecutive_failures >= settings.PROXY_EJECT_FAILURES:
+            upstream.ejected_until = time.monotonic() + settings.PROXY_EJECT_SECONDS
+            upstream.consecutive_failures = 0
+            logger.warning(
+                f"Upstream {upstream.key} ejected for {settings.PROXY_EJECT_SECONDS}s "
+                f"after {settings.PROXY_EJECT_FAILURES} connect failures"
+            )
+
+    @property
+    def outstanding(self) -> int:
+        return sum(u.outstanding for u in self.upstreams)
+
+    def snapshot(self) -> dict:
+        snap = {"lb_policy": self.policy, "upstreams": [u.snapshot() for u in self.upstreams]}
+        if self.admission is not None:
+            snap["admission"] = self.admission.snapshot()
+        return snap
@@ -30,6 +30,7 @@ from sqlalchemy.orm import Session
 from ..config import settings
 from ..models.database import get_db
 from ..models.schemas import Task
+from ..utils.dataset_cache import cached_performance
 
 router = APIRouter(prefix="/api/report", tags=["report"])
 
@@ -45,10 +46,10 @@ def _load_df(task_id: str, db: Session) -> pd.DataFrame:
     task = db.query(Task).filter(Task.id == task_id).first()
     if not task or not task.data_dir:
         raise HTTPException(status_code=404, detail=f"Task {task_id} not found")
-    files = sorted(Path(task.data_dir).glob("performance_data_*.csv"))
-    if not files:
+    df = cached_performance(Path(task.data_dir))
+    if df.empty:
         raise HTTPException(status_code=404, detail="No data")
-    return pd.concat([pd.read_csv(f) for f in files], ignore_index=True)
+    return df
 
 
 def _make_chart(fig, filename: str) -> str:
@@ -0,0 +1,216 @@
+"""
+Shared in-memory cache of task performance data.
+
+The metrics, files, compare and report routers read a task's records through
+:func:`cached_performance`, so the requests a dashboard page fires in parallel
+for one task parse its files once. Entries are evicted least recently used
+first to keep the cached frames within DATASET_CACHE_BYTES (0 disables the
+cache).
+
+Every entry remembers the inode, parsed size and mtime of the files it was
+built from, and is checked against them on each call:
+
+- nothing changed: the cached frame is served (finished tasks stay hot);
+- segments only grew, or new segments followed them (a running task): just the
+  appended rows are parsed and added to the frame;
+- anything else (columnar store written, shards merged, recovery): reloaded.
+
+Callers get a shallow copy, so adding or replacing columns does not touch the
+cached frame.
+"""
+
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from ..config import settings
+from .perf_store import COLUMNS_DIR, load_columns, load_performance, perf_csv_files
+from .segments import is_shard_segment, read_appended, renumber
+
+_Source = Tuple[int, int, int]  # inode, bytes parsed, mtime (ns)
+
+
+class _Entry:
+    __slots__ = ("frame", "sources", "rows", "store", "columnar", "nbytes")
+
+    def __init__(
+        self, frame: pd.DataFrame, sources: Dict[str, _Source], rows: Dict[str, int],
+        store: Optional[int], columnar: bool,
+    ):
+        self.frame = frame
+        self.sources = sources
+        self.rows = rows  # rows of each source in the frame, in file order
+        self.store = store  # manifest mtime seen at load (None: no columnar store)
+        self.columnar = columnar  # loaded from the store rather than parsed from the CSVs
+        self.nbytes = _frame_bytes(frame)
+
+
+def _frame_bytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def _store_stamp(data_dir: Path) -> Optional[int]:
+    try:
+        return (data_dir / COLUMNS_DIR / "manifest.json").stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+def _source(path: Path, parsed: int) -> _Source:
+    st = path.stat()
+    return st.st_ino, parsed, st.st_mtime_ns
+
+
+class DatasetCache:
+    """LRU of performance frames keyed by task directory, within a byte budget."""
+
+    def __init__(self):
+        self._entries: "OrderedDict[Path, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._stats = {"hits": 0, "refreshes": 0, "loads": 0, "evictions": 0}
+
+    @property
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "budget": settings.DATASET_CACHE_BYTES,
+        }
+
+    def performance(self, data_dir: Path) -> pd.DataFrame:
+        """All performance records of a task (empty DataFrame when there are none)."""
+        files = perf_csv_files(data_dir)
+        store = _store_stamp(data_dir)
+        entry = self._entries.get(data_dir)
+
+        if entry is not None and entry.store == store:
+            if self._unchanged(entry, files):
+                self._stats["hits"] += 1
+                self._entries.move_to_end(data_dir)
+                return entry.frame.copy(deep=False)
+            if not entry.columnar and self._appended(entry, files):
+                self._stats["refreshes"] += 1
+                self._refresh(data_dir, entry, files)
+                return entry.frame.copy(deep=False)
+
+        self._stats["loads"] += 1
+        entry = self._load(data_dir, files, store)
+        self._put(data_dir, entry)
+        return entry.frame.copy(deep=False)
+
+    def invalidate(self, data_dir: Path):
+        entry = self._entries.pop(data_dir, None)
+        if entry is not None:
+            self._bytes -= entry.nbytes
+
+    # ------------------------------------------------------------------
+    # Internal
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _unchanged(entry: _Entry, files: List[Path]) -> bool:
+        if [f.name for f in files] != list(entry.sources):
+            return False
+        for f in files:
+            try:
+                if _source(f, f.stat().st_size) != entry.sources[f.name]:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    @staticmethod
+    def _appended(entry: _Entry, files: List[Path]) -> bool:
+        """Known segments only grew and any new ones come after them."""
+        names = [f.name for f in files]
+        if names[:len(entry.sources)] != list(entry.sources):
+            return False
+        for f in files[:len(entry.sources)]:
+            ino, parsed, _ = entry.sources[f.name]
+            try:
+                st = f.stat()
+            except OSError:
+                return False
+            if st.st_ino != ino or st.st_size < parsed:
+                return False
+        return True
+
+    def _refresh(self, data_dir: Path, entry: _Entry, files: List[Path]):
+        columns = list(entry.frame.columns)
+        pieces, added, pos = [], [], 0
+        for f in files:
+            known = entry.sources.get(f.name)
+            count = entry.rows.get(f.name, 0)
+            if count:
+                pieces.append(entry.frame.iloc[pos:pos + count])
+                pos += count
+            if known is not None and f.stat().st_size == known[1]:
+                continue
+            df, parsed = read_appended(f, known[1], columns) if known else read_appended(f)
+            entry.sources[f.name] = _source(f, parsed)
+            if not df.empty:
+                # A shard's segment may grow while later ones exist: rows stay in file order
+                pieces.append(df)
+                added.append(df)
+                entry.rows[f.name] = count + len(df)
+        if not added:
+            return
+        entry.frame = pd.concat(pieces, ignore_index=True)
+        if is_shard_segment(files[0]):
+            renumber(entry.frame)
+        nbytes = sum(_frame_bytes(p) for p in added)
+        entry.nbytes += nbytes
+        self._bytes += nbytes
+        self._evict(keep=data_dir)
+
+    @staticmethod
+    def _load(data_dir: Path, files: List[Path], store: Optional[int]) -> _Entry:
+        sources, rows = {}, {}
+        df = load_columns(data_dir) if store is not None else None
+        columnar = df is not None
+        if columnar:
+            sources = {f.name: _source(f, f.stat().st_size) for f in files}
+        else:
+            parts = []
+            for f in files:
+                part, parsed = read_appended(f)
+                sources[f.name] = _source(f, parsed)
+                rows[f.name] = len(part)
+                parts.append(part)
+            df = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+            if files and is_shard_segment(files[0]):
+                renumber(df)  # each worker numbers its own rows
+        return _Entry(df, sources, rows, store, columnar)
+
+    def _put(self, data_dir: Path, entry: _Entry):
+        self.invalidate(data_dir)
+        if entry.frame.empty or entry.nbytes > settings.DATASET_CACHE_BYTES:
+            return
+        self._entries[data_dir] = entry
+        self._bytes += entry.nbytes
+        self._evict(keep=data_dir)
+
+    def _evict(self, keep: Path):
+        while self._bytes > settings.DATASET_CACHE_BYTES and len(self._entries) > 1:
+            oldest = next(iter(self._entries))
+            if oldest == keep:
+                self._entries.move_to_end(oldest)
+                continue
+            self.invalidate(oldest)
+            self._stats["evictions"] += 1
+        if self._bytes > settings.DATASET_CACHE_BYTES:
+            self.invalidate(keep)
+
+
+dataset_cache = DatasetCache()
+
+
+def cached_performance(data_dir: Path) -> pd.DataFrame:
+    """Performance records of a task, served from the shared cache when enabled."""
+    if settings.DATASET_CACHE_BYTES <= 0:
+        return load_performance(data_dir)
+    return dataset_cache.performance(Path(os.path.abspath(data_dir)))
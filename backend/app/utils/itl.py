@@ -0,0 +1,74 @@
+"""
+Inter-token latency (ITL) helpers.
+
+Per-token arrival offsets (ms since request arrival) are kept in an
+``array('d')`` while streaming and persisted per task in a compact binary
+sidecar, ``itl_offsets.bin``. Each record is::
+
+    16 bytes  request id (UUID bytes, or blake2b digest for non-UUID ids)
+    uint32    token count (little-endian)
+    float32[] offsets in ms
+"""
+
+import hashlib
+import struct
+import uuid
+from array import array
+from pathlib import Path
+from typing import Iterator, Tuple
+
+import numpy as np
+
+from ..config import settings
+
+ITL_FILE = "itl_offsets.bin"
+_HEADER = struct.Struct("<16sI")
+
+
+def request_key(request_id: str) -> bytes:
+    try:
+        return uuid.UUID(request_id).bytes
+    except ValueError:
+        return hashlib.blake2b(request_id.encode(), digest_size=16).digest()
+
+
+def itl_summary(offsets) -> dict:
+    """Per-request ITL p50/p99, max gap and number of gaps above ITL_STALL_MS."""
+    if len(offsets) < 2:
+        return {"itl_p50_ms": 0, "itl_p99_ms": 0, "itl_max_ms": 0, "stall_count": 0}
+    gaps = np.diff(np.asarray(offsets, dtype=np.float64))
+    p50, p99 = np.percentile(gaps, [50, 99])
+    return {
+        "itl_p50_ms": round(float(p50), 2),
+        "itl_p99_ms": round(float(p99), 2),
+        "itl_max_ms": round(float(gaps.max()), 2),
+        "stall_count": int((gaps > settings.ITL_STALL_MS).sum()),
+    }
+
+
+def append_itl_records(path: Path, records) -> None:
+    """Append (request_id, offsets) pairs to the sidecar file."""
+    parts = []
+    for request_id, offsets in records:
+        packed = array("f", offsets).tobytes()
+        parts.append(_HEADER.pack(request_key(request_id), len(offsets)))
+        parts.append(packed)
+    with open(path, "ab") as f:
+        f.write(b"".join(parts))
+
+
+def iter_itl_records(path: Path) -> Iterator[Tuple[bytes, np.ndarray]]:
+    """Yield (request key, float32 offsets) from a sidecar file."""
+    if not path.exists():
+        return
+    data = memoryview(path.read_bytes())
+    pos = 0
+    end = len(data)
+    while pos + _HEADER.size <= end:
+        key, count = _HEADER.unpack_from(data, pos)
+        pos += _HEADER.size
+        nbytes = count * 4
+        if pos + nbytes > end:
+            break  # truncated tail from an interrupted write
+        yield key, np.frombuffer(data, dtype="<f4", count=count, offset=pos)
+        pos += nbytes
@@ -0,0 +1,396 @@
+"""
+Row-offset index of a task's performance segments, for paging without loading
+the task.
+
+For every segment the index keeps the byte offset where each row starts (plain
+CSV) or where each compressed member starts and the number of rows before it
+(gzip/zstd, one member per flush). Reading a page then means locating its rows
+and reading just those bytes (or members), whatever the size of the task.
+
+Running tasks are indexed in memory and the index is extended with the rows
+appended since the previous call (a sharded task: its workers' segments, see
+segments.py). When a task is finalized the index is
+written to ``performance_index/`` together with a sort permutation for every
+column (text columns in string order, which for the timestamps is time order),
+so sorted pages of completed tasks are as cheap as unsorted
+ones. Like the columnar store (see perf_store.py), the manifest records the
+size of every source segment and a stale index is ignored.
+"""
+
+import io
+import json
+import os
+import shutil
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .perf_store import perf_csv_files
+from .segments import SEQ_COLUMN, _decompress, is_shard_segment
+
+INDEX_DIR = "performance_index"
+_MANIFEST = "manifest.json"
+_VERSION = 1
+_MAX_TASKS = 16  # task indexes kept in memory
+_SCAN_CHUNK = 1024 * 1024
+
+
+class _Segment:
+    """
+    Index of one segment. ``offsets[k]`` is where block k starts and
+    ``offsets[-1]`` where the indexed part ends; a block is one row in a plain
+    segment and one member in a compressed one, where ``firsts[k]`` is the
+    number of rows before block k.
+    """
+
+    __slots__ = ("name", "ino", "compressed", "offsets", "firsts")
+
+    def __init__(self, name: str, ino: int, compressed: bool):
+        self.name = name
+        self.ino = ino
+        self.compressed = compressed
+        self.offsets = np.zeros(1 if compressed else 0, dtype=np.int64)
+        self.firsts = np.zeros(1, dtype=np.int64) if compressed else None
+
+    @property
+    def rows(self) -> int:
+        if self.compressed:
+            return int(self.firsts[-1])
+        return max(len(self.offsets) - 1, 0)
+
+    @property
+    def end(self) -> int:
+        return int(self.offsets[-1]) if len(self.offsets) else 0
+
+
+def _scan_plain(seg: _Segment, path: Path) -> Optional[bytes]:
+    """Index the complete rows appended since the last scan; returns the header line once read."""
+    start = seg.end
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read()
+    ends = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == 10) + start + 1
+    if not len(ends):
+        return None
+    header = None
+    if not len(seg.offsets):
+        header = data[:ends[0] - start]
+    seg.offsets = np.concatenate([seg.offsets, ends])
+    return header
+
+
+def _decompressor(compressed_suffix: str):
+    if compressed_suffix == ".gz":
+        return zlib.decompressobj(wbits=31)
+    import zstandard
+    return zstandard.ZstdDecompressor().decompressobj()
+
+
+def _scan_members(seg: _Segment, path: Path) -> Optional[bytes]:
+    """Index the complete members appended since the last scan; returns the header line once read."""
+    start = seg.end
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = memoryview(f.read())
+    header = None
+    offsets, firsts = [], []
+    rows = seg.rows
+    pos = member_start = 0
+    d, lines, first_line = _decompressor(path.suffix), 0, b""
+    while pos < len(data):
+        chunk = data[pos:pos + _SCAN_CHUNK]
+        try:
+            text = d.decompress(chunk)
+        except Exception:
+            break  # torn member being written
+        lines += text.count(b"\n")
+        if start + member_start == 0 and len(first_line) < 64 * 1024:
+            first_line += text
+        if not d.eof:
+            pos += len(chunk)
+            continue
+        pos += len(chunk) - len(d.unused_data)
+        if start + member_start == 0:
+            header = first_line.split(b"\n", 1)[0] + b"\n"
+            lines -= 1
+        rows += lines
+        offsets.append(start + pos)
+        firsts.append(rows)
+        member_start = pos
+        d, lines = _decompressor(path.suffix), 0
+    if offsets:
+        seg.offsets = np.concatenate([seg.offsets, offsets])
+        seg.firsts = np.concatenate([seg.firsts, firsts])
+    return header
+
+
+def _columns(header: bytes) -> List[str]:
+    return list(pd.read_csv(io.BytesIO(header), nrows=0).columns)
+
+
+class TaskIndex:
+    """Row index of one task, plus the sort permutations of a completed one."""
+
+    def __init__(self, data_dir: Path):
+        self.data_dir = data_dir
+        self.segments: List[_Segment] = []
+        self.columns: List[str] = []
+        self.sorts: Dict[str, Tuple[np.ndarray, int]] = {}  # column -> (permutation, non-null rows)
+        self.persisted = False
+        self._starts = np.zeros(1, dtype=np.int64)  # rows before each segment, then the total
+
+    @property
+    def rows(self) -> int:
+        return int(self._starts[-1])
+
+    # ------------------------------------------------------------------
+    # Building
+    # ------------------------------------------------------------------
+
+    def refresh(self) -> "TaskIndex":
+        """Bring the index up to date with the segments; returns the index to use."""
+        files = perf_csv_files(self.data_dir)
+        if self.persisted:
+            if self._matches(files):
+                return self
+            return TaskIndex(self.data_dir).refresh()
+        if (self.data_dir / INDEX_DIR / _MANIFEST).exists():
+            # Written when the task was finalized
+            stored = _load_index(self.data_dir, files)
+            if stored is not None:
+                return stored
+        if not self._appended(files):
+            fresh = TaskIndex(self.data_dir)
+            fresh._scan(files)
+            return fresh
+        self._scan(files)
+        return self
+
+    def _matches(self, files: List[Path]) -> bool:
+        if [f.name for f in files] != [s.name for s in self.segments]:
+            return False
+        try:
+            return all(f.stat().st_size == s.end for f, s in zip(files, self.segments))
+        except OSError:
+            return False
+
+    def _appended(self, files: List[Path]) -> bool:
+        """Known segments only grew and any new ones come after them."""
+        if [f.name for f in files[:len(self.segments)]] != [s.name for s in self.segments]:
+            return False
+        for f, seg in zip(files, self.segments):
+            try:
+                st = f.stat()
+            except OSError:
+                return False
+            if st.st_ino != seg.ino or st.st_size < seg.end:
+                return False
+        return True
+
+    def _scan(self, files: List[Path]):
+        for i, path in enumerate(files):
+            if i == len(self.segments):
+                self.segments.append(_Segment(path.name, path.stat().st_ino, path.suffix in (".gz", ".zst")))
+            seg = self.segments[i]
+            if path.stat().st_size == seg.end:
+                continue
+            header = (_scan_members if seg.compressed else _scan_plain)(seg, path)
+            if header is not None and not self.columns:
+                self.columns = _columns(header)
+        self._starts = np.concatenate([[0], np.cumsum([s.rows for s in self.segments], dtype=np.int64)])
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+
+    def page(
+        self, start: int, size: int, sort_by: Optional[str] = None, descending: bool = False,
+    ) -> Optional[pd.DataFrame]:
+        """
+        Rows ``start .. start + size`` in the order requested. None when
+        ``sort_by`` is a column without a sort permutation (running task); an
+        unknown ``sort_by`` is ignored.
+        """
+        positions = np.arange(start, min(start + size, self.rows), dtype=np.int64)
+        if sort_by and sort_by in self.columns:
+            if sort_by not in self.sorts:
+                return None
+            perm, valid = self.sorts[sort_by]
+            if descending:
+                # Nulls stay last, as with DataFrame.sort_values
+                positions = np.where(positions < valid, valid - 1 - positions, positions)
+            positions = perm[positions].astype(np.int64)
+        return self.read_rows(positions)
+
+    def read_rows(self, rows: np.ndarray) -> pd.DataFrame:
+        """The given row numbers (task order), in the order given."""
+        if not len(rows):
+            return pd.DataFrame(columns=self.columns)
+        lines: Dict[int, bytes] = {}
+        segs = np.searchsorted(self._starts, rows, side="right") - 1
+        for s in np.unique(segs):
+            seg = self.segments[s]
+            local = np.unique(rows[segs == s]) - self._starts[s]
+            path = self.data_dir / seg.name
+            read = self._read_members if seg.compressed else self._read_plain
+            for row, line in read(seg, path, local):
+                lines[int(row + self._starts[s])] = line
+        text = b"".join(lines[int(r)] for r in rows)
+        df = pd.read_csv(io.BytesIO(text), header=None, names=self.columns)
+        if is_shard_segment(Path(self.segments[0].name)):
+            df[SEQ_COLUMN] = rows + 1  # workers number their own rows
+        return df
+
+    @staticmethod
+    def _read_plain(seg: _Segment, path: Path, local: np.ndarray):
+        # Runs of consecutive rows are read with one read
+        breaks = np.flatnonzero(np.diff(local) != 1) + 1
+        with open(path, "rb") as f:
+            for run in np.split(local, breaks):
+                first, last = int(run[0]), int(run[-1])
+                f.seek(int(seg.offsets[first]))
+                data = f.read(int(seg.offsets[last + 1] - seg.offsets[first]))
+                base = int(seg.offsets[first])
+                for row in range(first, last + 1):
+                    yield row, data[int(seg.offsets[row]) - base:int(seg.offsets[row + 1]) - base]
+
+    @staticmethod
+    def _read_members(seg: _Segment, path: Path, local: np.ndarray):
+        blocks = np.searchsorted(seg.firsts, local, side="right") - 1
+        with open(path, "rb") as f:
+            for b in np.unique(blocks):
+                f.seek(int(seg.offsets[b]))
+                text = _decompress(path.suffix, f.read(int(seg.offsets[b + 1] - seg.offsets[b])))
+                member = text.splitlines(keepends=True)
+                if b == 0:
+                    member = member[1:]  # header
+                for row in local[blocks == b]:
+                    yield int(row), member[int(row - seg.firsts[b])]
+
+
+# ----------------------------------------------------------------------
+# Persisted index
+# ----------------------------------------------------------------------
+
+def write_index(data_dir: Path, df: pd.DataFrame, files: Optional[List[Path]] = None):
+    """
+    Persist the row index of a finalized task with a sort permutation per
+    column of ``df`` (its records, read from ``files``).
+    """
+    files = perf_csv_files(data_dir) if files is None else files
+    index = TaskIndex(data_dir)
+    index._scan(files)
+    if index.rows != len(df):
+        raise ValueError(f"index has {index.rows} rows, records have {len(df)}")
+
+    tmp = data_dir / f".{INDEX_DIR}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir()
+    segments = [
+        {"name": s.name, "size": s.end, "compressed": s.compressed, "blocks": len(s.offsets)}
+        for s in index.segments
+    ]
+    np.save(tmp / "offsets.npy", np.concatenate([s.offsets for s in index.segments] or [np.zeros(0, np.int64)]))
+    firsts = [s.firsts for s in index.segments if s.compressed]
+    if firsts:
+        np.save(tmp / "firsts.npy", np.concatenate(firsts))
+
+    dtype = np.int32 if len(df) < 2 ** 31 else np.int64
+    sorts = {}
+    for i, name in enumerate(df.columns):
+        col = df[name]
+        if isinstance(col.dtype, np.dtype) and col.dtype.kind in "biuf":
+            values = col.to_numpy()
+            perm = np.argsort(values, kind="stable").astype(dtype)  # NaN sorts last
+            valid = len(values) - int(np.isnan(values).sum()) if values.dtype.kind == "f" else len(values)
+        else:
+            # Text: the codes of the sorted uniques, nulls (-1) moved last
+            try:
+                codes, _ = pd.factorize(col, sort=True)
+            except TypeError:
+                continue  # mixed types, no single order
+            codes = codes.astype(np.int64)
+            valid = int((codes >= 0).sum())
+            codes[codes < 0] = np.iinfo(np.int64).max
+            perm = np.argsort(codes, kind="stable").astype(dtype)
+        sorts[name] = {"file": f"sort_{i}.npy", "valid": valid}
+        np.save(tmp / sorts[name]["file"], perm)
+
+    manifest = {
+        "version": _VERSION, "rows": index.rows, "columns": index.columns,
+        "segments": segments, "sorts": sorts,
+    }
+    with open(tmp / _MANIFEST, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+
+    target = data_dir / INDEX_DIR
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp, target)
+
+
+def _load_index(data_dir: Path, files: List[Path]) -> Optional[TaskIndex]:
+    """The persisted index, memory-mapped, or None when missing or stale."""
+    store = data_dir / INDEX_DIR
+    try:
+        with open(store / _MANIFEST, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") != _VERSION:
+            return None
+        sources = {f.name: f.stat().st_size for f in files}
+        if sources != {s["name"]: s["size"] for s in manifest["segments"]}:
+            return None
+        mmap_mode = "r" if manifest["rows"] else None
+        offsets = np.load(store / "offsets.npy", mmap_mode=mmap_mode)
+        firsts = np.load(store / "firsts.npy", mmap_mode=mmap_mode) if (store / "firsts.npy").exists() else None
+        index = TaskIndex(data_dir)
+        pos = fpos = 0
+        for entry in manifest["segments"]:
+            seg = _Segment(entry["name"], 0, entry["compressed"])
+            seg.offsets = offsets[pos:pos + entry["blocks"]]
+            pos += entry["blocks"]
+            if seg.compressed:
+                seg.firsts = firsts[fpos:fpos + entry["blocks"]]
+                fpos += entry["blocks"]
+            index.segments.append(seg)
+        for name, entry in manifest["sorts"].items():
+            index.sorts[name] = (np.load(store / entry["file"], mmap_mode=mmap_mode), entry["valid"])
+    except (OSError, ValueError, KeyError):
+        return None
+    index.columns = manifest["columns"]
+    index.persisted = True
+    index._starts = np.concatenate([[0], np.cumsum([s.rows for s in index.segments], dtype=np.int64)])
+    return index
+
+
+# ----------------------------------------------------------------------
+# In-memory indexes
+# ----------------------------------------------------------------------
+
+_indexes: "OrderedDict[Path, TaskIndex]" = OrderedDict()
+
+
+def task_index(data_dir: Path) -> TaskIndex:
+    """The up-to-date row index of a task (kept for the _MAX_TASKS most recent tasks)."""
+    data_dir = Path(os.path.abspath(data_dir))
+    index = _indexes.pop(data_dir, None) or TaskIndex(data_dir)
+    index = index.refresh()
+    _indexes[data_dir] = index
+    while len(_indexes) > _MAX_TASKS:
+        _indexes.popitem(last=False)
+    return index
+
+
+def performance_page(
+    data_dir: Path, start: int, size: int, sort_by: Optional[str] = None, descending: bool = False,
+) -> Optional[Tuple[int, pd.DataFrame]]:
+    """
+    Total record count and one page of records, read through the row index.
+    None when the page needs a sort the index has no permutation for.
+    """
+    index = task_index(data_dir)
+    df = index.page(start, size, sort_by, descending)
+    return None if df is None else (index.rows, df)
@@ -0,0 +1,135 @@
+"""
+Columnar copy of a task's performance records.
+
+When a task is finalized its rotated ``performance_data_*.csv`` segments are
+compacted into ``performance_columns/``: one ``.npy`` file per column plus a
+``manifest.json``. Numeric columns keep their dtype and are memory-mapped on
+load. Text columns whose values repeat (model, upstream, the per-second
+timestamps) are dictionary-encoded: int32 codes, -1 for missing, and the
+distinct values in the manifest. Columns of mostly distinct values (request
+ids) are stored as fixed-width strings instead, with a mask file when some are
+missing, and memory-mapped too. The manifest also records the size of every
+source CSV, so a store that no longer matches the CSVs is ignored.
+
+Readers go through :func:`load_performance`, which falls back to parsing the
+segments when there is no usable store (running tasks, tasks from older versions).
+"""
+
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .segments import PERF_PREFIX, read_segments, task_segment_files
+
+COLUMNS_DIR = "performance_columns"
+_MANIFEST = "manifest.json"
+_VERSION = 2
+_READABLE = (1, 2)  # version 1 dictionary-encoded every text column
+_DICT_MIN_REPEAT = 4  # rows per distinct value, on average, for a dictionary
+_DICT_ALWAYS = 4096  # distinct values dictionary-encoded whatever the repetition
+
+
+def perf_csv_files(data_dir: Path) -> List[Path]:
+    return task_segment_files(data_dir, PERF_PREFIX)
+
+
+def _sources(files: List[Path]) -> dict:
+    return {f.name: f.stat().st_size for f in files}
+
+
+def _is_numeric(col: pd.Series) -> bool:
+    return isinstance(col.dtype, np.dtype) and col.dtype.kind in "biuf"
+
+
+def write_columns(data_dir: Path, df: pd.DataFrame, files: Optional[List[Path]] = None):
+    """Replace the task's columnar store with ``df`` (read from ``files``)."""
+    files = perf_csv_files(data_dir) if files is None else files
+    tmp = data_dir / f".{COLUMNS_DIR}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir()
+
+    columns = []
+    for i, name in enumerate(df.columns):
+        col = df[name]
+        entry = {"name": name, "file": f"c{i}.npy"}
+        if _is_numeric(col):
+            np.save(tmp / entry["file"], col.to_numpy())
+        else:
+            codes, uniques = pd.factorize(col)
+            if len(uniques) <= max(_DICT_ALWAYS, len(df) // _DICT_MIN_REPEAT):
+                np.save(tmp / entry["file"], codes.astype(np.int32))
+                entry["values"] = list(uniques)
+            else:
+                _save_text(tmp, i, entry, col.to_numpy(dtype=object), codes < 0)
+        columns.append(entry)
+
+    manifest = {"version": _VERSION, "rows": len(df), "sources": _sources(files), "columns": columns}
+    with open(tmp / _MANIFEST, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, default=str)
+
+    target = data_dir / COLUMNS_DIR
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp, target)
+
+
+def _save_text(tmp: Path, i: int, entry: dict, values: np.ndarray, missing: np.ndarray):
+    """Fixed-width strings: bytes when all ASCII, else unicode."""
+    values = values.copy()
+    values[missing] = ""
+    text = values.astype(str)
+    try:
+        text = text.astype(np.bytes_)
+    except UnicodeEncodeError:
+        pass
+    np.save(tmp / entry["file"], text)
+    entry["text"] = True
+    if missing.any():
+        entry["nulls"] = f"n{i}.npy"
+        np.save(tmp / entry["nulls"], missing)
+
+
+def load_columns(data_dir: Path) -> Optional[pd.DataFrame]:
+    """The columnar store as a DataFrame, or None when missing or stale."""
+    store = data_dir / COLUMNS_DIR
+    try:
+        with open(store / _MANIFEST, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") not in _READABLE or manifest.get("sources") != _sources(perf_csv_files(data_dir)):
+        return None
+
+    # Copy-on-write mapping: callers may modify the frame without touching the files
+    mmap_mode = "c" if manifest["rows"] else None
+    data = {}
+    for entry in manifest["columns"]:
+        values = np.load(store / entry["file"], mmap_mode=mmap_mode).view(np.ndarray)
+        if "values" in entry:
+            lookup = np.empty(len(entry["values"]) + 1, dtype=object)
+            lookup[:-1] = entry["values"]
+            lookup[-1] = np.nan  # code -1
+            values = lookup[values]
+        elif entry.get("text"):
+            if values.dtype.kind == "S":
+                # ASCII: widen the bytes to UCS4 code points, far faster than astype(str)
+                width = values.dtype.itemsize
+                values = values.view(np.uint8).reshape(len(values), width).astype(np.uint32).view(f"U{width}")
+                values = values.reshape(len(values))
+            if "nulls" in entry:
+                values = values.astype(object)
+                values[np.load(store / entry["nulls"])] = np.nan
+        data[entry["name"]] = values
+    return pd.DataFrame(data, copy=False)
+
+
+def load_performance(data_dir: Path) -> pd.DataFrame:
+    """All performance records of a task (empty DataFrame when there are none)."""
+    df = load_columns(data_dir)
+    if df is not None:
+        return df
+    return read_segments(data_dir, PERF_PREFIX)
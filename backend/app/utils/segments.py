@@ -0,0 +1,168 @@
+"""
+Rotated CSV segments of a task: ``performance_data_N.csv`` and ``qa_pairs_N.csv``.
+
+With AICP_DATA_COMPRESSION=gzip|zstd the writer appends every flush as its own
+compressed member/frame (``.csv.gz`` / ``.csv.zst``). A segment is therefore a
+valid compressed file after each flush, and readers can open it while the task
+is still running. Readers should go through :func:`task_segment_files` and
+:func:`read_segments`, which list segments in index order and decompress them
+transparently. zstd needs the optional ``zstandard`` package.
+
+While a sharded task (AICP_WORKERS > 1) runs, every worker writes its own
+``performance_data_w<pid>_N.csv`` segments; readers then list those, segment
+index first and shard second, and number the rows (序号) by their position in
+that listing, since each worker numbers its own. Merging the shards at stop
+puts the records in arrival order (see collect/shards.py).
+"""
+
+import gzip
+import io
+import re
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from ..config import settings
+
+PERF_PREFIX = "performance_data"
+QA_PREFIX = "qa_pairs"
+COMPRESSIONS = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+SEQ_COLUMN = "序号"
+_SHARD_SEGMENT = re.compile(r"(.+)_(w\d+)_(\d+)\.csv(\.gz|\.zst)?")
+
+
+def compression_ext(compression: Optional[str] = None) -> str:
+    """File suffix for a compression setting; raises ValueError if unusable."""
+    compression = compression or settings.DATA_COMPRESSION
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"DATA_COMPRESSION must be one of {tuple(COMPRESSIONS)}")
+    if compression == "zstd":
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            raise ValueError("zstd compression needs the zstandard package") from None
+    return COMPRESSIONS[compression]
+
+
+def segment_path(data_dir: Path, prefix: str, index: int, ext: str = "") -> Path:
+    return data_dir / f"{prefix}_{index}.csv{ext}"
+
+
+def segment_files(data_dir: Path, prefix: str) -> List[Path]:
+    """Segments of ``prefix`` in index order (10 after 9), plain or compressed."""
+    pattern = re.compile(rf"{re.escape(prefix)}_(\d+)\.csv(\.gz|\.zst)?")
+    found = []
+    for path in data_dir.glob(f"{prefix}_*.csv*"):
+        match = pattern.fullmatch(path.name)
+        if match:
+            found.append((int(match.group(1)), path))
+    return [path for _, path in sorted(found)]
+
+
+def task_segment_files(data_dir: Path, prefix: str) -> List[Path]:
+    """
+    Segments a reader should see: the task's own, or the per-worker segments
+    of a sharded task that has not been merged yet.
+    """
+    files = segment_files(data_dir, prefix)
+    if files:
+        return files
+    found = []
+    for path in data_dir.glob(f"{prefix}_w*_*.csv*"):
+        match = _SHARD_SEGMENT.fullmatch(path.name)
+        if match and match.group(1) == prefix:
+            found.append((int(match.group(3)), match.group(2), path))
+    # New segments of any worker sort after the ones already read
+    return [path for _, _, path in sorted(found)]
+
+
+def is_shard_segment(path: Path) -> bool:
+    return _SHARD_SEGMENT.fullmatch(path.name) is not None
+
+
+def renumber(df: pd.DataFrame, first: int = 1) -> pd.DataFrame:
+    """Number the rows of a sharded listing from ``first`` (in place)."""
+    if SEQ_COLUMN in df.columns:
+        df[SEQ_COLUMN] = np.arange(first, first + len(df), dtype=np.int64)
+    return df
+
+
+def append_segment(path: Path, text: str, new: bool) -> int:
+    """
+    Append CSV text to a segment (as one compressed member if compressed).
+    Returns the uncompressed size appended, which is what MAX_FILE_BYTES limits.
+    """
+    data = text.encode("utf-8-sig" if new else "utf-8")
+    size = len(data)
+    if path.suffix == ".gz":
+        data = gzip.compress(data, compresslevel=6)
+    elif path.suffix == ".zst":
+        import zstandard
+        data = zstandard.ZstdCompressor().compress(data)
+    with open(path, "ab") as f:
+        f.write(data)
+    return size
+
+
+def read_segment(path: Path) -> pd.DataFrame:
+    if path.suffix == ".zst":
+        # One frame per flush: read across frames explicitly
+        import zstandard
+        with open(path, "rb") as f:
+            reader = zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+            return pd.read_csv(reader)
+    return pd.read_csv(path)  # gzip members are read back to back
+
+
+def _decompress(suffix: str, data: bytes) -> bytes:
+    if suffix == ".gz":
+        return gzip.decompress(data)
+    import zstandard
+    try:
+        reader = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data), read_across_frames=True)
+        return reader.read()
+    except zstandard.ZstdError as e:
+        raise ValueError(str(e)) from None
+
+
+def read_appended(
+    path: Path, offset: int = 0, columns: Optional[List[str]] = None,
+) -> Tuple[pd.DataFrame, int]:
+    """
+    Rows of a segment from byte ``offset`` on, and the offset to continue from
+    once more rows are appended. Without ``columns`` the data starts with the
+    header (offset 0). Incomplete trailing writes are left for the next call;
+    plain segments are cut at the last newline, so this is for performance
+    segments (QA text may contain quoted newlines).
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read()
+    if path.suffix in (".gz", ".zst"):
+        # Whole members/frames only: a flush still being written is picked up next time
+        try:
+            text = _decompress(path.suffix, data)
+        except (EOFError, OSError, ValueError):
+            text = b""
+        if not text.endswith(b"\n"):
+            return pd.DataFrame(columns=columns or []), offset
+        end = len(data)
+    else:
+        end = data.rfind(b"\n") + 1
+        text = data[:end]
+    if not text.strip():
+        return pd.DataFrame(columns=columns or []), offset + end
+    if columns is None:
+        return pd.read_csv(io.BytesIO(text)), offset + end
+    return pd.read_csv(io.BytesIO(text), header=None, names=columns), offset + end
+
+
+def read_segments(data_dir: Path, prefix: str) -> pd.DataFrame:
+    """All segments of ``prefix`` concatenated (empty DataFrame when there are none)."""
+    files = task_segment_files(data_dir, prefix)
+    if not files:
+        return pd.DataFrame()
+    df = pd.concat([read_segment(f) for f in files], ignore_index=True)
+    return renumber(df) if is_shard_segment(files[0]) else df
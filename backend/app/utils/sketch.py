@@ -0,0 +1,303 @@
+"""
+Mergeable quantile sketches for task summaries.
+
+``DDSketch`` keeps non-negative values in logarithmic buckets, so every
+quantile it reports is within ``alpha`` (1%) relative error of the exact value,
+while count/sum/min/max are exact. Two sketches with the same ``alpha`` merge
+by adding bucket counts.
+
+``SummarySketch`` holds one DDSketch per summary metric plus the request
+counters. The writer updates it for every record and persists it as
+``metrics_sketch.json`` (``metrics_sketch_w<pid>.json`` per shard), so summaries
+are built from it without re-reading the records, and sketches from shards or
+from several tasks can be merged.
+"""
+
+import json
+import math
+import os
+from pathlib import Path
+from typing import Dict, Optional
+
+SKETCH_FILE = "metrics_sketch.json"
+SKETCH_METRICS = (
+    "ttft_ms", "tpot_ms", "tps", "e2e_latency_ms", "prompt_tokens", "completion_tokens",
+    "queue_wait_ms", "itl_p99_ms",
+)
+_MIN_VALUE = 1e-9  # smaller values share the zero bucket
+
+
+def _number(value) -> float:
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return 0.0 if math.isnan(value) else value
+
+
+class DDSketch:
+    """Relative-error quantile sketch (DDSketch) with exact count/sum/min/max."""
+
+    __slots__ = ("alpha", "_gamma", "_log_gamma", "bins", "zeros", "count", "sum", "min", "max")
+
+    def __init__(self, alpha: float = 0.01):
+        self.alpha = alpha
+        self._gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = math.log(self._gamma)
+        self.bins: Dict[int, int] = {}
+        self.zeros = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float):
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if value <= _MIN_VALUE:
+            self.zeros += 1
+        else:
+            index = math.ceil(math.log(value) / self._log_gamma)
+            self.bins[index] = self.bins.get(index, 0) + 1
+
+    def merge(self, other: "DDSketch"):
+        if other.alpha != self.alpha:
+            raise ValueError("Cannot merge sketches with different alpha")
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> float:
+        """Linear interpolation between the closest ranks, like pandas' default."""
+        if not self.count:
+            return 0.0
+        rank = q * (self.count - 1)
+        low = math.floor(rank)
+        lower = self._value_at(low)
+        if rank == low:
+            return lower
+        return lower + (self._value_at(low + 1) - lower) * (rank - low)
+
+    def _value_at(self, rank: int) -> float:
+        seen = self.zeros
+        if rank < seen:
+            return self.min
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                value = 2 * self._gamma ** index / (self._gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def stats(self) -> dict:
+        """Same shape as the pandas-based summaries: avg, p50/p90/p99, min, max."""
+        if not self.count:
+            return {"avg": 0.0, "p50": 0.0, "p90": 0.0, "p99": 0.0, "min": 0.0, "max": 0.0}
+        return {
+            "avg": round(self.sum / self.count, 2),
+            "p50": round(self.quantile(0.5), 2),
+            "p90": round(self.quantile(0.9), 2),
+            "p99": round(self.quantile(0.99), 2),
+            "min": round(self.min, 2),
+            "max": round(self.max, 2),
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            "alpha": self.alpha, "count": self.count, "sum": self.sum, "zeros": self.zeros,
+            "min": self.min if self.count else None, "max": self.max if self.count else None,
+            "bins": {str(i): c for i, c in self.bins.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "DDSketch":
+        sketch = cls(data["alpha"])
+        sketch.count = data["count"]
+        sketch.sum = data["sum"]
+        sketch.zeros = data["zeros"]
+        if sketch.count:
+            sketch.min, sketch.max = data["min"], data["max"]
+        sketch.bins = {int(i): c for i, c in data["bins"].items()}
+        return sketch
+
+
+class _Group:
+    """Sketches and totals of one set of requests."""
+
+    __slots__ = ("metrics", "cached_tokens", "stall_count", "stalled_requests")
+
+    def __init__(self):
+        self.metrics = {name: DDSketch() for name in SKETCH_METRICS}
+        self.cached_tokens = 0
+        self.stall_count = 0
+        self.stalled_requests = 0
+
+    @property
+    def count(self) -> int:
+        return self.metrics[SKETCH_METRICS[0]].count
+
+    def add(self, row: dict):
+        for name, sketch in self.metrics.items():
+            sketch.add(_number(row.get(name)))
+        self.cached_tokens += int(_number(row.get("cached_tokens")))
+        stalls = int(_number(row.get("stall_count")))
+        self.stall_count += stalls
+        self.stalled_requests += stalls > 0
+
+    def merge(self, other: "_Group"):
+        for name, sketch in self.metrics.items():
+            sketch.merge(other.metrics[name])
+        self.cached_tokens += other.cached_tokens
+        self.stall_count += other.stall_count
+        self.stalled_requests += other.stalled_requests
+
+    def to_dict(self) -> dict:
+        return {
+            "metrics": {name: sketch.to_dict() for name, sketch in self.metrics.items()},
+            "cached_tokens": self.cached_tokens,
+            "stall_count": self.stall_count,
+            "stalled_requests": self.stalled_requests,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "_Group":
+        group = cls()
+        for name, sketch in data["metrics"].items():
+            group.metrics[name] = DDSketch.from_dict(sketch)
+        group.cached_tokens = data["cached_tokens"]
+        group.stall_count = data["stall_count"]
+        group.stalled_requests = data["stalled_requests"]
+        return group
+
+
+class SummarySketch:
+    """
+    Running summary of a task's performance rows. Aborted requests and cache
+    hits are kept in a separate group and, as in the pandas summaries, only used
+    for the statistics when nothing else was recorded.
+    """
+
+    def __init__(self):
+        self.completed = _Group()
+        self.excluded = _Group()
+        self.total = 0
+        self.aborted = 0
+        self.cache_hits = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.first_arrival = ""
+        self.last_completion = ""
+
+    def add(self, row: dict):
+        """Add one performance row (the dict written to the CSV)."""
+        aborted = bool(_number(row.get("aborted")))
+        cache_hit = bool(_number(row.get("cache_hit")))
+        self.total += 1
+        self.aborted += aborted
+        self.cache_hits += cache_hit
+        self.hedged += bool(_number(row.get("hedged")))
+        self.hedge_wins += _number(row.get("attempt")) == 2
+        (self.excluded if aborted or cache_hit else self.completed).add(row)
+        self._times(str(row.get("arrival_time", "")), str(row.get("completion_time", "")))
+
+    def merge(self, other: "SummarySketch"):
+        self.completed.merge(other.completed)
+        self.excluded.merge(other.excluded)
+        self.total += other.total
+        self.aborted += other.aborted
+        self.cache_hits += other.cache_hits
+        self.hedged += other.hedged
+        self.hedge_wins += other.hedge_wins
+        self._times(other.first_arrival, other.last_completion)
+
+    def _times(self, arrival: str, completion: str):
+        if arrival and (not self.first_arrival or arrival < self.first_arrival):
+            self.first_arrival = arrival
+        if completion > self.last_completion:
+            self.last_completion = completion
+
+    def summary(self) -> dict:
+        """Counters, time range and per-metric statistics."""
+        group = self.completed if self.completed.count else self.excluded
+        count = group.count
+        stats = {name: sketch.stats() for name, sketch in group.metrics.items()}
+        stats["cached_tokens"] = {
+            "avg": round(group.cached_tokens / count, 2) if count else 0.0,
+            "total": group.cached_tokens,
+        }
+        stats["stall_count"] = {
+            "total": group.stall_count,
+            "requests_with_stalls": group.stalled_requests,
+        }
+        return {
+            "total_requests": self.total,
+            "aborted_requests": self.aborted,
+            "cache_hits": self.cache_hits,
+            "hedged_requests": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "time_range": {"start": self.first_arrival, "end": self.last_completion},
+            "summary": stats,
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            "completed": self.completed.to_dict(),
+            "excluded": self.excluded.to_dict(),
+            "total": self.total,
+            "aborted": self.aborted,
+            "cache_hits": self.cache_hits,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "first_arrival": self.first_arrival,
+            "last_completion": self.last_completion,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SummarySketch":
+        sketch = cls()
+        sketch.completed = _Group.from_dict(data["completed"])
+        sketch.excluded = _Group.from_dict(data["excluded"])
+        for key in ("total", "aborted", "cache_hits", "hedged", "hedge_wins",
+                    "first_arrival", "last_completion"):
+            setattr(sketch, key, data[key])
+        return sketch
+
+    def save(self, path: Path):
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["SummarySketch"]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return cls.from_dict(json.load(f))
+        except FileNotFoundError:
+            return None
+
+
+def load_task_sketch(data_dir: Path) -> Optional[SummarySketch]:
+    """Merge every sketch file of a task (the task's own plus running shards)."""
+    merged = None
+    stem, _, ext = SKETCH_FILE.partition(".")
+    for path in sorted(data_dir.glob(f"{stem}*.{ext}")):
+        try:
+            sketch = SummarySketch.load(path)
+        except (OSError, ValueError, KeyError):
+            continue  # being replaced
+        if sketch is None:
+            continue
+        if merged is None:
+            merged = sketch
+        else:
+            merged.merge(sketch)
+    return merged
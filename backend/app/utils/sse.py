@@ -0,0 +1,94 @@
+"""
+Incremental SSE framing shared by the proxy and the benchmark client.
+Keeps one growing bytearray per stream and resumes the boundary scan from the
+last unresolved offset, so each upstream byte is copied out once.
+"""
+
+from typing import List, Optional
+
+
+class SSEFramer:
+    """Split a byte stream into complete SSE messages (``\\n\\n`` or ``\\r\\n\\r\\n``)."""
+
+    __slots__ = ("_buf", "_scan", "bytes_in", "bytes_copied", "messages")
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._scan = 0
+        self.bytes_in = 0
+        self.bytes_copied = 0
+        self.messages = 0
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        """Append a raw upstream chunk and return the messages it completed."""
+        buf = self._buf
+        buf += chunk
+        self.bytes_in += len(chunk)
+
+        out = []
+        start = 0
+        pos = self._scan
+        end = len(buf)
+        while True:
+            nl = buf.find(b"\n", pos)
+            if nl < 0:
+                pos = end
+                break
+            if nl + 1 >= end:
+                # Need the next byte to decide; rescan this newline next time.
+                pos = nl
+                break
+            nxt = buf[nl + 1]
+            if nxt == 0x0A:  # \n\n
+                boundary = nl + 2
+            elif nxt == 0x0D:  # \n\r\n
+                if nl + 2 >= end:
+                    pos = nl
+                    break
+                if buf[nl + 2] != 0x0A:
+                    pos = nl + 1
+                    continue
+                boundary = nl + 3
+            else:
+                pos = nl + 1
+                continue
+            out.append(bytes(buf[start:boundary]))
+            self.bytes_copied += boundary - start
+            start = pos = boundary
+
+        if start:
+            self.bytes_copied += end - start
+            del buf[:start]
+            pos -= start
+        self._scan = pos
+        self.messages += len(out)
+        return out
+
+    def flush(self) -> bytes:
+        """Return (and clear) any trailing bytes that never saw a boundary."""
+        tail = bytes(self._buf)
+        self.bytes_copied += len(tail)
+        self._buf.clear()
+        self._scan = 0
+        return tail
+
+
+def sse_event_data(message: bytes) -> Optional[bytes]:
+    """
+    Join the ``data:`` lines of one SSE message.
+    Returns None for messages without data (comments, keep-alives).
+    """
+    if message.startswith(b"data:"):
+        # Fast path: the common single-line ``data: {...}\n\n`` event.
+        data = message[5:].rstrip(b"\r\n")
+        if b"\n" not in data and b"\r" not in data:
+            return data[1:] if data[:1] == b" " else data
+
+    parts = []
+    for line in message.splitlines():
+        if line.startswith(b"data:"):
+            value = line[5:]
+            parts.append(value[1:] if value[:1] == b" " else value)
+    if not parts:
+        return None
+    return b"\n".join(parts)
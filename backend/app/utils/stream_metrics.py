@@ -0,0 +1,176 @@
+"""
+Per-request metric extraction from OpenAI-compatible SSE events.
+
+With the orjson parser, plain content deltas are not JSON-decoded: the content
+string is sliced straight out of the payload bytes. Only events that carry
+``usage``/``finish_reason`` (or anything the byte scan cannot handle safely)
+are fully parsed. The stdlib parser fully decodes every event.
+
+``capture`` follows the collection QA mode: full/jsonl keep every content
+delta, truncate keeps the first ``limit`` characters, hash keeps only a running
+digest and metrics keeps nothing. Character counts are always tracked.
+"""
+
+import hashlib
+import json
+import time
+from array import array
+from typing import Any, Dict, List, Optional
+
+import orjson
+
+from ..config import settings
+from .sse import sse_event_data
+
+_CONTENT_KEY = b'"content":'
+_DELTA_KEY = b'"delta"'
+
+
+def _has_value(payload: bytes, key: bytes) -> bool:
+    """True if ``key`` appears in payload with a non-null value."""
+    i = payload.find(key)
+    if i < 0:
+        return False
+    j = i + len(key)
+    n = len(payload)
+    while j < n and payload[j] in b" \t:":
+        j += 1
+    return not payload.startswith(b"null", j)
+
+
+class StreamMetrics:
+    """
+    Accumulate TTFT, per-token arrival offsets, chunk count, finish_reason,
+    usage and content from SSE events.
+    """
+
+    __slots__ = (
+        "model", "start", "first_token_time", "token_offsets", "chunk_count", "usage",
+        "finish_reason", "response_id", "response_parts", "response_chars", "full_parses",
+        "capture", "limit", "_hasher", "_loads", "_selective",
+    )
+
+    def __init__(
+        self, model: str, start: Optional[float] = None, parser: Optional[str] = None,
+        capture: str = "full", limit: int = 0,
+    ):
+        parser = parser or settings.SSE_PARSER
+        self.model = model
+        self.start = start if start is not None else time.time()
+        self.first_token_time: Optional[float] = None
+        self.token_offsets = array("d")  # ms since start, one per content chunk
+        self.chunk_count = 0
+        self.usage: Dict[str, Any] = {}
+        self.finish_reason: Optional[str] = None
+        self.response_id: Optional[str] = None
+        self.response_parts: List[str] = []
+        self.response_chars = 0
+        self.capture = capture
+        self.limit = limit
+        self._hasher = hashlib.blake2b(digest_size=16) if capture == "hash" else None
+        self.full_parses = 0
+        self._selective = parser == "orjson"
+        self._loads = orjson.loads if self._selective else json.loads
+
+    @property
+    def response_content(self) -> str:
+        if self._hasher is not None:
+            return "blake2b:" + self._hasher.hexdigest()
+        return "".join(self.response_parts)
+
+    def feed(self, message: bytes) -> None:
+        """Consume one framed SSE message."""
+        payload = sse_event_data(message)
+        if payload is None:
+            return
+        payload = payload.strip()
+        if payload in (b"[DONE]", b""):
+            return
+
+        if self._selective and self.response_id is not None:
+            if not (_has_value(payload, b'"usage"') or _has_value(payload, b'"finish_reason"')):
+                if self._feed_delta(payload):
+                    return
+
+        try:
+            data = self._loads(payload)
+        except ValueError:
+            return
+        if not isinstance(data, dict):
+            return
+        self.full_parses += 1
+        self._apply(data)
+
+    # ------------------------------------------------------------------
+    # Internal
+    # ------------------------------------------------------------------
+
+    def _feed_delta(self, payload: bytes) -> bool:
+        """
+        Handle a plain content delta without decoding JSON.
+        Returns False when the event needs a full parse.
+        """
+        i = payload.find(_CONTENT_KEY)
+        if i < 0:
+            # Role-only / keep-alive chunk: counts, carries no content.
+            self.chunk_count += 1
+            return True
+        if payload.find(_CONTENT_KEY, i + len(_CONTENT_KEY)) >= 0:
+            return False  # e.g. logprobs.content alongside delta.content
+        if payload.rfind(_DELTA_KEY, 0, i) < 0:
+            return False
+
+        j = i + len(_CONTENT_KEY)
+        while payload[j:j + 1] in (b" ", b"\t"):
+            j += 1
+        if payload.startswith(b"null", j):
+            self.chunk_count += 1
+            return True
+        if payload[j:j + 1] != b'"':
+            return False
+        end = payload.find(b'"', j + 1)
+        if end < 0 or payload.find(b"\\", j + 1, end) >= 0:
+            return False  # escapes need the real decoder
+
+        if end > j + 1:
+            try:
+                content = payload[j + 1:end].decode("utf-8")
+            except UnicodeDecodeError:
+                return False
+            self._token(content)
+        self.chunk_count += 1
+        return True
+
+    def _token(self, content: str) -> None:
+        now = time.time()
+        capture = self.capture
+        if capture == "full" or capture == "jsonl":
+            self.response_parts.append(content)
+        elif capture == "truncate":
+            room = self.limit - self.response_chars
+            if room > 0:
+                self.response_parts.append(content[:room])
+        elif capture == "hash":
+            self._hasher.update(content.encode("utf-8"))
+        self.response_chars += len(content)
+        self.token_offsets.append((now - self.start) * 1000)
+        if self.first_token_time is None:
+            self.first_token_time = now
+
+    def _apply(self, data: dict) -> None:
+        if self.response_id is None:
+            self.response_id = data.get("id") or ""
+        if data.get("usage"):
+            self.usage = data["usage"]
+        self.model = data.get("model") or self.model
+        choices = data.get("choices") or []
+        if choices:
+            choice = choices[0]
+            delta = choice.get("delta") or {}
+            content = delta.get("content")
+            if content:
+                self._token(content)
+            fr = choice.get("finish_reason")
+            if fr:
+                self.finish_reason = fr
+        self.chunk_count += 1
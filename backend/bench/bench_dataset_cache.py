@@ -0,0 +1,57 @@
+"""
+Benchmark: the shared dataset cache on a dashboard page load and on a running
+task. A page load reads the same task three times (summary, distributions,
+one page of records); a running task gets one more flush appended between
+two reads.
+
+    cd backend && python -m bench.bench_dataset_cache [records]
+"""
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from app.config import settings
+from app.utils.dataset_cache import cached_performance, dataset_cache
+from app.utils.perf_store import load_performance
+
+from .bench_perf_loader import _make_task
+
+
+def _timed(fn, repeat: int = 1) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) * 1000
+
+
+def main():
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 300000
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(tmp)
+        _make_task(data_dir, records)
+
+        uncached = _timed(lambda: load_performance(data_dir), repeat=3)
+        cold = _timed(lambda: cached_performance(data_dir))
+        warm = _timed(lambda: cached_performance(data_dir), repeat=2)
+        print(f"page load, 3 reads of {records:,} records")
+        print(f"  uncached  {uncached:8.1f}ms")
+        print(f"  cached    {cold + warm:8.1f}ms (first read {cold:.1f}ms, then {warm / 2:.2f}ms each)")
+
+        # Running task: one flush of 500 records appended to the last segment
+        last = sorted(data_dir.glob("performance_data_*.csv"))[-1]
+        lines = last.read_bytes().splitlines(keepends=True)
+        with open(last, "ab") as f:
+            f.write(b"".join(lines[1:501]))
+        full = _timed(lambda: load_performance(data_dir))
+        incremental = _timed(lambda: cached_performance(data_dir))
+        assert len(cached_performance(data_dir)) == records + 500
+        print("running task, 500 records appended")
+        print(f"  full re-read  {full:8.1f}ms")
+        print(f"  incremental   {incremental:8.1f}ms")
+        print(f"  {dataset_cache.stats} (budget {settings.DATASET_CACHE_BYTES / 2**20:.0f}MB)")
+
+
+if __name__ == "__main__":
+    main()
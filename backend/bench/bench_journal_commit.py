@@ -0,0 +1,70 @@
+"""
+Benchmark: journal group commit vs. committing every record.
+Records arrive at a fixed rate while the writer journals them. "per-record"
+fsyncs each append before the next one is added (what a naive write-ahead log
+costs); the other rows use the journal's group commit with different
+JOURNAL_COMMIT_MS budgets. Reports fsyncs, records per fsync, fsync time and
+the event-loop lag seen by a 1 ms ticker.
+
+    cd backend && python -m bench.bench_journal_commit
+"""
+
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+from loguru import logger
+
+from app.collect.data_writer import PerformanceDataWriter
+from app.config import settings
+
+from .bench_writer_loop_lag import _stat, _ticker
+
+
+class _PerRecordWriter(PerformanceDataWriter):
+    async def add_record(self, stat: dict):
+        await super().add_record(stat)
+        await self.journal._commit()
+
+
+async def _run(cls, records: int, rate: int):
+    lags = []
+    stop = asyncio.Event()
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = cls("bench", Path(tmp), qa_mode="full")
+        ticker = asyncio.create_task(_ticker(lags, stop))
+        start = time.perf_counter()
+        for i in range(records):
+            await writer.add_record(_stat(i))
+            if i % 10 == 9:
+                await asyncio.sleep(max(0.0, start + (i + 1) / rate - time.perf_counter()))
+        elapsed = time.perf_counter() - start
+        stats = writer.journal.stats
+        await writer.finalize(summary=False)
+        stop.set()
+        await ticker
+    lags.sort()
+    return stats, elapsed, lags[int(len(lags) * 0.99)]
+
+
+def main():
+    logger.remove()
+    records, rate = 5000, 2000
+    settings.FLUSH_BATCH = 500
+    print(f"{records} records at {rate}/s, FLUSH_BATCH={settings.FLUSH_BATCH}")
+    runs = [("per-record", _PerRecordWriter, 0)] + [
+        (f"group {ms}ms", PerformanceDataWriter, ms) for ms in (0, 10, 50, 200)
+    ]
+    for name, cls, commit_ms in runs:
+        settings.JOURNAL_COMMIT_MS = commit_ms
+        stats, elapsed, lag_p99 = asyncio.run(_run(cls, records, rate))
+        print(
+            f"{name:<11} fsyncs={stats['commits']:5d} records/fsync={stats['records_per_commit']:7.2f} "
+            f"fsync avg={stats['fsync_ms_avg']:6.3f}ms max={stats['fsync_ms_max']:7.3f}ms "
+            f"ingest={records / elapsed:7.0f}/s loop lag p99={lag_p99:6.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
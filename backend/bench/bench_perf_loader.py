@@ -0,0 +1,66 @@
+"""
+Benchmark: loading a task's performance records from the rotated CSVs vs the
+columnar store written at finalize.
+
+    cd backend && python -m bench.bench_perf_loader [records]
+"""
+
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from app.collect.data_writer import PerformanceDataWriter
+from app.utils.perf_store import load_columns, perf_csv_files, write_columns
+
+
+def _make_task(data_dir: Path, records: int, per_file: int = 100000):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({name: rng.random(records) * 100 for name in PerformanceDataWriter.PERF_HEADERS})
+    df["序号"] = np.arange(1, records + 1)
+    df["request_id"] = [f"req-{i:08d}" for i in range(records)]
+    df["model"] = "bench-model"
+    seconds = pd.Timestamp("2024-01-01") + pd.to_timedelta(np.arange(records) // 200, unit="s")
+    df["arrival_time"] = df["completion_time"] = seconds.strftime("%Y-%m-%d %H:%M:%S")
+    df["upstream"] = np.where(np.arange(records) % 2, "10.0.0.1:8000", "10.0.0.2:8000")
+    for start in range(0, records, per_file):
+        df.iloc[start:start + per_file].to_csv(
+            data_dir / f"performance_data_{start // per_file}.csv", index=False, encoding="utf-8-sig"
+        )
+
+
+def _measure(fn):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    df = fn()
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return df, elapsed, peak
+
+
+def main():
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(tmp)
+        _make_task(data_dir, records)
+        files = perf_csv_files(data_dir)
+
+        def from_csv():
+            return pd.concat([pd.read_csv(f) for f in files], ignore_index=True)
+
+        csv_df, csv_s, csv_peak = _measure(from_csv)
+        write_columns(data_dir, csv_df, files)
+        col_df, col_s, col_peak = _measure(lambda: load_columns(data_dir))
+        pd.testing.assert_frame_equal(csv_df, col_df)
+
+        for name, elapsed, peak in (("csv", csv_s, csv_peak), ("columnar", col_s, col_peak)):
+            print(f"{name:<9} records={records:,} load={elapsed * 1000:8.1f}ms peak_alloc={peak / 2**20:7.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Benchmark: one page of /api/files/{task_id}/performance on a big task, read
+by loading (or taking from the dataset cache) the whole frame and sorting it
+vs read through the row index and the sort permutations written at finalize.
+
+    cd backend && python -m bench.bench_perf_page [records]
+"""
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from app.utils.dataset_cache import cached_performance
+from app.utils.perf_index import _indexes, performance_page, write_index
+from app.utils.perf_store import load_performance, write_columns
+from app.utils.segments import PERF_PREFIX, read_segments
+
+from .bench_perf_loader import _make_task
+
+_SIZE = 20
+
+
+def _timed(fn) -> float:
+    t0 = time.perf_counter()
+    fn()
+    return (time.perf_counter() - t0) * 1000
+
+
+def _frame_page(df, start, sort_by=None):
+    if sort_by:
+        df = df.sort_values(sort_by, ascending=False)
+    return df.iloc[start:start + _SIZE]
+
+
+def _write_store(data_dir: Path) -> float:
+    """What finalize writes; returns the time spent on the index. The frame is freed on return."""
+    df = read_segments(data_dir, PERF_PREFIX)
+    write_columns(data_dir, df)
+    return _timed(lambda: write_index(data_dir, df))
+
+
+def main():
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(tmp)
+        _make_task(data_dir, records)
+        build = _write_store(data_dir)
+        print(f"{records:,} records, index + sort permutations written in {build:.0f}ms")
+
+        deep = records - 1000
+        cases = [
+            ("page 1", 0, None), ("deep page", deep, None), ("deep page by ttft desc", deep, "ttft_ms"),
+            ("deep page by arrival desc", deep, "arrival_time"),
+        ]
+        for name, start, sort_by in cases:
+            full = _timed(lambda: _frame_page(load_performance(data_dir), start, sort_by))
+            cached_performance(data_dir)
+            cached = _timed(lambda: _frame_page(cached_performance(data_dir), start, sort_by))
+            _indexes.clear()
+            cold = _timed(lambda: performance_page(data_dir, start, _SIZE, sort_by, descending=True))
+            warm = _timed(lambda: performance_page(data_dir, start, _SIZE, sort_by, descending=True))
+            print(
+                f"  {name:<26} full load {full:8.1f}ms  cached frame {cached:7.1f}ms  "
+                f"index {cold:6.2f}ms first, {warm:5.2f}ms after"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark: finding the slow requests of one prompt family. Scanning the QA
+records and joining their performance rows vs one query on the task's QA
+search index, plus what maintaining the index costs the writer's flushes
+and finalize (which waits for the index thread and indexes skipped batches).
+
+    cd backend && python -m bench.bench_qa_search [records]
+"""
+
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Tuple
+
+from loguru import logger
+
+from app.collect.data_writer import PerformanceDataWriter
+from app.collect.qa_capture import iter_qa_records
+from app.collect.qa_index import QA_INDEX_FILE, search_qa
+from app.config import settings
+from app.utils.perf_store import load_performance
+
+_FAMILIES = ["总结下面这篇文章的要点", "translate the following text", "write a unit test for", "explain this stack trace"]
+_FILLER = "lorem ipsum dolor sit amet consectetur adipiscing elit " * 8
+
+
+def _stat(i: int) -> dict:
+    return {
+        "request_id": f"req-{i:08d}", "model": "bench-model",
+        "arrival_time": f"2024-01-01 00:{i // 6000 % 60:02d}:{i // 100 % 60:02d}.{i % 100:02d}",
+        "completion_time": "2024-01-01 00:00:00", "prompt_tokens": 200, "cached_tokens": 0,
+        "completion_tokens": 100, "total_tokens": 300, "ttft_ms": (i * 7919) % 2000, "tpot_ms": 20,
+        "tps": 50, "e2e_latency_ms": (i * 7919) % 2000 + 2000, "chunk_count": 100,
+        "messages": [{"role": "user", "content": f"{_FAMILIES[i % 4]} #{i}: {_FILLER}"}],
+        "response_content": f"answer {i}: {_FILLER}",
+    }
+
+
+async def _write(data_dir: Path, records: int) -> Tuple[float, float]:
+    writer = PerformanceDataWriter("bench", data_dir, qa_mode="full")
+    flush_s = 0.0
+    for i in range(records):
+        await writer.add_record(_stat(i))
+        if i % settings.FLUSH_BATCH == settings.FLUSH_BATCH - 1:
+            t0 = time.perf_counter()
+            await writer._flush()
+            flush_s += time.perf_counter() - t0
+    t0 = time.perf_counter()
+    await writer.finalize(summary=False)
+    return flush_s, time.perf_counter() - t0
+
+
+def _scan(data_dir: Path, needle: str, min_e2e: float):
+    perf = load_performance(data_dir).set_index("request_id")
+    slow = perf[perf["e2e_latency_ms"] >= min_e2e]
+    return [
+        rec["request_id"] for rec in iter_qa_records(data_dir)
+        if rec["request_id"] in slow.index and (needle in rec["messages"] or needle in rec["response_content"])
+    ]
+
+
+def main():
+    logger.remove()
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    settings.FLUSH_BATCH = 1000
+    settings.JOURNAL = False
+    with tempfile.TemporaryDirectory() as tmp:
+        timings = {}
+        for enabled in (False, True):
+            settings.QA_SEARCH_INDEX = enabled
+            data_dir = Path(tmp) / f"index_{enabled}"
+            timings[enabled] = asyncio.run(_write(data_dir, records))
+        data_dir = Path(tmp) / "index_True"
+        size = (data_dir / QA_INDEX_FILE).stat().st_size
+        print(f"{records:,} records ({size / 2**20:.0f}MB index)")
+        for enabled, (flush_s, finalize_s) in timings.items():
+            print(f"  {'with' if enabled else 'without':<7} index: flushes {flush_s:5.1f}s, finalize {finalize_s:5.1f}s")
+
+        needle, min_e2e = "translate the following", 3800
+        t0 = time.perf_counter()
+        scanned = _scan(data_dir, needle, min_e2e)
+        scan_ms = (time.perf_counter() - t0) * 1000
+        t0 = time.perf_counter()
+        total, page = search_qa(
+            data_dir, f'"{needle}"', {"e2e_latency_ms": (min_e2e, None)}, "e2e_latency_ms", True, 0, 20,
+        )
+        search_ms = (time.perf_counter() - t0) * 1000
+        assert total == len(scanned), (total, len(scanned))
+        print(f"'{needle}' with e2e >= {min_e2e}ms: {total} matches")
+        print(f"  scan QA + join  {scan_ms:8.1f}ms")
+        print(f"  index search    {search_ms:8.1f}ms (count + slowest 20)")
+
+
+if __name__ == "__main__":
+    main()
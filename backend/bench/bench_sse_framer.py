@@ -0,0 +1,77 @@
+"""
+Micro-benchmark: SSE framing cost per token.
+Compares the old ``remaining + raw_chunk`` / ``find(b"\\n\\n")`` loop with SSEFramer.
+
+    cd backend && python -m bench.bench_sse_framer
+"""
+
+import json
+import random
+import time
+
+from app.utils.sse import SSEFramer
+
+
+def _make_stream(tokens: int, chunk_size: int):
+    """Build an OpenAI-style SSE body and cut it into network-sized chunks."""
+    events = []
+    for i in range(tokens):
+        data = {
+            "id": "chatcmpl-bench", "object": "chat.completion.chunk", "model": "bench",
+            "choices": [{"index": 0, "delta": {"content": f"tok{i} "}, "finish_reason": None}],
+        }
+        events.append(b"data: " + json.dumps(data).encode() + b"\n\n")
+    events.append(b"data: [DONE]\n\n")
+    body = b"".join(events)
+    rng = random.Random(0)
+    chunks, pos = [], 0
+    while pos < len(body):
+        step = rng.randint(chunk_size // 2, chunk_size * 2)
+        chunks.append(body[pos:pos + step])
+        pos += step
+    return chunks
+
+
+def legacy_frame(chunks):
+    copied = 0
+    messages = 0
+    remaining = b""
+    for raw in chunks:
+        combined = remaining + raw
+        copied += len(combined)
+        while b"\n\n" in combined:
+            boundary = combined.find(b"\n\n") + 2
+            complete = combined[:boundary]
+            combined = combined[boundary:]
+            copied += len(complete) + len(combined)
+            messages += 1
+        remaining = combined
+    return messages, copied
+
+
+def framer_frame(chunks):
+    framer = SSEFramer()
+    for raw in chunks:
+        framer.feed(raw)
+    framer.flush()
+    return framer.messages, framer.bytes_copied
+
+
+def main():
+    tokens = 4000
+    for chunk_size in (64, 1024, 16384):
+        chunks = _make_stream(tokens, chunk_size)
+        for name, fn in (("legacy", legacy_frame), ("framer", framer_frame)):
+            t0 = time.perf_counter()
+            for _ in range(5):
+                messages, copied = fn(chunks)
+            elapsed = (time.perf_counter() - t0) / 5
+            print(
+                f"chunk~{chunk_size:>5}B {name:<6} messages={messages:<5} "
+                f"bytes_copied/token={copied / tokens:>9.1f} "
+                f"us/token={elapsed * 1e6 / tokens:.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Micro-benchmark: SSE events/second per core for metric extraction.
+Compares the stdlib parser (full json.loads per event) with the selective orjson path.
+
+    cd backend && python -m bench.bench_stream_metrics
+"""
+
+import json
+import time
+
+from app.utils.stream_metrics import StreamMetrics
+
+
+def _make_events(tokens: int):
+    events = []
+    for i in range(tokens):
+        data = {
+            "id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": 0,
+            "model": "bench",
+            "choices": [{"index": 0, "delta": {"content": f"token {i} "}, "logprobs": None,
+                         "finish_reason": None}],
+        }
+        events.append(b"data: " + json.dumps(data, separators=(",", ":")).encode() + b"\n\n")
+    final = {
+        "id": "chatcmpl-bench", "object": "chat.completion.chunk", "model": "bench",
+        "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+    }
+    usage = {
+        "id": "chatcmpl-bench", "object": "chat.completion.chunk", "model": "bench", "choices": [],
+        "usage": {"prompt_tokens": 100, "completion_tokens": tokens, "total_tokens": tokens + 100},
+    }
+    for extra in (final, usage):
+        events.append(b"data: " + json.dumps(extra, separators=(",", ":")).encode() + b"\n\n")
+    events.append(b"data: [DONE]\n\n")
+    return events
+
+
+def main():
+    events = _make_events(2000)
+    rounds = 20
+    for parser in ("stdlib", "orjson"):
+        t0 = time.process_time()
+        for _ in range(rounds):
+            m = StreamMetrics("bench", parser=parser)
+            for ev in events:
+                m.feed(ev)
+        cpu = time.process_time() - t0
+        print(
+            f"{parser:<7} events/s/core={len(events) * rounds / cpu:>12,.0f} "
+            f"full_parses/request={m.full_parses} chunks={m.chunk_count} "
+            f"finish={m.finish_reason} usage={m.usage.get('completion_tokens')}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark: event-loop lag while PerformanceDataWriter flushes.
+A ticker coroutine measures how late each 1 ms sleep wakes up while records
+arrive at a high rate and the summary is built at the end. "inline" runs the
+writer's file I/O on the event loop (the previous behaviour); "thread" uses the
+writer thread.
+
+    cd backend && python -m bench.bench_writer_loop_lag
+"""
+
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+from loguru import logger
+
+from app.collect.data_writer import PerformanceDataWriter
+from app.config import settings
+
+
+class _InlineWriter(PerformanceDataWriter):
+    async def _io(self, fn, *args):
+        return fn(*args)
+
+
+def _stat(i: int) -> dict:
+    return {
+        "request_id": f"req-{i}", "model": "bench", "arrival_time": "2024-01-01T00:00:00",
+        "completion_time": "2024-01-01T00:00:01", "prompt_tokens": 500, "forward_cal_tokens": 500,
+        "cached_tokens": 0, "completion_tokens": 200, "total_tokens": 700, "ttft_ms": 120.0,
+        "tpot_ms": 20.0, "tps": 50.0, "e2e_latency_ms": 4100.0, "chunk_count": 200,
+        "messages": [{"role": "user", "content": "q" * 2000}], "response_content": "a" * 2000,
+        "token_offsets": [120.0 + 20 * t for t in range(200)],
+    }
+
+
+async def _ticker(lags: list, stop: asyncio.Event):
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append((time.perf_counter() - t0 - 0.001) * 1000)
+
+
+async def _run(cls, qa_mode: str, records: int, rate: int):
+    lags = []
+    stop = asyncio.Event()
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = cls("bench", Path(tmp), qa_mode=qa_mode)
+        ticker = asyncio.create_task(_ticker(lags, stop))
+        start = time.perf_counter()
+        for i in range(records):
+            await writer.add_record(_stat(i))
+            if i % 10 == 9:
+                await asyncio.sleep(max(0.0, start + (i + 1) / rate - time.perf_counter()))
+        await writer.finalize()
+        stop.set()
+        await ticker
+    lags.sort()
+    return lags[len(lags) // 2], lags[int(len(lags) * 0.99)], lags[-1], len(lags)
+
+
+def main():
+    logger.remove()
+    records, rate = 10000, 2000
+    settings.FLUSH_BATCH = 500
+    print(f"{records} records at {rate}/s, FLUSH_BATCH={settings.FLUSH_BATCH}")
+    for qa_mode in ("full", "stream"):
+        for name, cls in (("inline", _InlineWriter), ("thread", PerformanceDataWriter)):
+            p50, p99, worst, ticks = asyncio.run(_run(cls, qa_mode, records, rate))
+            print(
+                f"{qa_mode:<7} {name:<7} loop lag p50={p50:6.2f}ms p99={p99:7.2f}ms "
+                f"max={worst:7.2f}ms ticks={ticks}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Shared test setup. The data directory points at a temporary directory before
+the app settings are imported; ``fake_upstream`` serves a minimal streaming
+chat endpoint from the test's event loop.
+"""
+
+import asyncio
+import os
+import tempfile
+from contextlib import asynccontextmanager
+
+os.environ.setdefault("AICP_DATA_DIR", tempfile.mkdtemp(prefix="aicp-test-"))
+
+import pytest  # noqa: E402
+from aiohttp import web  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def db_ready():
+    from app.models import database
+    if database.SessionLocal is None:
+        database.init_db()
+    return database
+
+
+@pytest.fixture
+def db(db_ready):
+    session = db_ready.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@asynccontextmanager
+async def fake_upstream(first_chunk_delay: float = 0.0):
+    """An upstream that sends one SSE chunk after ``first_chunk_delay`` seconds."""
+    hits = []
+
+    async def chat(request: web.Request):
+        hits.append(await request.read())
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await resp.prepare(request)
+        await asyncio.sleep(first_chunk_delay)
+        try:
+            await resp.write(b'data: {"choices":[{"delta":{"content":"hi"}}]}\n\n')
+            await resp.write(b"data: [DONE]\n\n")
+        except ConnectionResetError:
+            pass  # the proxy cancelled this attempt
+        return resp
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        yield ("127.0.0.1", port), hits
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from app.proxy.admission import AdmissionController, AdmissionRejected
+from app.proxy.upstream import UpstreamPool
+
+
+def _controller(upstreams: int = 1, fair: bool = False, timeout: float = 2.0, queue_size: int = 10):
+    pool = UpstreamPool([("10.0.0.1", 8000 + i) for i in range(upstreams)], policy="least_outstanding")
+    pool.admission = AdmissionController(pool, limit=1, queue_size=queue_size, timeout=timeout, fair=fair)
+    return pool, pool.admission
+
+
+async def _waiting(admission: AdmissionController, count: int):
+    while admission._waiting < count:
+        await asyncio.sleep(0)
+
+
+def test_fair_queuing_alternates_clients():
+    async def run():
+        pool, admission = _controller(fair=True)
+        held = await admission.acquire(client="busy")
+        order = []
+
+        async def request(client: str):
+            upstream = await admission.acquire(client=client)
+            order.append(client)
+            await asyncio.sleep(0)
+            pool.release(upstream)
+
+        tasks = [asyncio.create_task(request(c)) for c in ("busy", "busy", "busy", "quiet", "quiet")]
+        await _waiting(admission, 5)
+        pool.release(held)
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(run()) == ["busy", "quiet", "busy", "quiet", "busy"]
+
+
+def test_queue_full_and_timeout_are_rejected():
+    async def run():
+        pool, admission = _controller(timeout=0.05, queue_size=1)
+        await admission.acquire()
+        waiter = asyncio.create_task(admission.acquire())
+        await _waiting(admission, 1)
+        with pytest.raises(AdmissionRejected, match="queue full"):
+            await admission.acquire()
+        with pytest.raises(AdmissionRejected, match="Waited more than"):
+            await waiter
+        return admission.snapshot()
+
+    snap = asyncio.run(run())
+    assert (snap["rejected"], snap["timed_out"], snap["waiting"]) == (1, 1, 0)
+
+
+def test_waiter_that_cannot_use_the_free_slot_does_not_block_others():
+    async def run():
+        pool, admission = _controller(upstreams=2)
+        first = await admission.acquire()
+        second = await admission.acquire()
+        # The head waiter retries after a failure on `second` and excludes it
+        head = asyncio.create_task(admission.acquire(exclude=(second,)))
+        other = asyncio.create_task(admission.acquire())
+        await _waiting(admission, 2)
+
+        pool.release(second)
+        assert await asyncio.wait_for(other, 1) is second
+        assert not head.done()
+        pool.release(first)
+        assert await asyncio.wait_for(head, 1) is first
+
+    asyncio.run(run())
+
+
+def test_new_request_takes_a_slot_no_waiter_can_use():
+    async def run():
+        pool, admission = _controller(upstreams=2)
+        first = await admission.acquire()
+        second = await admission.acquire()
+        head = asyncio.create_task(admission.acquire(exclude=(second,)))
+        await _waiting(admission, 1)
+
+        second.release()  # freed without waking anyone
+        assert await asyncio.wait_for(admission.acquire(), 1) is second
+        assert not head.done()
+        pool.release(first)
+        assert await asyncio.wait_for(head, 1) is first
+
+    asyncio.run(run())
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+from app.collect.data_writer import PerformanceDataWriter
+from app.collect.qa_capture import iter_qa_records
+from app.config import settings
+from app.utils.segments import COMPRESSIONS, PERF_PREFIX, QA_PREFIX, _decompress, read_segment, read_segments, segment_files
+
+from .test_shards import _stat
+
+
+def test_qa_text_budget_starts_a_flush(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "JOURNAL", False)
+    monkeypatch.setattr(settings, "FLUSH_BATCH", 1000)
+    monkeypatch.setattr(settings, "FLUSH_QA_BYTES", 10_000)
+
+    async def run():
+        writer = PerformanceDataWriter("t", tmp_path, qa_mode="jsonl")
+        stats = []
+        for i in range(5):
+            stat = _stat(i)
+            stat["response_content"] = "x" * 3000
+            stats.append(stat)
+            await writer.add_record(stat)
+            if i == 3:
+                # Four records pass the budget: written without waiting for FLUSH_BATCH
+                assert writer._bg_flush is not None
+                await writer._bg_flush
+        flushed = writer.total_records
+        await writer.finalize(summary=False)
+        return flushed, stats
+
+    flushed, stats = asyncio.run(run())
+    assert flushed == 4
+    # Records are handed over as received; their QA rows are built when written
+    assert stats[0]["messages"] == [{"role": "user", "content": "question 0"}]
+    records = list(iter_qa_records(tmp_path))
+    assert [r["序号"] for r in records] == [1, 2, 3, 4, 5]
+    assert records[1]["messages"] == '[{"role": "user", "content": "question 1"}]'
+    assert records[1]["response_chars"] == 3000
+
+
+def test_stream_is_the_old_name_of_jsonl_mode(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "JOURNAL", False)
+
+    async def run():
+        writer = PerformanceDataWriter("t", tmp_path, qa_mode="stream")
+        await writer.add_record(_stat(0))
+        await writer.finalize(summary=False)
+        return writer.qa_mode
+
+    assert asyncio.run(run()) == "jsonl"
+    assert [r["response_content"] for r in iter_qa_records(tmp_path)] == ["answer 0"]
+    assert not list(tmp_path.glob("qa_pairs_*.csv*"))
+
+
+@pytest.mark.parametrize("compression", ["gzip", "zstd"])
+def test_segments_rotate_by_uncompressed_size(tmp_path, monkeypatch, compression):
+    if compression == "zstd":
+        pytest.importorskip("zstandard")
+    monkeypatch.setattr(settings, "JOURNAL", False)
+    monkeypatch.setattr(settings, "FLUSH_BATCH", 5)
+    monkeypatch.setattr(settings, "MAX_RECORDS_PER_FILE", 0)
+    monkeypatch.setattr(settings, "MAX_FILE_BYTES", 2000)
+    monkeypatch.setattr(settings, "DATA_COMPRESSION", compression)
+
+    async def run():
+        writer = PerformanceDataWriter("t", tmp_path, qa_mode="full")
+        for i in range(60):
+            await writer.add_record(_stat(i))
+            if writer._bg_flush:
+                await writer._bg_flush  # one member per batch of 5
+        await writer.finalize(summary=False)
+
+    asyncio.run(run())
+    ext = COMPRESSIONS[compression]
+    sizes = {}
+    for prefix in (PERF_PREFIX, QA_PREFIX):
+        files = segment_files(tmp_path, prefix)
+        assert all(f.name.endswith(ext) for f in files)
+        sizes[prefix] = [len(_decompress(ext, f.read_bytes())) for f in files]
+        df = read_segments(tmp_path, prefix)
+        assert list(df["request_id"]) == [f"req-{i:04d}" for i in range(60)]
+    rows = [len(read_segment(f)) for f in segment_files(tmp_path, PERF_PREFIX)]
+
+    assert len(rows) > 2
+    # Rotated once the larger file passes the limit, which it may pass by one batch
+    for perf_size, qa_size, count in list(zip(sizes[PERF_PREFIX], sizes[QA_PREFIX], rows))[:-1]:
+        size = max(perf_size, qa_size)
+        assert 2000 <= size < 2000 + 5 * size / count
@@ -0,0 +1,114 @@
+import asyncio
+import time
+
+import pytest
+
+from app.config import settings
+from app.proxy.forwarder import ProxyForwarder
+from app.proxy.hedge import ClientGone
+from app.proxy.upstream import UpstreamPool
+
+from .conftest import fake_upstream
+
+PATH = "/v1/chat/completions"
+
+
+class _Request:
+    method = "POST"
+
+    def __init__(self, disconnect_after: float = None):
+        self._disconnect_at = None if disconnect_after is None else time.monotonic() + disconnect_after
+
+    async def is_disconnected(self) -> bool:
+        return self._disconnect_at is not None and time.monotonic() >= self._disconnect_at
+
+
+async def _hedge(request, slow_delay: float, fast_delay: float):
+    async with fake_upstream(slow_delay) as (slow, slow_hits), fake_upstream(fast_delay) as (fast, fast_hits):
+        forwarder = ProxyForwarder()
+        await forwarder.start()
+        try:
+            pool = UpstreamPool([slow, fast], policy="round_robin")
+            upstream = pool.acquire()
+            assert upstream.port == slow[1]
+            sent_at = time.monotonic()
+            resp = await forwarder.client.post(f"{upstream.base_url}{PATH}", data=b"{}")
+            started = time.monotonic()
+            try:
+                result = await forwarder._hedged(request, pool, PATH, b"{}", {}, resp, upstream, sent_at)
+            except ClientGone:
+                result = None
+            else:
+                result[0].close()
+                pool.release(result[1])
+            elapsed = time.monotonic() - started
+            return result, elapsed, len(slow_hits), len(fast_hits), pool.outstanding, forwarder.hedge
+        finally:
+            await forwarder.stop()
+
+
+@pytest.fixture
+def hedge_settings(monkeypatch):
+    monkeypatch.setattr(settings, "PROXY_HEDGE_AFTER_MS", 0)
+    monkeypatch.setattr(settings, "PROXY_HEDGE_PERCENTILE", 0)
+    monkeypatch.setattr(settings, "PROXY_HEDGE_MIN_SAMPLES", 50)
+    monkeypatch.setattr(settings, "PROXY_HEDGE_MAX_RATIO", 1.0)
+    monkeypatch.setattr(settings, "PROXY_DISCONNECT_POLL", 0.02)
+    return monkeypatch
+
+
+def test_slow_first_chunk_is_hedged(hedge_settings):
+    hedge_settings.setattr(settings, "PROXY_HEDGE_AFTER_MS", 50)
+    result, elapsed, slow_hits, fast_hits, outstanding, hedge = asyncio.run(_hedge(_Request(), 1.0, 0.0))
+    _, _, _, attempt, hedged = result
+    assert (attempt, hedged) == (2, True)
+    assert (slow_hits, fast_hits) == (1, 1)
+    assert outstanding == 0
+    assert hedge.hedge_wins == 1
+
+
+def test_no_hedge_while_percentile_warms_up(hedge_settings):
+    # Percentile mode without AFTER_MS: no threshold until MIN_SAMPLES are seen
+    hedge_settings.setattr(settings, "PROXY_HEDGE_PERCENTILE", 95)
+    result, elapsed, slow_hits, fast_hits, outstanding, hedge = asyncio.run(_hedge(_Request(), 0.3, 0.0))
+    _, _, _, attempt, hedged = result
+    assert (attempt, hedged) == (1, False)
+    assert (slow_hits, fast_hits) == (1, 0)
+    assert hedge.hedged == 0
+    assert hedge.snapshot()["samples"] == 1  # the wait still counts toward the warm-up
+    assert outstanding == 0
+
+
+def test_client_disconnect_cancels_both_attempts(hedge_settings):
+    hedge_settings.setattr(settings, "PROXY_HEDGE_AFTER_MS", 50)
+    result, elapsed, slow_hits, fast_hits, outstanding, hedge = asyncio.run(_hedge(_Request(disconnect_after=0.2), 2.0, 2.0))
+    assert result is None
+    assert (slow_hits, fast_hits) == (1, 1)
+    assert hedge.hedged == 1
+    assert outstanding == 0
+    assert elapsed < 1.0
+
+
+def test_client_disconnect_before_threshold(hedge_settings):
+    hedge_settings.setattr(settings, "PROXY_HEDGE_PERCENTILE", 95)
+    result, elapsed, slow_hits, fast_hits, outstanding, _ = asyncio.run(_hedge(_Request(disconnect_after=0.1), 2.0, 0.0))
+    assert result is None
+    assert (slow_hits, fast_hits) == (1, 0)
+    assert outstanding == 0
+
+
+def test_only_streamed_posts_are_hedged(hedge_settings):
+    hedge_settings.setattr(settings, "PROXY_HEDGE_AFTER_MS", 50)
+    forwarder = ProxyForwarder()
+    pool = UpstreamPool([("127.0.0.1", 1), ("127.0.0.1", 2)], policy="round_robin")
+
+    class _Resp:
+        status = 200
+
+    get = _Request()
+    get.method = "GET"
+    assert forwarder._hedgeable(_Request(), pool, _Resp(), streamed=True)
+    # Passthrough and non-JSON bodies: the first byte may be the whole response
+    assert not forwarder._hedgeable(_Request(), pool, _Resp(), streamed=False)
+    assert not forwarder._hedgeable(get, pool, _Resp(), streamed=True)
+    assert not forwarder._hedgeable(_Request(), UpstreamPool([("127.0.0.1", 1)]), _Resp(), streamed=True)
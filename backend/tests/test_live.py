@@ -0,0 +1,30 @@
+import os
+import time
+
+from app.config import settings
+from app.metrics.live import LiveMetrics, live_path
+
+
+def test_snapshot_from_other_workers_dumps(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "WORKERS", 2)
+    owner, other = LiveMetrics(), LiveMetrics()
+    window = owner.start("bench", lambda: 3)
+    for ms in (100, 200, 300):
+        window.observe({"ttft_ms": ms, "tpot_ms": 10, "e2e_latency_ms": ms + 50, "completion_tokens": 5})
+    owner.save("bench", tmp_path, "w1")
+
+    # A worker without a window of the task serves the owner's dump
+    snap = other.snapshot("bench", tmp_path, "w2")
+    assert snap["records"] == 3
+    assert snap["inflight"] == 3
+    assert (snap["ttft_ms"]["min"], snap["ttft_ms"]["max"]) == (100, 300)
+    # The owner does not count its own dump twice
+    assert owner.snapshot("bench", tmp_path, "w1")["records"] == 3
+
+    # A dump that is no longer refreshed is ignored
+    old = time.time() - 3600
+    os.utime(live_path(tmp_path, "w1"), (old, old))
+    assert other.snapshot("bench", tmp_path, "w2") is None
+
+    owner.stop("bench", tmp_path, "w1")
+    assert not live_path(tmp_path, "w1").exists()
@@ -0,0 +1,61 @@
+import json
+
+import orjson
+import pytest
+
+from app.proxy.payload import force_stream_usage
+
+MESSAGES = [
+    {"role": "system", "content": 'Answer in JSON like {"stream": false, "stream_options": []}'},
+    {"role": "user", "content": "path C:\\temp\\ and a \"quoted\" word"},
+]
+
+
+def _body(**payload) -> bytes:
+    return json.dumps({"model": "m", "messages": MESSAGES, **payload}, indent=1).encode()
+
+
+def _messages_bytes(body: bytes) -> bytes:
+    start = body.index(b'"messages"')
+    return body[start:body.index(b"]", body.index(b'"path C:'))]
+
+
+@pytest.mark.parametrize("payload", [
+    {},
+    {"stream": False},
+    {"stream": True, "temperature": 0.5},
+    {"stream_options": {"include_usage": False, "continuous_usage_stats": True}, "stream": False},
+])
+def test_stream_and_usage_are_spliced_in(payload):
+    body = _body(**payload)
+    rewrite = force_stream_usage(body)
+    new = rewrite["body"]
+
+    parsed = orjson.loads(new)
+    assert parsed["stream"] is True
+    assert parsed["stream_options"]["include_usage"] is True
+    assert parsed["stream_options"].get("continuous_usage_stats") == payload.get("stream_options", {}).get("continuous_usage_stats")
+    assert {k: v for k, v in parsed.items() if k not in ("stream", "stream_options")} == \
+        {k: v for k, v in json.loads(body).items() if k not in ("stream", "stream_options")}
+    # The messages are passed through byte for byte, not re-serialized
+    assert _messages_bytes(new) == _messages_bytes(body)
+
+    assert rewrite["stream"] == payload.get("stream", False)
+    assert rewrite["include_usage"] is False
+    assert (rewrite["model"], rewrite["messages"], rewrite["temperature"]) == ("m", MESSAGES, payload.get("temperature"))
+
+
+def test_nested_or_repeated_keys_fall_back_to_reserializing():
+    nested = _body(metadata={"stream": "x"})
+    parsed = orjson.loads(force_stream_usage(nested)["body"])
+    assert (parsed["stream"], parsed["metadata"]) == (True, {"stream": "x"})
+
+    repeated = b'{"model": "m", "stream": false, "messages": [], "stream": false}'
+    assert orjson.loads(force_stream_usage(repeated)["body"])["stream"] is True
+
+
+def test_empty_object_and_non_objects():
+    assert orjson.loads(force_stream_usage(b"{ }\n")["body"]) == {"stream": True, "stream_options": {"include_usage": True}}
+    for body in (b"[1, 2]", b"not json"):
+        with pytest.raises(ValueError):
+            force_stream_usage(body)
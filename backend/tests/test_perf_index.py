@@ -0,0 +1,56 @@
+import asyncio
+
+import pandas as pd
+import pytest
+
+from app.collect.data_writer import PerformanceDataWriter
+from app.config import settings
+from app.utils.perf_index import _indexes, performance_page, write_index
+from app.utils.segments import PERF_PREFIX, read_segments
+
+from .test_shards import _stat
+
+
+def _write_task(data_dir, records: int):
+    async def run():
+        writer = PerformanceDataWriter("t", data_dir, qa_mode="metrics")
+        for i in range(records):
+            stat = _stat((i * 37) % records)  # arrival and latency out of write order
+            stat["upstream"] = f"10.0.0.{i % 3}:8000" if i % 4 else ""
+            await writer.add_record(stat)
+        await writer.finalize(summary=False)
+
+    asyncio.run(run())
+
+
+def _pages(data_dir, size: int, sort_by=None, descending=False) -> pd.DataFrame:
+    total, first = performance_page(data_dir, 0, size, sort_by, descending)
+    pages = [first] + [performance_page(data_dir, start, size, sort_by, descending)[1] for start in range(size, total, size)]
+    return pd.concat(pages, ignore_index=True)
+
+
+@pytest.mark.parametrize("compression", ["none", "gzip"])
+def test_pages_match_the_loaded_frame(tmp_path, monkeypatch, compression):
+    monkeypatch.setattr(settings, "JOURNAL", False)
+    monkeypatch.setattr(settings, "FLUSH_BATCH", 9)
+    monkeypatch.setattr(settings, "MAX_RECORDS_PER_FILE", 40)
+    monkeypatch.setattr(settings, "DATA_COMPRESSION", compression)
+    _write_task(tmp_path, 100)
+    df = read_segments(tmp_path, PERF_PREFIX)
+
+    # Running task: read through the row index, unsorted only
+    _indexes.clear()
+    assert list(_pages(tmp_path, 7)["request_id"]) == list(df["request_id"])
+    assert performance_page(tmp_path, 0, 7, "ttft_ms") is None
+
+    write_index(tmp_path, df)
+    _indexes.clear()
+    for sort_by in ("ttft_ms", "arrival_time", "request_id"):
+        for descending in (False, True):
+            expected = df.sort_values(sort_by, ascending=not descending)
+            assert list(_pages(tmp_path, 7, sort_by, descending)["request_id"]) == list(expected["request_id"])
+    # Repeated values and nulls (empty upstream) last in both directions, as with sort_values
+    for descending in (False, True):
+        expected = df.sort_values("upstream", ascending=not descending)["upstream"]
+        got = _pages(tmp_path, 7, "upstream", descending)["upstream"]
+        assert list(got.fillna("")) == list(expected.fillna(""))
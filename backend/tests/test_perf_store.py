@@ -0,0 +1,50 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+
+from app.utils import perf_store
+from app.utils.perf_store import COLUMNS_DIR, load_columns, load_performance, write_columns
+from app.utils.segments import PERF_PREFIX, read_segments
+
+
+def _task(data_dir, rows: int) -> pd.DataFrame:
+    df = pd.DataFrame({
+        "序号": np.arange(1, rows + 1),
+        "request_id": [f"{i:08x}-4f1c-9a7e-{i:012d}" for i in range(rows)],
+        "model": ["model-a" if i % 3 else "model-b" for i in range(rows)],
+        "arrival_time": [f"2024-01-01 00:00:{i // 10:02d}" for i in range(rows)],
+        "upstream": [None if i % 7 == 0 else f"10.0.0.{i % 2}:8000" for i in range(rows)],
+        "note": [None if i % 5 == 0 else f"请求 {i}" for i in range(rows)],
+        "ttft_ms": np.linspace(1, 500, rows),
+    })
+    df.to_csv(data_dir / f"{PERF_PREFIX}_0.csv", index=False, encoding="utf-8-sig")
+    return read_segments(data_dir, PERF_PREFIX)
+
+
+def test_columns_round_trip(tmp_path, monkeypatch):
+    monkeypatch.setattr(perf_store, "_DICT_ALWAYS", 16)
+    df = _task(tmp_path, 200)
+    write_columns(tmp_path, df)
+
+    loaded = load_columns(tmp_path)
+    pdt.assert_frame_equal(loaded, df, check_dtype=False)
+    assert loaded["ttft_ms"].dtype == np.float64
+
+    manifest = json.loads((tmp_path / COLUMNS_DIR / "manifest.json").read_text(encoding="utf-8"))
+    entries = {c["name"]: c for c in manifest["columns"]}
+    # Repeating values are dictionary-encoded; one per row are not kept in the manifest
+    assert sorted(entries["model"]["values"]) == ["model-a", "model-b"]
+    assert "values" in entries["arrival_time"]
+    for name in ("request_id", "note"):
+        assert entries[name]["text"] and "values" not in entries[name]
+    assert "nulls" in entries["note"] and "nulls" not in entries["request_id"]
+
+
+def test_stale_store_falls_back_to_segments(tmp_path):
+    df = _task(tmp_path, 20)
+    write_columns(tmp_path, df)
+    _task(tmp_path, 30)  # the segment was rewritten since
+    assert load_columns(tmp_path) is None
+    assert len(load_performance(tmp_path)) == 30
@@ -0,0 +1,44 @@
+import asyncio
+import threading
+
+from app.collect.data_writer import PerformanceDataWriter
+from app.collect.qa_index import QAIndex, search_qa
+from app.config import settings
+
+from .test_shards import _stat
+
+
+def test_busy_index_never_blocks_the_writer(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "JOURNAL", False)
+    monkeypatch.setattr(settings, "FLUSH_BATCH", 10)
+    monkeypatch.setattr(settings, "QA_INDEX_BACKLOG", 25)
+    entered, release = threading.Event(), threading.Event()
+    add = QAIndex._add
+
+    def stalled_add(self, perf_rows, qa_rows):
+        entered.set()
+        release.wait(10)
+        add(self, perf_rows, qa_rows)
+
+    monkeypatch.setattr(QAIndex, "_add", stalled_add)
+
+    async def run():
+        writer = PerformanceDataWriter("t", tmp_path, qa_mode="full")
+        for i in range(60):
+            await writer.add_record(_stat(i))
+            if i % 10 == 9:
+                # Flushes complete while the index thread is stuck on the first batch
+                await asyncio.wait_for(writer._flush(), 5)
+                assert entered.wait(5)
+        skipped = list(writer.qa_index._skipped)
+        release.set()
+        await writer.finalize(summary=False)
+        return skipped
+
+    skipped = asyncio.run(run())
+    # Batch 1 is being indexed, 2-3 are queued, 4-6 would pass the backlog
+    assert skipped == [(31, 40), (41, 50), (51, 60)]
+    # Finalize indexed the skipped batches from the task files
+    total, page = search_qa(tmp_path, "answer", {}, limit=100)
+    assert total == 60
+    assert sorted(row["序号"] for row in page) == list(range(1, 61))
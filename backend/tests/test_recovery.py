@@ -0,0 +1,101 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import uuid
+from pathlib import Path
+from typing import Optional
+
+import pytest
+
+from app.collect.data_writer import PerformanceDataWriter
+from app.collect.qa_capture import iter_qa_records
+from app.collect.recovery import recover_interrupted_tasks
+from app.collect.shards import STOPPER_FILE, write_marker
+from app.config import settings
+from app.models.schemas import Task
+from app.utils.segments import PERF_PREFIX, read_segments
+
+from .test_shards import _stat
+
+
+@pytest.fixture
+def journal_settings(monkeypatch):
+    monkeypatch.setattr(settings, "JOURNAL", True)
+    monkeypatch.setattr(settings, "FLUSH_BATCH", 10)
+    monkeypatch.setattr(settings, "WORKER_SYNC_INTERVAL", 0.05)
+    return monkeypatch
+
+
+async def _crash(data_dir: Path, records: range, shard: Optional[str] = None):
+    """Write records, then stop as a killed process would: nothing finalized."""
+    writer = PerformanceDataWriter("t", data_dir, qa_mode="full", shard=shard)
+    for i in records:
+        await writer.add_record(_stat(i))
+    if writer._bg_flush:
+        await writer._bg_flush
+    await writer.journal._commit()
+    return writer
+
+
+def _stopping_task(db, data_dir: Path) -> str:
+    task_id = uuid.uuid4().hex
+    db.add(Task(
+        id=task_id, name="t", type="collect", status="stopping",
+        config=json.dumps({"qa_mode": "full"}), data_dir=str(data_dir),
+    ))
+    db.commit()
+    return task_id
+
+
+def _task(db, task_id: str) -> Task:
+    db.expire_all()
+    return db.query(Task).filter(Task.id == task_id).first()
+
+
+def _dead_pid() -> int:
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return proc.pid
+
+
+def test_task_interrupted_while_stopping_is_recovered(tmp_path, db, journal_settings):
+    journal_settings.setattr(settings, "WORKERS", 1)
+    asyncio.run(_crash(tmp_path, range(35)))
+    task_id = _stopping_task(db, tmp_path)
+
+    asyncio.run(recover_interrupted_tasks())
+
+    task = _task(db, task_id)
+    assert (task.status, task.record_count) == ("completed", 35)
+    # Flushed records are kept and the journaled tail is replayed
+    perf = read_segments(tmp_path, PERF_PREFIX)
+    assert list(perf["序号"]) == list(range(1, 36))
+    assert [r["request_id"] for r in iter_qa_records(tmp_path)] == [f"req-{i:04d}" for i in range(35)]
+    assert (tmp_path / "performance_summary.json").exists()
+
+
+def test_sharded_task_is_recovered_once_its_stopper_is_gone(tmp_path, db, journal_settings):
+    journal_settings.setattr(settings, "WORKERS", 2)
+
+    async def crash_shards():
+        await _crash(tmp_path, range(0, 25), shard="w1")
+        writer = await _crash(tmp_path, range(25, 40), shard="w2")
+        await writer.finalize(summary=False)
+        write_marker(tmp_path, "w2", records=writer.total_records, done=True)
+
+    asyncio.run(crash_shards())
+    task_id = _stopping_task(db, tmp_path)
+
+    # The worker stopping the task is still merging: left alone
+    (tmp_path / STOPPER_FILE).write_text(f"w{os.getppid()}")
+    asyncio.run(recover_interrupted_tasks())
+    assert _task(db, task_id).status == "stopping"
+
+    (tmp_path / STOPPER_FILE).write_text(f"w{_dead_pid()}")
+    asyncio.run(recover_interrupted_tasks())
+    task = _task(db, task_id)
+    assert (task.status, task.record_count) == ("completed", 40)
+    assert sorted(read_segments(tmp_path, PERF_PREFIX)["request_id"]) == [f"req-{i:04d}" for i in range(40)]
+    assert not (tmp_path / STOPPER_FILE).exists()
@@ -0,0 +1,99 @@
+import asyncio
+import time
+
+import pytest
+
+from app.config import settings
+from app.proxy.response_cache import ResponseCache
+
+CHUNKS = [b'data: {"choices":[{"delta":{"content":"a"}}]}\n\n', b'data: {"choices":[{"delta":{"content":"b"}}]}\n\n',
+          b"data: [DONE]\n\n"]
+
+
+class _Content:
+    async def iter_any(self):
+        for chunk in CHUNKS:
+            await asyncio.sleep(0.05)
+            yield chunk
+
+
+class _Upstream:
+    status = 200
+    content_type = "text/event-stream"
+    content = _Content()
+
+
+@pytest.fixture
+def cache_settings(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "DATA_DIR", tmp_path)
+    monkeypatch.setattr(settings, "RESPONSE_CACHE", True)
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_DISK", True)
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_DETERMINISTIC_ONLY", True)
+    return monkeypatch
+
+
+async def _replay(cache: ResponseCache, key: str):
+    entry = await cache.get(key)
+    if entry is None:
+        return None, 0.0
+    started = time.monotonic()
+    chunks = [chunk async for chunk in cache.replay(entry).content.iter_any()]
+    return chunks, time.monotonic() - started
+
+
+def test_key_needs_temperature_zero(cache_settings):
+    cache = ResponseCache()
+    body = b'{"model":"m","temperature":0,"messages":[]}'
+    assert cache.key("POST", "/v1/chat/completions", body) == cache.key("POST", "/v1/chat/completions", body, 0)
+    assert cache.key("POST", "/v1/chat/completions", body, 0.7) is None
+    assert cache.key("POST", "/v1/chat/completions", b'{"model":"m"}') is None
+    assert cache.key("GET", "/v1/chat/completions", body) is None
+    assert cache.key("POST", "/v1/completions", body) != cache.key("POST", "/v1/chat/completions", body)
+    cache_settings.setattr(settings, "RESPONSE_CACHE_DETERMINISTIC_ONLY", False)
+    assert cache.key("POST", "/v1/chat/completions", b"not json") is not None
+
+
+def test_recorded_response_replays_from_memory_and_disk(cache_settings):
+    async def run():
+        cache = ResponseCache()
+        key = cache.key("POST", "/v1/chat/completions", b'{"temperature":0}')
+        assert await cache.get(key) is None
+
+        recording = cache.record(_Upstream(), key, time.monotonic())
+        assert [c async for c in recording.content.iter_any()] == CHUNKS
+
+        memory = await _replay(cache, key)
+        # Another worker (or a restart) finds the entry on disk once written
+        other = ResponseCache()
+        for _ in range(50):
+            if (settings.DATA_DIR / "response_cache" / f"{key}.bin").exists():
+                break
+            await asyncio.sleep(0.02)
+        disk = await _replay(other, key)
+
+        cache_settings.setattr(settings, "RESPONSE_CACHE_REPLAY", "paced")
+        paced = await _replay(other, key)
+
+        await other.clear()
+        cleared = await ResponseCache().get(key)
+        return cache.snapshot(), memory, disk, paced, cleared
+
+    snapshot, memory, disk, paced, cleared = asyncio.run(run())
+    assert memory[0] == disk[0] == paced[0] == CHUNKS
+    assert memory[1] < 0.05
+    assert paced[1] >= 0.14  # recorded chunk timing, 50ms apart
+    assert (snapshot["hits"], snapshot["misses"], snapshot["stores"]) == (1, 1, 1)
+    assert snapshot["bytes_saved"] == sum(map(len, CHUNKS))
+    assert cleared is None
+
+
+def test_abandoned_response_is_not_stored(cache_settings):
+    async def run():
+        cache = ResponseCache()
+        key = cache.key("POST", "/v1/chat/completions", b'{"temperature":0}')
+        recording = cache.record(_Upstream(), key, time.monotonic())
+        async for _ in recording.content.iter_any():
+            recording.closed = True  # the client left mid-stream
+        return await cache.get(key)
+
+    assert asyncio.run(run()) is None
@@ -0,0 +1,149 @@
+import asyncio
+from pathlib import Path
+
+from app.collect.data_writer import PerformanceDataWriter
+from app.collect.qa_capture import iter_qa_records
+from app.collect.shards import merge_shards
+from app.utils.segments import PERF_PREFIX, QA_PREFIX, read_segments
+
+
+def _stat(i: int) -> dict:
+    return {
+        "request_id": f"req-{i:04d}", "model": "m",
+        "arrival_time": f"2024-01-01 00:00:{i // 100:02d}.{i % 100:02d}",
+        "completion_time": "2024-01-01 00:01:00", "prompt_tokens": 10, "cached_tokens": 0,
+        "completion_tokens": 5, "total_tokens": 15, "ttft_ms": i, "tpot_ms": 1, "tps": 1,
+        "e2e_latency_ms": i + 5, "chunk_count": 5,
+        "messages": [{"role": "user", "content": f"question {i}"}],
+        "response_content": f"answer {i}",
+    }
+
+
+async def _write_shards(data_dir: Path, records: int, qa_mode: str):
+    # Two workers take alternate requests, so neither shard is in global order
+    writers = [PerformanceDataWriter("t", data_dir, qa_mode=qa_mode, shard=s) for s in ("w1", "w2")]
+    for i in range(records):
+        await writers[i % 2].add_record(_stat(i))
+    for writer in writers:
+        await writer.finalize(summary=False)
+
+
+def test_merge_renumbers_qa_stream_in_arrival_order(tmp_path, monkeypatch):
+    from app.config import settings
+    monkeypatch.setattr(settings, "JOURNAL", False)
+    asyncio.run(_write_shards(tmp_path, 40, "full"))
+
+    assert merge_shards(tmp_path, max_per_file=15) == 40
+    perf = read_segments(tmp_path, PERF_PREFIX)
+    assert list(perf["序号"]) == list(range(1, 41))
+    assert list(perf["request_id"]) == [f"req-{i:04d}" for i in range(40)]
+
+    records = list(iter_qa_records(tmp_path))
+    assert [r["序号"] for r in records] == list(range(1, 41))
+    assert [r["request_id"] for r in records] == list(perf["request_id"])
+    assert records[7]["response_content"] == "answer 7"
+
+    qa = read_segments(tmp_path, QA_PREFIX)
+    assert list(qa["序号"]) == list(range(1, 41))
+    assert not list(tmp_path.glob("qa_pairs_w*"))
+
+
+def test_merge_jsonl_mode_without_qa_csv(tmp_path, monkeypatch):
+    from app.config import settings
+    monkeypatch.setattr(settings, "JOURNAL", False)
+    asyncio.run(_write_shards(tmp_path, 11, "jsonl"))
+
+    assert merge_shards(tmp_path, max_per_file=0) == 11
+    records = list(iter_qa_records(tmp_path))
+    assert [(r["序号"], r["request_id"]) for r in records] == [(i + 1, f"req-{i:04d}") for i in range(11)]
+
+
+def test_live_readers_see_shard_segments(tmp_path, monkeypatch):
+    from app.config import settings
+    from app.utils.dataset_cache import DatasetCache
+    from app.utils.perf_index import TaskIndex
+    monkeypatch.setattr(settings, "JOURNAL", False)
+    monkeypatch.setattr(settings, "DATASET_CACHE_BYTES", 1 << 30)
+
+    async def run():
+        writers = [PerformanceDataWriter("t", tmp_path, shard=s) for s in ("w1", "w2")]
+        for i in range(10):
+            await writers[i % 2].add_record(_stat(i))
+        for writer in writers:
+            await writer._flush()
+
+        cache = DatasetCache()
+        first = cache.performance(tmp_path)
+        assert len(first) == 10
+        assert list(first["序号"]) == list(range(1, 11))
+        assert len(read_segments(tmp_path, QA_PREFIX)) == 10
+
+        # w1 grows while w2's segment follows it in the listing
+        await writers[0].add_record(_stat(10))
+        await writers[0]._flush()
+        df = cache.performance(tmp_path)
+        assert cache.stats["refreshes"] == 1
+        page = TaskIndex(tmp_path).refresh().page(0, 20)
+        assert list(df["序号"]) == list(range(1, 12))
+        assert list(df["request_id"]) == list(page["request_id"]) == list(read_segments(tmp_path, PERF_PREFIX)["request_id"])
+        assert list(page["序号"]) == list(range(1, 12))
+        for writer in writers:
+            await writer.finalize(summary=False)
+
+    asyncio.run(run())
+
+
+def test_merge_sorts_qa_stream_in_bounded_runs(tmp_path, monkeypatch):
+    from app.collect import shards
+    from app.config import settings
+    monkeypatch.setattr(settings, "JOURNAL", False)
+    monkeypatch.setattr(shards, "_SORT_RUN", 4)
+
+    async def run():
+        # Requests complete (and are written) out of arrival order
+        writers = [PerformanceDataWriter("t", tmp_path, qa_mode="jsonl", shard=s) for s in ("w1", "w2")]
+        for i in sorted(range(30), key=lambda i: (i // 6, -i)):
+            await writers[i % 2].add_record(_stat(i))
+        for writer in writers:
+            await writer.finalize(summary=False)
+
+    asyncio.run(run())
+    assert merge_shards(tmp_path, max_per_file=0) == 30
+    records = list(iter_qa_records(tmp_path))
+    assert [(r["序号"], r["request_id"]) for r in records] == [(i + 1, f"req-{i:04d}") for i in range(30)]
+    assert not list(tmp_path.glob(".qa_run_*"))
+
+
+def test_merge_orders_requests_within_the_same_second(tmp_path, monkeypatch):
+    from app.config import settings
+    monkeypatch.setattr(settings, "JOURNAL", False)
+
+    async def run():
+        writers = [PerformanceDataWriter("t", tmp_path, qa_mode="metrics", shard=s) for s in ("w1", "w2")]
+        for i in range(20):
+            stat = _stat(i)
+            stat["arrival_time"] = "2024-01-01 00:00:00"
+            stat["arrival_ts"] = 1704067200 + i / 100
+            await writers[i % 2].add_record(stat)
+        for writer in writers:
+            await writer.finalize(summary=False)
+
+    asyncio.run(run())
+    assert merge_shards(tmp_path, max_per_file=0) == 20
+    perf = read_segments(tmp_path, PERF_PREFIX)
+    # Not grouped by shard file: interleaved as the requests arrived
+    assert list(perf["request_id"]) == [f"req-{i:04d}" for i in range(20)]
+
+
+def test_merge_leaves_unfinished_shards_alone(tmp_path, monkeypatch):
+    from app.config import settings
+    monkeypatch.setattr(settings, "JOURNAL", False)
+    asyncio.run(_write_shards(tmp_path, 20, "full"))
+    w2_files = sorted(p.name for p in tmp_path.iterdir() if "_w2" in p.name)
+
+    assert merge_shards(tmp_path, max_per_file=0, shards={"w1"}) == 10
+    perf = read_segments(tmp_path, PERF_PREFIX)
+    assert list(perf["request_id"]) == [f"req-{i:04d}" for i in range(0, 20, 2)]
+    assert [r["序号"] for r in iter_qa_records(tmp_path)] == list(range(1, 11))
+    assert sorted(p.name for p in tmp_path.iterdir() if "_w2" in p.name) == w2_files
+    assert not [p for p in tmp_path.iterdir() if "_w1" in p.name]
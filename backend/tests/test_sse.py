@@ -0,0 +1,41 @@
+import pytest
+
+from app.utils.sse import SSEFramer, sse_event_data
+
+STREAM = (
+    b'data: {"id": 1}\n\n'
+    b": keep-alive\n\n"
+    b'data: {"id": 2}\r\n\r\n'
+    b"event: usage\ndata: a\ndata: b\n\n"
+    b"data: [DONE]\n\n"
+)
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, len(STREAM)])
+def test_framer_is_independent_of_chunk_boundaries(size):
+    framer = SSEFramer()
+    messages = []
+    for start in range(0, len(STREAM), size):
+        messages += framer.feed(STREAM[start:start + size])
+    assert b"".join(messages) == STREAM
+    assert [sse_event_data(m) for m in messages] == [b'{"id": 1}', None, b'{"id": 2}', b"a\nb", b"[DONE]"]
+    assert framer.flush() == b""
+    assert (framer.bytes_in, framer.messages) == (len(STREAM), 5)
+
+
+def test_partial_frame_is_held_until_flush():
+    framer = SSEFramer()
+    assert framer.feed(b'data: {"id": 1}\n\ndata: a\n') == [b'data: {"id": 1}\n\n']
+    assert framer.feed(b"data: b") == []
+    assert framer.feed(b"\r") == []  # a lone \r after \n is not a boundary yet
+    tail = framer.flush()
+    assert tail == b"data: a\ndata: b\r"
+    assert framer.feed(b"data: c\n\n") == [b"data: c\n\n"]
+
+
+def test_event_data_of_unterminated_tail():
+    # Multi-line tails left over by flush() keep every data line
+    assert sse_event_data(b"data: a\ndata: b") == b"a\nb"
+    assert sse_event_data(b"data: a\r\ndata: b\r\n") == b"a\nb"
+    assert sse_event_data(b"data:x") == b"x"
+    assert sse_event_data(b"data: x\r\n\r\n") == b"x"
@@ -0,0 +1,57 @@
+import asyncio
+import json
+
+import pytest
+
+from app.collect.task_manager import CollectionTaskManager
+from app.config import settings
+from app.models.schemas import Task
+
+from .test_shards import _stat
+
+
+@pytest.fixture
+def writer_settings(monkeypatch):
+    monkeypatch.setattr(settings, "JOURNAL", False)
+    monkeypatch.setattr(settings, "WORKERS", 1)
+    monkeypatch.setattr(settings, "FLUSH_INTERVAL", 1)
+    return monkeypatch
+
+
+async def _collect(db, stop_value: int, records: int, timeout: float = 5.0):
+    manager = CollectionTaskManager()
+    started = await manager.start_task("t", "count", stop_value, db, qa_mode="metrics")
+    for i in range(records):
+        await manager.add_record(_stat(i))
+    deadline = asyncio.get_running_loop().time() + timeout
+    while manager.has_active_task() and asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(0.05)
+    if manager._auto_stop_task:
+        await manager._auto_stop_task
+    return manager, started["task_id"]
+
+
+def _task(db, task_id: str) -> Task:
+    db.expire_all()
+    return db.query(Task).filter(Task.id == task_id).first()
+
+
+def test_count_limit_stops_on_full_buffer_without_dropping(db, writer_settings):
+    writer_settings.setattr(settings, "FLUSH_BATCH", 10)
+    manager, task_id = asyncio.run(_collect(db, 25, 40))
+    task = _task(db, task_id)
+    assert not manager.has_active_task()
+    assert task.status == "completed"
+    # Records queued before the stop are written, not discarded
+    assert task.record_count == 40
+    summary = json.loads((settings.DATA_DIR / task.data_dir / "performance_summary.json").read_text())
+    assert summary["total_requests"] == 40
+
+
+def test_count_limit_stops_on_periodic_flush(db, writer_settings):
+    # No buffer ever fills: only the periodic flush moves the count
+    writer_settings.setattr(settings, "FLUSH_BATCH", 1000)
+    manager, task_id = asyncio.run(_collect(db, 5, 5))
+    task = _task(db, task_id)
+    assert not manager.has_active_task()
+    assert (task.status, task.record_count) == ("completed", 5)
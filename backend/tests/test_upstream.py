@@ -0,0 +1,50 @@
+import json
+from collections import Counter
+
+from app.config import settings
+from app.proxy.upstream import UpstreamPool, affinity_key
+
+SYSTEM = {"role": "system", "content": "You are a helpful {assistant} with a \"quoted\" persona."}
+
+
+def _body(*turns: str, **extra) -> bytes:
+    messages = [SYSTEM] + [{"role": "user", "content": t} for t in turns]
+    return json.dumps({"model": "m", "messages": messages, **extra}).encode()
+
+
+def test_affinity_key_is_the_first_message():
+    key = affinity_key(_body("hi"))
+    assert json.loads(key) == SYSTEM
+    # Other user turns, later turns and keys after the array do not change it
+    assert affinity_key(_body("something else", "and more", temperature=0.2)) == key
+    assert affinity_key(json.dumps({"messages": [{"role": "system", "content": "other"}]}).encode()) != key
+
+
+def test_affinity_key_cap_and_missing_messages(monkeypatch):
+    monkeypatch.setattr(settings, "PROXY_AFFINITY_PREFIX_CHARS", 20)
+    assert len(affinity_key(_body("hi"))) == 20
+    assert affinity_key(b'{"messages": []}') is None
+    assert affinity_key(b'{"prompt": "no messages"}') is None
+
+
+def test_same_prefix_sticks_to_one_upstream():
+    pool = UpstreamPool([("10.0.0.1", 8000), ("10.0.0.2", 8000), ("10.0.0.3", 8000)], policy="prefix_affinity")
+    picks = set()
+    for turn in range(10):
+        upstream = pool.acquire(key=affinity_key(_body(f"turn {turn}")))
+        picks.add(upstream.key)
+        pool.release(upstream)
+    assert len(picks) == 1
+
+
+def test_affinity_load_is_bounded(monkeypatch):
+    monkeypatch.setattr(settings, "PROXY_AFFINITY_LOAD_FACTOR", 1.25)
+    pool = UpstreamPool([("10.0.0.1", 8000), ("10.0.0.2", 8000), ("10.0.0.3", 8000)], policy="prefix_affinity")
+    # One hot prefix, all requests in flight at once
+    held = [pool.acquire(key=b"hot prefix") for _ in range(30)]
+    load = Counter(u.key for u in held)
+    assert max(load.values()) <= 13  # ceil(30 * 1.25 / 3)
+    assert len(load) == 3
+    for upstream in held:
+        pool.release(upstream)
+    assert pool.outstanding == 0
@@ -16,6 +16,9 @@ fi
 # Set SSH_ENABLED environment for supervisord
 export SSH_ENABLED="${SSH_ENABLED:-true}"
 
+# uvicorn workers; collection writes one shard per worker and merges on stop
+export AICP_WORKERS="${AICP_WORKERS:-1}"
+
 # Ensure data directory permissions
 chown -R admin:admin /data/results 2>/dev/null || true
 